@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+"""
+Time the Python analysis scripts on synthetic fat-tree and Topology-Zoo-like
+summaries, and compare the timings against a JSON baseline
+"""
+
+from argparse import ArgumentParser
+import json
+import sys
+import time
+
+import check_policies
+import equivalence
+import implied_properties
+import nopticon
+import superpecs
+import synthetic
+
+# Fat-tree sizes (k) of the -sweep scenarios
+SWEEP_FATTREE = list(range(4, 49, 4))
+
+# Flows per summary, by default and in -sweep scenarios, whose summaries
+# have O(nodes^2) edges per flow
+DEFAULT_FLOWS = 16
+SWEEP_FLOWS = 2
+
+# Benchmarks that grow faster than the size of the summary, which are only
+# run on topologies with at most -slow-nodes nodes
+SLOW_BENCHMARKS = frozenset(['equivalence.compute_general_NECs',
+    'implied_properties.mark_implied_properties', 'exp.evaluate'])
+
+def time_call(func, repeat):
+    """Best wall-clock time of func() out of repeat runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def bench_exp_evaluate(summary_json, topo_str, policies):
+    try:
+        import exp
+    except ImportError as e:
+        print('Skipping exp.evaluate: %s' % e, file=sys.stderr)
+        return None
+    summ = implied_properties.EnhancedReachSummary(summary_json, 9)
+    pref_summ = implied_properties.PrefSummary(summary_json, 9)
+    policy_set = nopticon.PolicySet(policies)
+    empty = nopticon.PolicySet()
+    return lambda: exp.evaluate(summ, pref_summ, policy_set, empty, empty,
+            cluster=False, implied=False, threshold=None)
+
+def run_scenario(topo, settings):
+    summary_doc, policies_doc = synthetic.generate(topo, settings.flows,
+            seed=settings.seed)
+    summary_json = json.dumps(summary_doc)
+    policies = nopticon.parse_policies(json.dumps(policies_doc))
+    summary = nopticon.ReachSummary(summary_json)
+    topo_str = topo.topo_str()
+    topo_obj = implied_properties.Topo(topo_str)
+
+    def mark_implied():
+        enhanced = implied_properties.EnhancedReachSummary(summary_json, 2)
+        implied_properties.mark_implied_properties(enhanced, topo_obj, 0.5)
+
+    def check():
+        # A fresh summary, so the rank table is rebuilt every time
+        fresh = nopticon.ReachSummary(summary_json)
+        check_policies.check_reachabilities(policies, fresh)
+
+    benchmarks = [
+        ('reach_summary_load', lambda: nopticon.ReachSummary(summary_json)),
+        ('check_policies', check),
+        ('superpecs.compute_specs', lambda: superpecs.compute_specs(summary)),
+        ('equivalence.compute_general_NECs',
+            lambda: equivalence.compute_general_NECs(0.5, summary)),
+        ('implied_properties.mark_implied_properties', mark_implied),
+        ('exp.evaluate', bench_exp_evaluate(summary_json, topo_str,
+            policies)),
+    ]
+
+    timings = {}
+    for name, func in benchmarks:
+        if func is None or (settings.only and name not in settings.only):
+            continue
+        if name in SLOW_BENCHMARKS and len(topo.nodes) > settings.slow_nodes:
+            continue
+        timings[name] = time_call(func, settings.repeat)
+        print('%-24s %-45s %10.4f s' % (topo.name, name, timings[name]),
+                file=sys.stderr)
+    return {'nodes' : len(topo.nodes),
+            'flows' : len(summary_doc['reach-summary']),
+            'edges' : len(summary.get_flowedges()),
+            'policies' : len(policies),
+            'timings' : timings}
+
+def compare(results, baseline, tolerance):
+    """Return a list of (scenario, benchmark, baseline, current) that are
+    slower than baseline by more than tolerance"""
+    regressions = []
+    for scenario, result in results.items():
+        if scenario not in baseline:
+            continue
+        for name, current in result['timings'].items():
+            previous = baseline[scenario]['timings'].get(name)
+            if previous is not None and current > previous * (1 + tolerance):
+                regressions.append((scenario, name, previous, current))
+    return regressions
+
+def main():
+    # Parse arguments
+    arg_parser = ArgumentParser(description='Benchmark the analysis scripts '
+            + 'on synthetic summaries')
+    arg_parser.add_argument('-fattree', dest='fattree', action='store',
+            type=int, nargs='*', default=None,
+            help='Fat-tree sizes (k) to benchmark (default: 4 8 12)')
+    arg_parser.add_argument('-sweep', dest='sweep', action='store_true',
+            default=False, help='Benchmark fat-trees with k=%d..%d (step %d) '
+            % (SWEEP_FATTREE[0], SWEEP_FATTREE[-1], SWEEP_FATTREE[1]
+                - SWEEP_FATTREE[0]) + 'and %d flows per summary, and no '
+            % (SWEEP_FLOWS) + 'Topology-Zoo-like graphs, unless -fattree, '
+            + '-flows or -zoo are given')
+    arg_parser.add_argument('-zoo', dest='zoo', action='store', type=int,
+            nargs='*', default=None,
+            help='Topology-Zoo-like graph sizes (nodes) to benchmark '
+            + '(default: 25 50 100)')
+    arg_parser.add_argument('-flows', dest='flows', action='store', type=int,
+            default=None, help='Maximum number of flows per summary '
+            + '(default: %d)' % (DEFAULT_FLOWS))
+    arg_parser.add_argument('-slow-nodes', dest='slow_nodes', action='store',
+            type=int, default=200, help='Largest topology (in nodes) to run '
+            + 'the benchmarks that grow faster than the summary on '
+            + '(default: 200)')
+    arg_parser.add_argument('-only', dest='only', action='store', nargs='*',
+            default=None, help='Only run these benchmarks')
+    arg_parser.add_argument('-repeat', dest='repeat', action='store',
+            type=int, default=3, help='Number of timed runs per benchmark')
+    arg_parser.add_argument('-seed', dest='seed', action='store', type=int,
+            default=0, help='Random seed for the generator')
+    arg_parser.add_argument('-save', dest='save_path', action='store',
+            default=None, help='Path to write results to as a JSON baseline')
+    arg_parser.add_argument('-compare', dest='baseline_path', action='store',
+            default=None, help='Path to a JSON baseline to compare against '
+            + '(e.g., bench_analysis_sweep.json, from -sweep -repeat 3)')
+    arg_parser.add_argument('-tolerance', dest='tolerance', action='store',
+            type=float, default=0.25, help='Allowed slowdown relative to '
+            + 'the baseline before reporting a regression (default=0.25)')
+    settings = arg_parser.parse_args()
+    if settings.sweep:
+        defaults = {'fattree' : SWEEP_FATTREE, 'zoo' : [],
+                'flows' : SWEEP_FLOWS}
+    else:
+        defaults = {'fattree' : [4, 8, 12], 'zoo' : [25, 50, 100],
+                'flows' : DEFAULT_FLOWS}
+    for name, default in defaults.items():
+        if getattr(settings, name) is None:
+            setattr(settings, name, default)
+
+    topos = ([synthetic.fattree(k) for k in settings.fattree]
+            + [synthetic.zoo(n, settings.seed) for n in settings.zoo])
+    results = {}
+    for topo in topos:
+        results[topo.name] = run_scenario(topo, settings)
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if settings.save_path is not None:
+        with open(settings.save_path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if settings.baseline_path is not None:
+        with open(settings.baseline_path, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, settings.tolerance)
+        for scenario, name, previous, current in regressions:
+            print('Regression: %s %s %.4f s -> %.4f s' % (scenario, name,
+                previous, current), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
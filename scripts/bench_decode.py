@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+"""
+Measure JSON decode throughput of the available jsonio backends on a BMP
+message stream and on generated reach summaries, with and without projecting
+the summaries onto a few fields
+"""
+
+from argparse import ArgumentParser
+import json
+import jsonio
+import nopticon
+import os
+import synthetic
+import time
+
+DEFAULT_BMP = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        '..', 'test', 'data', 'ft4_gobgp.bmp')
+
+def time_decode(lines, repeat, apply=None):
+    """
+    Best wall-clock time of decoding all lines, and filtering them with
+    apply if given, out of repeat runs
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            value = jsonio.loads(line)
+            if apply is not None:
+                apply(value)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name, lines, repeat, apply=None):
+    nbytes = sum(len(line) for line in lines)
+    for backend in jsonio.BACKENDS:
+        jsonio.use(backend)
+        elapsed = time_decode(lines, repeat, apply)
+        print('%-10s %-8s %10.1f MB/s %12.0f docs/s' % (name, backend,
+            nbytes / elapsed / 1e6, len(lines) / elapsed))
+
+def main():
+    # Parse arguments
+    arg_parser = ArgumentParser(description='Measure JSON decode throughput')
+    arg_parser.add_argument('-bmp', dest='bmp_path', action='store',
+            default=DEFAULT_BMP, help='Path for BMP message stream '
+            + '(default: test/data/ft4_gobgp.bmp)')
+    arg_parser.add_argument('-fattree', dest='fattree', action='store',
+            type=int, default=8, help='Size (k) of the fat-tree for '
+            + 'generated summaries')
+    arg_parser.add_argument('-flows', dest='flows', action='store', type=int,
+            default=32, help='Number of flows in generated summaries')
+    arg_parser.add_argument('-history', dest='history', action='store_true',
+            default=False, help='Include edge histories (as with '
+            + '--verbosity 8)')
+    arg_parser.add_argument('-fields', dest='fields', action='store',
+            nargs='+', default=['reach-summary', 'rank-0'], help='Fields '
+            + 'to keep when timing decoding with a projection, as done by '
+            + 'nopticon.iter_summaries (default: reach-summary rank-0)')
+    arg_parser.add_argument('-repeat', dest='repeat', action='store',
+            type=int, default=5, help='Number of timed runs per decoder')
+    settings = arg_parser.parse_args()
+
+    with open(settings.bmp_path, 'rb') as istream:
+        bmp_lines = [line for line in istream if line.strip()]
+    report('bmp', bmp_lines, settings.repeat)
+
+    summary = synthetic.generate(synthetic.fattree(settings.fattree),
+            settings.flows, history=settings.history)[0]
+    summary_lines = [(json.dumps(summary) + '\n').encode('utf-8')]
+    report('summary', summary_lines, settings.repeat)
+    report('projected', summary_lines, settings.repeat,
+            nopticon.summary_filter(fields=settings.fields))
+
+if __name__ == '__main__':
+    main()
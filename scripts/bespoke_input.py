@@ -1,6 +1,13 @@
 #! /usr/bin/python3
 
+from array import array
+import fileio
+import functools
+import ipaddress
 import json
+from json.encoder import encode_basestring_ascii
+import random
+import synthetic
 import sys
 from argparse import ArgumentParser
 from os import path
@@ -10,10 +17,13 @@ TGT = 3
 IP_PREF = 1
 TIME = 0
 
+# Number of BMP messages to collect before writing them out together
+BATCH_LINES = 4096
+
 class Logical:
 
     def __init__(self, file):
-        file = open(file, 'r')
+        file = fileio.open(file, 'r')
 
         routers = {} # router intfs and IP addresses
         self.links = {} # links between routers
@@ -60,6 +70,7 @@ class Update:
     """
     Internal representation of an individual BGP Update or CSV Update
     """
+    __slots__ = ['is_widthdraw', 'source', 'target', 'ip_prefix', 'timestamp']
 
     def __init__(self, update_str):
         """
@@ -78,43 +89,15 @@ class Update:
         self.ip_prefix = fields[IP_PREF]
         self.timestamp = fields[TIME]
 
-
     def to_BGP_string(self, rDNS):
         """
         Returns a string representing the rule update in GoBGP format
         """
-        print(str(rDNS))
-        if self.is_widthdraw:
-            bgp = {"Header": {"Type" : 0},
-                   "PeerHeader" : {"PeerBGPID" : rDNS[self.source][self.target]["source"],
-                                   "Timestamp" : int(self.timestamp)},
-                   "Body" : {
-                       "BGPUpdate" : {
-                           "Body" : {
-                               "PathAttributes" : [],
-                               "NLRI" : [],
-                               "WithdrawnRoutes" : [{"prefix" : self.ip_prefix}]
-                           }
-                       }
-                   }
-            }
-        else:
-            print(rDNS, str([self.source]), str([self.target]))
-            bgp = {"Header": {"Type" : 0},
-                   "PeerHeader" : {"PeerBGPID" : rDNS[self.source][self.target]["source"],
-                                   "Timestamp" : int(self.timestamp)},
-                   "Body" : {
-                       "BGPUpdate" : {
-                           "Body" : {
-                               "PathAttributes" : [{"type" : 3,
-                                                    "nexthop" : rDNS[self.source][self.target]["target"]}],
-                               "NLRI" : [{"prefix" :  self.ip_prefix }],
-                               "WithdrawnRoutes" : []
-                           }
-                       }
-                   }
-            }
-        return json.dumps(bgp)
+        addresses = rDNS[self.source][self.target]
+        template = _bgp_template(self.is_widthdraw, addresses["source"],
+                addresses["target"])
+        return template % (int(self.timestamp),
+                encode_basestring_ascii(self.ip_prefix))
 
     def source_name(self):
         """
@@ -128,59 +111,496 @@ class Update:
         """
         return self.target
 
-class NetworkScript:
+# Placeholders replaced by format specifiers in message templates
+_TIMESTAMP = "\0timestamp"
+_PREFIX = "\0prefix"
+
+# Separators for compact JSON, as written by GoBMP
+COMPACT = (",", ":")
+
+@functools.lru_cache(maxsize=None)
+def _bgp_template(is_withdraw, source, target, separators=None):
     """
-    A logical representation of the rDNS and all updates
+    GoBGP-format update for a link as a %-format string taking the
+    timestamp and the JSON-encoded prefix, so only those are encoded per
+    update
     """
+    if is_withdraw:
+        bgp = {"Header": {"Type" : 0},
+               "PeerHeader" : {"PeerBGPID" : source,
+                               "Timestamp" : _TIMESTAMP},
+               "Body" : {
+                   "BGPUpdate" : {
+                       "Body" : {
+                           "PathAttributes" : [],
+                           "NLRI" : [],
+                           "WithdrawnRoutes" : [{"prefix" : _PREFIX}]
+                       }
+                   }
+               }
+        }
+    else:
+        bgp = {"Header": {"Type" : 0},
+               "PeerHeader" : {"PeerBGPID" : source,
+                               "Timestamp" : _TIMESTAMP},
+               "Body" : {
+                   "BGPUpdate" : {
+                       "Body" : {
+                           "PathAttributes" : [{"type" : 3,
+                                                "nexthop" : target}],
+                           "NLRI" : [{"prefix" : _PREFIX}],
+                           "WithdrawnRoutes" : []
+                       }
+                   }
+               }
+        }
+    template = json.dumps(bgp, separators=separators).replace("%", "%%")
+    return (template.replace(json.dumps(_TIMESTAMP), "%d")
+            .replace(json.dumps(_PREFIX), "%s"))
 
-    def __init__(self, all_csv_updates, rdns, topo):
-        """
-        PRE::: No more than 256 different nodes in the updates
-        takes a full list of csv updates and returns a parsed Network Script
-        """
-        self.updates = [Update(line) for line in iter(all_csv_updates.splitlines())]
-        links = [(u.source_name(), u.target_name()) for u in self.updates]
-        links += [(t,s) for (s,t) in links]
-        links = set(links)
+class AddressPlan:
+    """
+    Generated rDNS -- assume IP addresses are assigned based on router name.
+    Routers are numbered in the order they are first seen, and router i
+    uses 10.0.i.j on its link to router j, so there can be at most
+    MAX_ROUTERS routers.
+    """
+
+    MAX_ROUTERS = 256
 
-        self.routers = list(set([r for pair in links for r in pair ]))
+    def __init__(self):
+        self._index = {} # router -> number
+        self._ifaces = {} # router -> list of interface addresses
+        self._links = {} # source -> target -> source and target addresses
 
+    def _router_index(self, router):
+        index = self._index.get(router)
+        if index is None:
+            index = len(self._index)
+            if index >= self.MAX_ROUTERS:
+                raise ValueError('Cannot generate addresses for more than '
+                        + '%d routers (at %s); give an rDNS and topo file'
+                        % (self.MAX_ROUTERS, router))
+            self._index[router] = index
+            self._ifaces[router] = []
+            self._links[router] = {}
+        return index
+
+    def add_link(self, source, target):
+        """Assign addresses to both ends of a link, if not yet assigned"""
+        if target in self._links.get(source, ()):
+            return
+        i = self._router_index(source)
+        j = self._router_index(target)
+        ip = "10.0." + str(i) + "." + str(j)
+        revip = "10.0." + str(j) + "." + str(i)
+        self._links[source][target] = {"source": ip, "target": revip}
+        self._links[target][source] = {"source": revip, "target": ip}
+        self._ifaces[source].append(ip)
+        self._ifaces[target].append(revip)
+
+    def get_rDNS_logical(self):
+        return self._links
+
+    def get_rDNS_json(self):
+        return {"routers" : [{"name": r, "ifaces": ifaces}
+            for r, ifaces in self._ifaces.items()]}
+
+class NetworkScript:
+    """
+    Converts a stream of csv updates to BGP updates, using the rDNS and
+    topo files if given and generating addresses otherwise
+    """
+
+    def __init__(self, rdns, topo):
         # topo provided exists, rdns file exists
-        if path.exists(topo) and path.exists(rdns):
-            with open(rdns, 'r') as rndsfile:
+        if topo is not None and path.exists(topo) and path.exists(rdns):
+            with fileio.open(rdns, 'r') as rdnsfile:
                 self.rDNS_json = json.load(rdnsfile)
             self.rDNS_logical = Logical(topo).get_rDNS_logical()
-        ## Generate rDNS -- assume IP addresses are assigned based on router 
-        # name
+            self.plan = None
         else:
-            self.rDNS_json = {"routers" : []}
-            self.rDNS_logical = {}
-            print("routers:", self.routers)
-            for i,r in enumerate(self.routers):
-                ifaces = []
-                for s, t in links:
-                    if r == s:
-                        ip = "10.0." + str(i) + "." + str(self.routers.index(t))
-                        revip = "10.0." + str(self.routers.index(t)) + "." + str(i)
-                        ifaces += [ip]
-                        if not s in self.rDNS_logical:
-                            self.rDNS_logical[s] = {}
-                        self.rDNS_logical[s][t] = {"source": ip, "target": revip}
+            self.plan = AddressPlan()
+            self.rDNS_logical = self.plan.get_rDNS_logical()
 
-                self.rDNS_json["routers"] += [{"name": r, "ifaces": ifaces }]
+    def to_BGP_strings(self, csv_lines):
+        """
+        Yields the BGP string for each csv update as it is read
+        """
+        # (withdraw, source, target) -> message template
+        templates = {}
+        for line in csv_lines:
+            if not line.strip():
+                continue
+            update = Update(line)
+            key = (update.is_widthdraw, update.source, update.target)
+            template = templates.get(key)
+            if template is None:
+                if self.plan is not None:
+                    self.plan.add_link(update.source, update.target)
+                addresses = self.rDNS_logical[update.source][update.target]
+                template = _bgp_template(update.is_widthdraw,
+                        addresses["source"], addresses["target"])
+                templates[key] = template
+            yield template % (int(update.timestamp),
+                    encode_basestring_ascii(update.ip_prefix))
 
-    def to_BGP_string(self):
+    def write_BGP(self, csv_lines, ostream):
         """
-        returns the logical representation as a BGP string
+        Writes the BGP string for each csv update to ostream, one per line
         """
-        return "\n".join([u.to_BGP_string(self.rDNS_logical) for u in self.updates])
+        return write_lines(self.to_BGP_strings(csv_lines), ostream)
 
     def to_rDNS_string(self):
         """
         returns the rDNS record as a json string
         """
+        if self.plan is not None:
+            return json.dumps(self.plan.get_rDNS_json())
         return json.dumps(self.rDNS_json)
 
+def write_lines(lines, ostream):
+    """
+    Writes lines to ostream in batches, adding newlines, and returns the
+    number of lines written
+    """
+    count = 0
+    batch = []
+    for line in lines:
+        batch.append(line + "\n")
+        if len(batch) >= BATCH_LINES:
+            ostream.writelines(batch)
+            count += len(batch)
+            batch.clear()
+    ostream.writelines(batch)
+    return count + len(batch)
+
+# Marks a router without a route to an origin
+_UNREACHABLE = 0xffff
+
+def _prefix(number):
+    """The number-th /24 from 3.0.0.0 (as in synthetic.Topology.prefix)"""
+    return "%s/24" % ipaddress.ip_address((3 << 24) + (number << 8))
+
+class Workload:
+    """
+    Synthetic BMP workload over a topology.  Every router announces a route
+    to each origin's prefixes through one of its shortest-path next hops,
+    chosen at random; links then fail and recover according to a schedule.
+    When a link fails, the routers using it switch to another shortest-path
+    next hop or withdraw, and so do the routers upstream of those that
+    withdraw.  When a link recovers, routers without a route announce one
+    through it again.
+    """
+
+    def __init__(self, nodes, links, origins, prefixes=1, seed=0):
+        """
+        nodes is a list of router names, links a list of (router, router,
+        address, address) and origins the routers that originate prefixes
+        """
+        self._rand = random.Random(seed)
+        self.nodes = nodes
+        self.links = links
+        index = {node : i for i, node in enumerate(nodes)}
+        self._link_index = {} # (router, router) -> link number
+        self._ends = [] # link number -> (node number, node number)
+        self._adjacent = [[] for _ in nodes] # node -> [(neighbor, link)]
+        for l, (source, target, _, _) in enumerate(links):
+            i, j = index[source], index[target]
+            self._ends.append((i, j))
+            self._adjacent[i].append((j, l))
+            self._adjacent[j].append((i, l))
+            self._link_index[(source, target)] = l
+            self._link_index[(target, source)] = l
+        self._down = set() # numbers of failed links
+
+        # A router's BGP ID is the address of its first interface
+        self._router_ids = [self.address(i, adjacent[0][1]) if adjacent
+                else None for i, adjacent in enumerate(self._adjacent)]
+
+        # Origin i originates the /24s numbered i * prefixes onwards
+        self._origins = [index[origin] for origin in origins]
+        self._prefixes = [[encode_basestring_ascii(_prefix(i * prefixes + p))
+            for p in range(prefixes)] for i in range(len(origins))]
+
+        # Per origin: distance of every router from it, and the link to the
+        # chosen next hop (-1 if the router has no route)
+        self._dist = []
+        self._chosen = []
+
+        self._announce = {} # (node, link) -> message template
+        self._withdraw = {} # node -> message template
+
+    @classmethod
+    def from_topology(cls, topo, prefixes=1, seed=0):
+        """Workload over a synthetic.Topology, using its address plan"""
+        links = [(source, target) + topo.link_addresses(l)
+                for l, (source, target) in enumerate(topo.links)]
+        return cls(topo.nodes, links, topo.origins, prefixes, seed)
+
+    @classmethod
+    def from_logical(cls, logical, prefixes=1, seed=0):
+        """Workload over a Logical topo file, with every router an origin"""
+        links = []
+        rDNS = logical.get_rDNS_logical()
+        for r1 in rDNS:
+            for r2, addresses in rDNS[r1].items():
+                if r1 < r2:
+                    links.append((r1, r2, addresses["source"],
+                        addresses["target"]))
+        nodes = list(rDNS)
+        return cls(nodes, links, nodes, prefixes, seed)
+
+    def address(self, node, link):
+        """Address of a router (by number) on one of its links"""
+        source, target, source_ip, target_ip = self.links[link]
+        return source_ip if self._ends[link][0] == node else target_ip
+
+    def get_rDNS_json(self):
+        return {"routers" : [{"name" : node, "ifaces" : [self.address(i, l)
+            for _, l in self._adjacent[i]]}
+            for i, node in enumerate(self.nodes)]}
+
+    def _announce_template(self, node, link):
+        key = (node, link)
+        template = self._announce.get(key)
+        if template is None:
+            i, j = self._ends[link]
+            template = _bgp_template(False, self._router_ids[node],
+                    self.address(j if i == node else i, link), COMPACT)
+            self._announce[key] = template
+        return template
+
+    def _withdraw_template(self, node):
+        template = self._withdraw.get(node)
+        if template is None:
+            template = _bgp_template(True, self._router_ids[node], None,
+                    COMPACT)
+            self._withdraw[node] = template
+        return template
+
+    def _peer_messages(self, link, up, timestamp):
+        """Peer up/down messages from both ends of a link"""
+        for node, peer in (self._ends[link], self._ends[link][::-1]):
+            peer_ip = self.address(peer, link)
+            yield json.dumps({"Header" : {"Type" : 3 if up else 2},
+                "PeerHeader" : {"PeerAddress" : peer_ip,
+                    "PeerBGPID" : self._router_ids[peer],
+                    "Timestamp" : timestamp},
+                "Body" : {"LocalAddress" : self.address(node, link)}},
+                separators=COMPACT)
+
+    def _routes(self, o, timestamp):
+        """Choose every router's route to the o-th origin"""
+        origin = self._origins[o]
+        num_nodes = len(self.nodes)
+        dist = array('H', [_UNREACHABLE]) * num_nodes
+        chosen = array('l', [-1]) * num_nodes
+        ties = [0] * num_nodes
+        rand = self._rand.random
+        dist[origin] = 0
+        frontier = [origin]
+        while frontier:
+            # Breadth-first, picking each router's next hop uniformly from
+            # its shortest-path next hops by reservoir sampling
+            next_frontier = []
+            for node in frontier:
+                d = dist[node] + 1
+                for neighbor, link in self._adjacent[node]:
+                    if dist[neighbor] == _UNREACHABLE:
+                        dist[neighbor] = d
+                        chosen[neighbor] = link
+                        ties[neighbor] = 1
+                        next_frontier.append(neighbor)
+                    elif dist[neighbor] == d:
+                        ties[neighbor] += 1
+                        if rand() * ties[neighbor] < 1:
+                            chosen[neighbor] = link
+            frontier = next_frontier
+        self._dist.append(dist)
+        self._chosen.append(chosen)
+
+        prefixes = self._prefixes[o]
+        for node in range(num_nodes):
+            if chosen[node] >= 0:
+                template = self._announce_template(node, chosen[node])
+                for prefix in prefixes:
+                    yield template % (timestamp, prefix)
+
+    def _has_route(self, o, node):
+        return node == self._origins[o] or self._chosen[o][node] >= 0
+
+    def _repair(self, o, work, timestamp):
+        """Re-route (or withdraw) the routes of routers in work, whose next
+        hop towards the o-th origin was lost"""
+        dist = self._dist[o]
+        chosen = self._chosen[o]
+        prefixes = self._prefixes[o]
+        while work:
+            node = work.pop()
+            d = dist[node] - 1
+            candidates = [link for neighbor, link in self._adjacent[node]
+                    if dist[neighbor] == d and link not in self._down
+                    and self._has_route(o, neighbor)]
+            if candidates:
+                chosen[node] = self._rand.choice(candidates)
+                template = self._announce_template(node, chosen[node])
+            else:
+                chosen[node] = -1
+                template = self._withdraw_template(node)
+                # Routers upstream of node that route through it
+                work.extend(neighbor for neighbor, link
+                        in self._adjacent[node] if chosen[neighbor] == link)
+            for prefix in prefixes:
+                yield template % (timestamp, prefix)
+
+    def _extend(self, o, node, link, timestamp):
+        """Announce the o-th origin's prefixes from a router without a route,
+        through link, and from routers upstream of it without a route"""
+        dist = self._dist[o]
+        chosen = self._chosen[o]
+        prefixes = self._prefixes[o]
+        origin = self._origins[o]
+        work = [(node, link)]
+        while work:
+            node, link = work.pop()
+            if chosen[node] >= 0:
+                continue
+            chosen[node] = link
+            template = self._announce_template(node, link)
+            for prefix in prefixes:
+                yield template % (timestamp, prefix)
+            d = dist[node] + 1
+            for neighbor, link in self._adjacent[node]:
+                if (dist[neighbor] == d and chosen[neighbor] < 0
+                        and neighbor != origin and link not in self._down):
+                    work.append((neighbor, link))
+
+    def _fail(self, link, timestamp):
+        ends = self._ends[link]
+        for o, chosen in enumerate(self._chosen):
+            work = [node for node in ends if chosen[node] == link]
+            if work:
+                yield from self._repair(o, work, timestamp)
+
+    def _recover(self, link, timestamp):
+        i, j = self._ends[link]
+        for o, chosen in enumerate(self._chosen):
+            dist = self._dist[o]
+            for node, neighbor in ((i, j), (j, i)):
+                if (chosen[node] < 0 and node != self._origins[o]
+                        and dist[neighbor] == dist[node] - 1
+                        and self._has_route(o, neighbor)):
+                    yield from self._extend(o, node, link, timestamp)
+
+    def check_schedule(self, schedule):
+        """Raise ValueError if an event of the schedule is for routers that
+        are not linked"""
+        for _, _, source, target in schedule:
+            if (source, target) not in self._link_index:
+                raise ValueError('Schedule has an event for %s--%s, which '
+                        % (source, target) + 'is not a link')
+
+    def messages(self, start, schedule=()):
+        """
+        Yields BMP messages: peer up for every link and the initial routes
+        at time start, then the messages for each (time, up, router,
+        router) event of the schedule, with times relative to start
+        """
+        for link in range(len(self.links)):
+            yield from self._peer_messages(link, True, start)
+        for o in range(len(self._origins)):
+            yield from self._routes(o, start)
+        for time, up, source, target in sorted(schedule,
+                key=lambda event: event[0]):
+            link = self._link_index[(source, target)]
+            if up != (link in self._down):
+                continue
+            timestamp = start + int(time)
+            yield from self._peer_messages(link, up, timestamp)
+            if up:
+                self._down.discard(link)
+                yield from self._recover(link, timestamp)
+            else:
+                self._down.add(link)
+                yield from self._fail(link, timestamp)
+
+    def random_schedule(self, duration, failures=0, downtime=None, flaps=0,
+            flap_count=10, flap_period=10):
+        """
+        Schedule of (time, up, router, router) events within duration
+        seconds: failures links that fail (and recover after downtime
+        seconds, if given) and flaps links that fail and recover flap_count
+        times, every flap_period seconds
+        """
+        rand = random.Random(self._rand.random())
+        chosen = rand.sample(range(len(self.links)),
+                min(failures + flaps, len(self.links)))
+        schedule = []
+        for k, link in enumerate(chosen):
+            source, target = self.links[link][:2]
+            start = rand.randrange(1, max(2, duration))
+            if k < failures:
+                schedule.append((start, False, source, target))
+                if downtime is not None:
+                    schedule.append((start + downtime, True, source, target))
+            else:
+                for f in range(flap_count):
+                    time = start + 2 * f * flap_period
+                    schedule.append((time, False, source, target))
+                    schedule.append((time + flap_period, True, source,
+                        target))
+        return schedule
+
+def read_schedule(file):
+    """
+    Reads a schedule with lines
+        <seconds after start> down|up <router> <router>
+    """
+    schedule = []
+    with fileio.open(file, 'r') as f:
+        for number, line in enumerate(f, 1):
+            ln = line.split()
+            if not ln or ln[0].startswith('#'):
+                continue
+            try:
+                if len(ln) != 4 or ln[1] not in ('down', 'up'):
+                    raise ValueError()
+                schedule.append((float(ln[0]), ln[1] == 'up', ln[2], ln[3]))
+            except ValueError:
+                raise ValueError('%s:%d: expected "<seconds> down|up '
+                        % (file, number) + '<router> <router>"') from None
+    return schedule
+
+def generate(settings):
+    """
+    Writes a synthetic workload to settings.bmp and its rDNS to
+    settings.rdns
+    """
+    if settings.fattree is not None:
+        workload = Workload.from_topology(synthetic.fattree(settings.fattree),
+                settings.prefixes, settings.seed)
+    elif settings.zoo is not None:
+        workload = Workload.from_topology(synthetic.zoo(settings.zoo,
+            settings.seed), settings.prefixes, settings.seed)
+    else:
+        workload = Workload.from_logical(Logical(settings.topo),
+                settings.prefixes, settings.seed)
+
+    if settings.schedule is not None:
+        schedule = read_schedule(settings.schedule)
+    else:
+        schedule = workload.random_schedule(settings.duration,
+                settings.failures, settings.downtime, settings.flaps,
+                settings.flap_count, settings.flap_period)
+    workload.check_schedule(schedule)
+
+    with fileio.open(settings.bmp, 'w') as f:
+        count = write_lines(workload.messages(settings.start, schedule), f)
+    with fileio.open(settings.rdns, 'w') as f:
+        f.write(json.dumps(workload.get_rDNS_json()))
+    print("%d messages for %d routers, %d links" % (count,
+        len(workload.nodes), len(workload.links)), file=sys.stderr)
 
 def main():
     arg_parser = ArgumentParser(description='Accept a stream of BGP messages on standard in')
@@ -190,21 +610,58 @@ def main():
                             required=True, help='File Path to which the script will write the rDNS JSON')
     arg_parser.add_argument('-t', '--topo-file', dest='topo', action='store',
                             help='topo file to convert, use if given rDNS')
+    arg_parser.add_argument('-generate', dest='generate', action='store_true',
+                            help='Generate a synthetic workload over a topology (-fattree, -zoo or -t) '
+                            + 'instead of reading updates from standard in; the rDNS JSON is always written')
+    arg_parser.add_argument('-fattree', dest='fattree', action='store', type=int,
+                            help='Generate over a k-ary fat-tree')
+    arg_parser.add_argument('-zoo', dest='zoo', action='store', type=int,
+                            help='Generate over a Topology-Zoo-like graph with this many nodes')
+    arg_parser.add_argument('-prefixes', dest='prefixes', action='store', type=int, default=1,
+                            help='Number of /24 prefixes per origin (default=1)')
+    arg_parser.add_argument('-schedule', dest='schedule', action='store',
+                            help='File of "<seconds> down|up <router> <router>" link events')
+    arg_parser.add_argument('-duration', dest='duration', action='store', type=int, default=3600,
+                            help='Seconds over which random events are scheduled (default=3600)')
+    arg_parser.add_argument('-failures', dest='failures', action='store', type=int, default=0,
+                            help='Number of random link failures')
+    arg_parser.add_argument('-downtime', dest='downtime', action='store', type=int, default=None,
+                            help='Seconds until a failed link recovers (default: never)')
+    arg_parser.add_argument('-flaps', dest='flaps', action='store', type=int, default=0,
+                            help='Number of random flapping links')
+    arg_parser.add_argument('-flap-count', dest='flap_count', action='store', type=int, default=10,
+                            help='Number of times each flapping link fails (default=10)')
+    arg_parser.add_argument('-flap-period', dest='flap_period', action='store', type=int, default=10,
+                            help='Seconds a flapping link stays down, and then up (default=10)')
+    arg_parser.add_argument('-start', dest='start', action='store', type=int, default=1533679020,
+                            help='Timestamp of the first generated message')
+    arg_parser.add_argument('-seed', dest='seed', action='store', type=int, default=0,
+                            help='Random seed')
 
     settings = arg_parser.parse_args()
-    csv_updates = sys.stdin.read() ## get standard input
-    nws = NetworkScript(csv_updates, settings.rdns, settings.topo) ## compute the script object
-    bmp_msgs = nws.to_BGP_string()
-    rDNS_json = nws.to_rDNS_string()
+    if settings.generate:
+        if (settings.fattree is None and settings.zoo is None
+                and (settings.topo is None or not path.exists(settings.topo))):
+            arg_parser.error('-generate requires -fattree, -zoo or an existing -t topo file')
+        try:
+            generate(settings)
+        except ValueError as error:
+            arg_parser.error(str(error))
+        return
+    nws = NetworkScript(settings.rdns, settings.topo) ## compute the script object
 
-    # Write the bmp_msgs out to settings.bmp
-    with open(settings.bmp, 'w+') as f:
-        f.write(bmp_msgs)
+    # Convert updates from standard input as they arrive, writing the bmp
+    # messages out to settings.bmp
+    with fileio.open(settings.bmp, 'w') as f:
+        try:
+            nws.write_BGP(sys.stdin, f)
+        except ValueError as error:
+            arg_parser.error(str(error))
 
-    # Write the rDNS JSON to settings.rdns
+    # Write the rDNS JSON to settings.rdns, once all routers are known
     if not path.exists(settings.rdns):
-        with open(settings.rdns, 'w+') as f:
-            f.write(rDNS_json)
+        with fileio.open(settings.rdns, 'w') as f:
+            f.write(nws.to_rDNS_string())
 
 if __name__ == "__main__":
     main()
@@ -2,9 +2,15 @@
 Python classes for BMP
 """
 
+import bisect
 from enum import Enum
-import ipaddress
+import fileio
 import json
+import jsonio
+import math
+import nopticon
+import os
+import re
 
 class MessageType(Enum):
     ROUTE_MONITORING = 0
@@ -15,10 +21,18 @@ class MessageType(Enum):
     TERMINATION = 5
     ROUTE_MIRRORING = 6
 
+# MessageType lookups by value without going through Enum.__call__
+_MESSAGE_TYPES = tuple(MessageType)
+
+# Addresses repeat across messages, so each distinct string is parsed once
+# (into an address object and the nopticon.address_key int that rdns
+# lookups use) and every message from the same peer shares them
+parse_address = nopticon.parse_address
+
 def parse_message(msg_json):
-    msg_dict = json.loads(msg_json)
+    msg_dict = jsonio.loads(msg_json)
     header = msg_dict['Header']
-    msg_type = MessageType(header['Type'])
+    msg_type = _MESSAGE_TYPES[header['Type']]
     if msg_type == MessageType.PEER_DOWN:
         return PeerDownMessage(msg_dict)
     elif msg_type == MessageType.PEER_UP:
@@ -27,10 +41,15 @@ def parse_message(msg_json):
         return Message(msg_type, msg_dict)
 
 class Message:
+    __slots__ = ('_type', '_src_id', '_src_key', '_src_as', '_timestamp')
+
     def __init__(self, msg_type, msg_dict):
         self._type = msg_type
         src_id = msg_dict['PeerHeader']['PeerBGPID']
-        self._src_id = (None if src_id == '' else ipaddress.ip_address(src_id))
+        if src_id == '':
+            self._src_id = self._src_key = None
+        else:
+            self._src_id, self._src_key = nopticon.parse_address_key(src_id)
         src_as = 0
         if 'PeerAS' in msg_dict['PeerHeader']:
             src_as = msg_dict['PeerHeader']['PeerAS']
@@ -49,22 +68,408 @@ class Message:
         return self._type == MessageType.PEER_DOWN
 
 class PeerDownMessage(Message):
+    __slots__ = ('_peer', '_peer_key')
+
     def __init__(self, msg_dict):
         assert MessageType(msg_dict['Header']['Type']) == MessageType.PEER_DOWN
         super().__init__(MessageType.PEER_DOWN, msg_dict)
         if 'LocalAddress' in msg_dict['Body']:
-            self._peer = ipaddress.ip_address(msg_dict['Body']['LocalAddress'])
+            self._peer, self._peer_key = nopticon.parse_address_key(
+                    msg_dict['Body']['LocalAddress'])
         else:
             self._peer = None
+            self._peer_key = None
 
     def edge(self):
         return (self._src_id, self._peer)
 
+    def edge_keys(self):
+        """Endpoints of edge() as nopticon.address_key ints"""
+        return (self._src_key, self._peer_key)
+
 class PeerUpMessage(Message):
+    __slots__ = ('_peer', '_peer_key')
+
     def __init__(self, msg_dict):
         assert MessageType(msg_dict['Header']['Type']) == MessageType.PEER_UP
         super().__init__(MessageType.PEER_UP, msg_dict)
-        self._peer = ipaddress.ip_address(msg_dict['Body']['LocalAddress'])
+        self._peer, self._peer_key = nopticon.parse_address_key(
+                msg_dict['Body']['LocalAddress'])
 
     def edge(self):
         return (self._src_id, self._peer)
+
+    def edge_keys(self):
+        """Endpoints of edge() as nopticon.address_key ints"""
+        return (self._src_key, self._peer_key)
+
+# GoBMP writes every message as
+#   {"Header":{...},"PeerHeader":{...},"Body":...}
+# with flat Header and PeerHeader objects, so both can be located without
+# decoding the (possibly large) body
+_HEADER_START = b'{"Header":'
+_PEER_HEADER_START = b',"PeerHeader":'
+_BODY_START = b',"Body":'
+_TYPE_RE = re.compile(rb'"Type":(\d+)')
+_TIMESTAMP_RE = re.compile(rb'"Timestamp":(-?[0-9.eE+-]+)')
+
+def _number(token):
+    return int(token) if token.isdigit() else float(token)
+
+def _prefixes(routes):
+    return [route['prefix'] for route in (routes or ())
+            if isinstance(route, dict) and 'prefix' in route]
+
+def update_prefixes(body):
+    """Announced and withdrawn prefixes in a route monitoring body"""
+    update = (body or {}).get('BGPUpdate') or {}
+    update_body = update.get('Body') or {}
+    return (_prefixes(update_body.get('NLRI')),
+            _prefixes(update_body.get('WithdrawnRoutes')))
+
+def shift_timestamp(line, delta):
+    """A message line with its (non-zero) peer header timestamp moved by
+    delta seconds"""
+    match = _TIMESTAMP_RE.search(line)
+    if match is None or delta == 0:
+        return line
+    timestamp = _number(match.group(1))
+    if timestamp == 0:
+        return line
+    return (line[:match.start(1)] + repr(timestamp + delta).encode('ascii')
+            + line[match.end(1):])
+
+def line_type(line):
+    """MessageType of one line of a GoBMP JSON stream, read from the header
+    without decoding the message when possible"""
+    if line.startswith(_HEADER_START):
+        match = _TYPE_RE.search(line, 0, line.find(b'}'))
+        if match is not None:
+            return _MESSAGE_TYPES[int(match.group(1))]
+    return RawMessage(line).type()
+
+class RawMessage:
+    """
+    A BMP message from one line of a GoBMP JSON stream.  The message type is
+    read from the header; the peer header and body are decoded only when
+    they are first used.
+    """
+    __slots__ = ('_line', '_type', '_peer_span', '_body_span',
+            '_peer_header', '_body', '_timestamp')
+
+    def __init__(self, line):
+        self._line = line
+        self._peer_header = None
+        self._body = None
+        self._timestamp = None
+        if not self._split(line):
+            # Not in the expected layout; decode the whole message
+            msg_dict = jsonio.loads(line)
+            self._type = _MESSAGE_TYPES[msg_dict['Header']['Type']]
+            self._peer_header = msg_dict['PeerHeader']
+            self._body = msg_dict.get('Body')
+            self._peer_span = self._body_span = None
+
+    def _split(self, line):
+        if not line.startswith(_HEADER_START):
+            return False
+        header_end = line.find(b'}', len(_HEADER_START))
+        if header_end < 0:
+            return False
+        match = _TYPE_RE.search(line, 0, header_end)
+        if match is None:
+            return False
+        peer_start = header_end + 1 + len(_PEER_HEADER_START)
+        if not line.startswith(_PEER_HEADER_START, header_end + 1):
+            return False
+        peer_end = line.find(b'}', peer_start) + 1
+        if peer_end == 0 or not line.startswith(_BODY_START, peer_end):
+            return False
+        body_end = line.rfind(b'}')
+        self._type = _MESSAGE_TYPES[int(match.group(1))]
+        self._peer_span = (peer_start, peer_end)
+        self._body_span = (peer_end + len(_BODY_START), body_end)
+        return True
+
+    def line(self):
+        """The message exactly as read, including its newline"""
+        return self._line
+
+    def type(self):
+        return self._type
+
+    def isPeerUp(self):
+        return self._type == MessageType.PEER_UP
+
+    def isPeerDown(self):
+        return self._type == MessageType.PEER_DOWN
+
+    def timestamp(self):
+        if self._timestamp is None:
+            if self._peer_header is None:
+                lo, hi = self._peer_span
+                match = _TIMESTAMP_RE.search(self._line, lo, hi)
+                if match is not None:
+                    self._timestamp = _number(match.group(1))
+                    return self._timestamp
+            self._timestamp = self.peer_header()['Timestamp']
+        return self._timestamp
+
+    def peer_header(self):
+        if self._peer_header is None:
+            lo, hi = self._peer_span
+            self._peer_header = jsonio.loads(self._line[lo:hi])
+        return self._peer_header
+
+    def body(self):
+        if self._body is None and self._body_span is not None:
+            lo, hi = self._body_span
+            self._body = jsonio.loads(self._line[lo:hi])
+        return self._body
+
+    def message(self):
+        """Fully decoded Message (or PeerUpMessage/PeerDownMessage)"""
+        msg_dict = {'Header' : {'Type' : self._type.value},
+                'PeerHeader' : self.peer_header()}
+        if self._type == MessageType.PEER_DOWN:
+            msg_dict['Body'] = self.body()
+            return PeerDownMessage(msg_dict)
+        elif self._type == MessageType.PEER_UP:
+            msg_dict['Body'] = self.body()
+            return PeerUpMessage(msg_dict)
+        else:
+            return Message(self._type, msg_dict)
+
+def source_info(path):
+    """Size and modification time of a file, to detect stale sidecars"""
+    stat = os.stat(path)
+    return {'source-size' : stat.st_size, 'source-mtime' : stat.st_mtime_ns}
+
+class SeekIndex:
+    """
+    Sidecar index (stored at <path>.idx) from timestamp buckets to the byte
+    offsets of the first and the end of the last message in each bucket, so
+    readers can seek to the part of a GoBMP JSON stream holding a time
+    range.  Works with out-of-order timestamps.  Messages without a
+    timestamp (e.g., Initiation and Termination) are kept out of the
+    buckets; their offsets are listed separately.
+    """
+    BUCKET = 60
+    _VERSION = 2
+
+    def __init__(self, index_dict):
+        if index_dict['version'] != self._VERSION:
+            raise ValueError('Unsupported seek index version %d'
+                    % index_dict['version'])
+        self._dict = index_dict
+        self._bucket = index_dict['bucket']
+        self._buckets = index_dict['buckets']
+        self._untimed = index_dict['untimed-offsets']
+        # Earliest first offset of this or any later bucket
+        self._suffix_first = list(index_dict['first-offsets'])
+        for i in range(len(self._suffix_first) - 2, -1, -1):
+            self._suffix_first[i] = min(self._suffix_first[i],
+                    self._suffix_first[i + 1])
+        # Latest end offset of this or any earlier bucket
+        self._prefix_end = list(index_dict['end-offsets'])
+        for i in range(1, len(self._prefix_end)):
+            self._prefix_end[i] = max(self._prefix_end[i],
+                    self._prefix_end[i - 1])
+
+    @staticmethod
+    def default_path(path):
+        return path + '.idx'
+
+    @classmethod
+    def build(cls, path, bucket=None):
+        """Index an uncompressed GoBMP JSON stream in one pass"""
+        bucket = bucket or cls.BUCKET
+        ranges = {}
+        untimed = []
+        offset = 0
+        with fileio.open(path, 'rb', compression=None) as istream:
+            for line in istream:
+                line_offset = offset
+                offset += len(line)
+                if not line or line.isspace():
+                    continue
+                timestamp = RawMessage(line).timestamp()
+                if timestamp == 0:
+                    untimed.append(line_offset)
+                    continue
+                key = int(timestamp // bucket)
+                if key in ranges:
+                    ranges[key][1] = offset
+                else:
+                    ranges[key] = [line_offset, offset]
+        buckets = sorted(ranges)
+        index_dict = {'version' : cls._VERSION, 'bucket' : bucket,
+                'buckets' : buckets,
+                'first-offsets' : [ranges[key][0] for key in buckets],
+                'end-offsets' : [ranges[key][1] for key in buckets],
+                'untimed-offsets' : untimed}
+        index_dict.update(source_info(path))
+        return cls(index_dict)
+
+    @classmethod
+    def load(cls, index_path):
+        with open(index_path, 'r') as f:
+            return cls(jsonio.loads(f.read()))
+
+    def save(self, index_path):
+        tmp_path = '%s.%d.tmp' % (index_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self._dict, f)
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def open_for(cls, path, bucket=None):
+        """Load the index for path, (re)building and saving it if it is
+        missing, stale or uses a different bucket size"""
+        index_path = cls.default_path(path)
+        try:
+            index = cls.load(index_path)
+            if (all(index._dict.get(key) == value for key, value
+                    in source_info(path).items())
+                    and bucket in (None, index._bucket)):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        index = cls.build(path, bucket)
+        try:
+            index.save(index_path)
+        except OSError:
+            pass
+        return index
+
+    def offsets(self, start_time=None, end_time=None):
+        """(start, end) byte range containing every message with
+        start_time <= timestamp < end_time; end is None for end of file"""
+        start = 0
+        if start_time is not None:
+            i = bisect.bisect_left(self._buckets,
+                    math.floor(start_time / self._bucket))
+            if i == len(self._buckets):
+                return (0, 0)
+            start = self._suffix_first[i]
+        end = None
+        if end_time is not None:
+            j = bisect.bisect_right(self._buckets,
+                    math.floor(end_time / self._bucket))
+            if j == 0:
+                return (0, 0)
+            end = max(start, self._prefix_end[j - 1])
+        return (start, end)
+
+    def untimed_offsets(self, start=0, end=None):
+        """Offsets of the messages without a timestamp that are outside the
+        byte range start to end, as (before, after) lists"""
+        before = self._untimed[:bisect.bisect_left(self._untimed, start)]
+        after = []
+        if end is not None:
+            after = self._untimed[bisect.bisect_left(self._untimed, end):]
+        return (before, after)
+
+def split_ranges(path, num_ranges, start=0, end=None):
+    """
+    Split the file at path (or the byte range start to end of it) into at
+    most num_ranges (start, end) byte ranges of roughly equal size, each
+    starting at the beginning of a line.  A compressed file cannot be
+    split, so it is a single (0, None) range.
+    """
+    if fileio.detect(path) is not None:
+        return [(0, None)]
+    size = os.path.getsize(path) if end is None else end
+    starts = [start]
+    with open(path, 'rb') as istream:
+        for i in range(1, num_ranges):
+            istream.seek(max(start + (size - start) * i // num_ranges - 1,
+                starts[-1]))
+            istream.readline()
+            offset = istream.tell()
+            if offset >= size:
+                break
+            if offset > starts[-1]:
+                starts.append(offset)
+    return list(zip(starts, starts[1:] + [size]))
+
+def time_offsets(path, start_time=None, end_time=None):
+    """
+    Byte range of the GoBMP JSON stream at path that holds all messages
+    with start_time <= timestamp < end_time, from its SeekIndex; a
+    compressed stream cannot be seeked, so its range is the whole stream
+    """
+    if ((start_time is None and end_time is None)
+            or fileio.detect(path) is not None):
+        return (0, None)
+    return SeekIndex.open_for(path).offsets(start_time, end_time)
+
+def iter_lines(path, start=0, end=None, start_time=None, end_time=None):
+    """
+    Iterate over the non-blank lines of a GoBMP JSON stream as bytes.
+      - start, end: byte range to read; start must be the beginning of a
+        line, and the line containing end - 1 is the last one read
+      - start_time, end_time: only yield messages with start_time <=
+        timestamp < end_time, and those without a timestamp (e.g.,
+        Initiation); unless a byte range is given, the stream is seeked to
+        the time range with its SeekIndex, and the messages without a
+        timestamp outside that range are still yielded in stream order
+    Compressed streams are decompressed on the fly, but can only be read
+    from the start.
+    """
+    timed = start_time is not None or end_time is not None
+    before = after = ()
+    if (timed and start == 0 and end is None
+            and fileio.detect(path) is None):
+        index = SeekIndex.open_for(path)
+        start, end = index.offsets(start_time, end_time)
+        before, after = index.untimed_offsets(start, end)
+    with fileio.open(path, 'rb') as istream:
+        for offset in before:
+            istream.seek(offset)
+            yield istream.readline()
+        if start > 0 or before:
+            istream.seek(start)
+        offset = start
+        for line in istream:
+            if end is not None:
+                if offset >= end:
+                    break
+                offset += len(line)
+            if not line or line.isspace():
+                continue
+            if timed:
+                timestamp = RawMessage(line).timestamp()
+                if timestamp != 0 and ((start_time is not None
+                        and timestamp < start_time)
+                        or (end_time is not None and timestamp >= end_time)):
+                    continue
+            yield line
+        for offset in after:
+            istream.seek(offset)
+            yield istream.readline()
+
+def iter_messages(path, types=None, fields=None, start=0, end=None,
+        start_time=None, end_time=None):
+    """
+    Iterate over the messages in a GoBMP JSON stream as RawMessages.
+      - types: MessageTypes to yield; other messages are skipped after
+        reading only their header
+      - fields: parts to decode eagerly ('PeerHeader', 'Body'); everything
+        else is decoded on demand
+      - start, end, start_time, end_time: as for iter_lines
+    """
+    type_values = None
+    if types is not None:
+        type_values = set(msg_type.value for msg_type in types)
+    fields = set(fields or ())
+    for line in iter_lines(path, start, end, start_time, end_time):
+        if (type_values is not None
+                and line_type(line).value not in type_values):
+            continue
+        raw = RawMessage(line)
+        if 'PeerHeader' in fields:
+            raw.peer_header()
+        if 'Body' in fields:
+            raw.body()
+        yield raw
@@ -4,10 +4,293 @@
 Get various statistics for a BMP message stream
 """
 
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
 import bmp 
+import bmp_store
+import fileio
 import math
+import multiprocessing
 import nopticon
+import numpy as np
+import sketches
+
+class Churn:
+    """
+    Route monitoring statistics computed in one pass with fixed memory:
+    per-peer update counts, updates per time bucket, approximate distinct
+    prefixes and approximate top-K churning prefixes
+    """
+    def __init__(self, settings):
+        self._peer_rates = settings.peerrates
+        self._bucket = settings.ratehist
+        self._prefixes = settings.prefixes
+        # Peer BGP ID -> [updates, first timestamp, last timestamp]
+        self.peers = {}
+        # Time bucket -> updates
+        self.buckets = {}
+        self.distinct = (sketches.HyperLogLog() if settings.prefixes
+                else None)
+        self.top = (sketches.TopK(settings.topk) if settings.topk
+                else None)
+
+    def needs_body(self):
+        return self.distinct is not None or self.top is not None
+
+    def add(self, raw_msg):
+        """Account for a route monitoring message"""
+        timestamp = raw_msg.timestamp()
+        if self._peer_rates:
+            peer = raw_msg.peer_header()['PeerBGPID']
+            counts = self.peers.get(peer)
+            if counts is None:
+                self.peers[peer] = [1, timestamp, timestamp]
+            else:
+                counts[0] += 1
+                counts[1] = min(counts[1], timestamp)
+                counts[2] = max(counts[2], timestamp)
+        if self._bucket and timestamp != 0:
+            key = int(timestamp // self._bucket)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+        if self.needs_body():
+            announced, withdrawn = bmp.update_prefixes(raw_msg.body())
+            for prefix in announced + withdrawn:
+                h = sketches.hash64(prefix)
+                if self.distinct is not None:
+                    self.distinct.add_hash(h)
+                if self.top is not None:
+                    self.top.add_hash(prefix, h)
+
+    def merge(self, other):
+        for peer, (count, first, last) in other.peers.items():
+            counts = self.peers.get(peer)
+            if counts is None:
+                self.peers[peer] = [count, first, last]
+            else:
+                counts[0] += count
+                counts[1] = min(counts[1], first)
+                counts[2] = max(counts[2], last)
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        if self.distinct is not None:
+            self.distinct.merge(other.distinct)
+        if self.top is not None:
+            self.top.merge(other.top)
+
+    def report(self, rdns, emit):
+        if self._peer_rates:
+            for peer, (count, first, last) in sorted(self.peers.items(),
+                    key=lambda item: (-item[1][0], item[0])):
+                name = rdns.get(peer, '') if peer else ''
+                span = max(last - first, 1)
+                emit('Peer %s%s: %d updates over %f seconds (%f/s)' % (
+                    peer or '-', ' (%s)' % name if name else '', count,
+                    last - first, count / span))
+        if self._bucket:
+            # Buckets without updates have a rate of 0
+            counts = list(self.buckets.values())
+            if counts:
+                counts += [0] * (max(self.buckets) - min(self.buckets) + 1
+                        - len(counts))
+            histogram = {}
+            for count in counts:
+                low = 0 if count == 0 else 1 << (count.bit_length() - 1)
+                histogram[low] = histogram.get(low, 0) + 1
+            emit('Update rate histogram (updates per %g seconds: buckets):'
+                    % self._bucket)
+            for low in sorted(histogram):
+                high = max(low, 2 * low - 1)
+                emit('  %d-%d: %d' % (low, high, histogram[low]))
+        if self.distinct is not None:
+            emit('Distinct prefixes (approx): %d' % self.distinct.count())
+        if self.top is not None:
+            emit('Top churning prefixes (approx updates):')
+            for prefix, count in self.top.items():
+                emit('  %s: %d' % (prefix, count))
+
+def _churn_requested(settings):
+    return (settings.peerrates or bool(settings.ratehist)
+            or settings.prefixes or bool(settings.topk))
+
+class Stats:
+    """Statistics for (part of) a BMP message stream"""
+    def __init__(self, last_timestamp=0, churn=None):
+        self.first_timestamp = 0
+        self.last_timestamp = last_timestamp
+        self.peer_up = 0
+        self.peer_down = 0
+        self.churn = churn
+
+    def merge(self, other):
+        """Add the statistics for the part of the stream following this
+        part"""
+        if self.first_timestamp == 0:
+            self.first_timestamp = other.first_timestamp
+        if other.last_timestamp > self.last_timestamp:
+            self.last_timestamp = other.last_timestamp
+        self.peer_up += other.peer_up
+        self.peer_down += other.peer_down
+        if self.churn is None:
+            self.churn = other.churn
+        elif other.churn is not None:
+            self.churn.merge(other.churn)
+
+def process(settings, rdns, emit, start=0, end=None, last_timestamp=0):
+    """
+    Compute statistics for the messages in a byte range of the input,
+    passing verbose output lines to emit.  last_timestamp is the latest
+    timestamp before the range, used to detect reordering.
+    """
+    churn = Churn(settings) if _churn_requested(settings) else None
+    stats = Stats(last_timestamp, churn)
+
+    # Only peer up/down (and route monitoring) messages matter when
+    # durations are not needed
+    types = None
+    if not settings.duration:
+        types = [bmp.MessageType.PEER_UP, bmp.MessageType.PEER_DOWN]
+        if churn is not None:
+            types.append(bmp.MessageType.ROUTE_MONITORING)
+
+    # Process input stream; bodies are only decoded for verbose peer events
+    for raw_msg in bmp.iter_messages(settings.input_path, types=types,
+            start=start, end=end, start_time=settings.start_time,
+            end_time=settings.end_time):
+        # Get first and last timestamps, if required
+        if settings.duration:
+            timestamp = raw_msg.timestamp()
+        if settings.duration and timestamp != 0:
+            # Update first timestamp
+            if stats.first_timestamp == 0:
+                stats.first_timestamp = timestamp
+            # Check for reordering beyond 1 millisecond
+            if (settings.verbose and
+                round(timestamp,3) < round(stats.last_timestamp,3)):
+                emit('Warning: message with timestamp %f after message with timestamp %f' % (timestamp, stats.last_timestamp))
+            # Update last timestamp
+            if (timestamp > stats.last_timestamp):
+                stats.last_timestamp = timestamp
+
+        # Count peer events, if requested
+        if settings.peerevents:
+            action = None
+            if (raw_msg.isPeerUp()):
+                stats.peer_up += 1
+                action = 'Up'
+            if (raw_msg.isPeerDown()):
+                stats.peer_down += 1
+                action = 'Down'
+            if settings.verbose and action is not None:
+                bmp_msg = raw_msg.message()
+                assert bmp_msg._src_key in rdns, "%s not in rdns" % bmp_msg._src_id
+                assert bmp_msg._peer_key in rdns, "%s not in rdns" % bmp_msg._peer
+                emit('%s: %s--%s %f' % (action, rdns[bmp_msg._src_key], rdns[bmp_msg._peer_key], bmp_msg._timestamp))
+
+        # Update churn statistics, if requested
+        if (churn is not None
+                and raw_msg.type() == bmp.MessageType.ROUTE_MONITORING):
+            churn.add(raw_msg)
+
+    return stats
+
+# Per-worker state for parallel processing
+_worker_rdns = None
+
+def _init_worker(rdns):
+    global _worker_rdns
+    _worker_rdns = rdns
+
+def _process_range(args):
+    settings, start, end, last_timestamp = args
+    lines = []
+    stats = process(settings, _worker_rdns, lines.append, start, end,
+            last_timestamp)
+    return stats, lines
+
+def process_parallel(settings, rdns, emit):
+    """
+    Compute statistics by processing newline-aligned byte ranges of the
+    input in a pool of settings.jobs processes.  Produces the same
+    statistics and verbose output as process().
+    """
+    ranges = bmp.split_ranges(settings.input_path, settings.jobs,
+            *bmp.time_offsets(settings.input_path, settings.start_time,
+                settings.end_time))
+    with multiprocessing.Pool(settings.jobs, _init_worker, (rdns,)) as pool:
+        # Reordering warnings depend on the latest timestamp in all earlier
+        # ranges, so these are computed in a first, non-verbose pass
+        preceding = [0] * len(ranges)
+        if settings.verbose and settings.duration:
+            quiet = Namespace(**vars(settings))
+            quiet.verbose = False
+            quiet.peerevents = False
+            quiet.peerrates = quiet.prefixes = False
+            quiet.ratehist = quiet.topk = None
+            results = pool.map(_process_range,
+                    [(quiet, start, end, 0) for start, end in ranges])
+            for i in range(1, len(ranges)):
+                preceding[i] = max(preceding[i-1],
+                        results[i-1][0].last_timestamp)
+
+        total = Stats()
+        for stats, lines in pool.imap(_process_range,
+                [(settings, start, end, last_timestamp) for (start, end),
+                last_timestamp in zip(ranges, preceding)]):
+            for line in lines:
+                emit(line)
+            total.merge(stats)
+    return total
+
+def process_store(settings, rdns, emit):
+    """
+    Compute statistics from the columnar store for the input (see
+    bmp_store), building the store if needed.  Produces the same statistics
+    and verbose output as process().
+    """
+    store = bmp_store.BmpStore.open_for(settings.input_path)
+    stats = Stats()
+    selected = store.time_range(settings.start_time, settings.end_time)
+    timestamps = store.get_timestamps()[selected]
+    types = store.get_types()[selected]
+    # (message index, line) of verbose output
+    output = []
+
+    if settings.duration:
+        nonzero = np.flatnonzero(timestamps != 0)
+        values = timestamps[nonzero]
+        if len(values) > 0:
+            stats.first_timestamp = values[0].item()
+            stats.last_timestamp = max(0, values.max().item())
+        if settings.verbose:
+            # Latest timestamp before each message
+            latest = np.maximum.accumulate(np.concatenate(([0.0], values)))
+            # Reordering beyond 1 millisecond (after rounding) implies the
+            # timestamp is less than latest + 0.001
+            for i in np.flatnonzero(values < latest[:-1] + 0.001):
+                timestamp = values[i].item()
+                last_timestamp = latest[i].item()
+                if round(timestamp,3) < round(last_timestamp,3):
+                    output.append((selected[nonzero[i]], 'Warning: message with timestamp %f after message with timestamp %f' % (timestamp, last_timestamp)))
+
+    if settings.peerevents:
+        peer_msgs = np.flatnonzero((types == bmp.MessageType.PEER_UP.value)
+                | (types == bmp.MessageType.PEER_DOWN.value))
+        stats.peer_up = int(np.count_nonzero(types[peer_msgs]
+            == bmp.MessageType.PEER_UP.value))
+        stats.peer_down = len(peer_msgs) - stats.peer_up
+        if settings.verbose:
+            peer_msgs = selected[peer_msgs]
+            for i, raw_msg in zip(peer_msgs, store.iter_messages(peer_msgs)):
+                action = 'Up' if raw_msg.isPeerUp() else 'Down'
+                bmp_msg = raw_msg.message()
+                assert bmp_msg._src_key in rdns, "%s not in rdns" % bmp_msg._src_id
+                assert bmp_msg._peer_key in rdns, "%s not in rdns" % bmp_msg._peer
+                output.append((i, '%s: %s--%s %f' % (action, rdns[bmp_msg._src_key], rdns[bmp_msg._peer_key], bmp_msg._timestamp)))
+
+    # Stable, so a warning stays ahead of the peer event for the same message
+    output.sort(key=lambda item: item[0])
+    for _, line in output:
+        emit(line)
+    return stats
 
 def main():
     # Parse arguments
@@ -24,58 +307,57 @@ def main():
     arg_parser.add_argument('-peerevents', dest='peerevents', 
             action='store_true', default=False, help='Get the number of peer '
             + 'up/down events')
+    arg_parser.add_argument('-jobs', dest='jobs', action='store', type=int,
+            default=1, help='Number of processes to split the input '
+            + 'across (default=1)')
+    arg_parser.add_argument('-store', dest='store', action='store_true',
+            default=False, help='Use the columnar store for the input '
+            + '(INPUT.store, built if missing or stale; see bmp_store.py)')
+    arg_parser.add_argument('-peerrates', dest='peerrates',
+            action='store_true', default=False, help='Get the number and '
+            + 'rate of route monitoring updates from each peer')
+    arg_parser.add_argument('-ratehist', dest='ratehist', action='store',
+            type=float, nargs='?', const=1.0, default=None,
+            help='Get a histogram of the number of updates per RATEHIST '
+            + 'seconds (default=1)')
+    arg_parser.add_argument('-prefixes', dest='prefixes',
+            action='store_true', default=False, help='Get the approximate '
+            + 'number of distinct announced or withdrawn prefixes')
+    arg_parser.add_argument('-topk', dest='topk', action='store', type=int,
+            default=None, help='Get the TOPK prefixes with the most '
+            + '(approximate) announcements and withdrawals')
+    arg_parser.add_argument('-from', dest='start_time', action='store',
+            type=float, default=None, help='Only consider messages at or '
+            + 'after this timestamp')
+    arg_parser.add_argument('-to', dest='end_time', action='store',
+            type=float, default=None, help='Only consider messages before '
+            + 'this timestamp')
     settings = arg_parser.parse_args()
+    if settings.store and _churn_requested(settings):
+        arg_parser.error('-peerrates, -ratehist, -prefixes and -topk scan '
+                + 'the input and cannot be used with -store')
 
     # Load rdns
     rdns = {}
     if settings.rdns_path is not None:
-        with open(settings.rdns_path, 'r') as rdnsfile:
+        with fileio.open(settings.rdns_path, 'r') as rdnsfile:
             rdns = nopticon.parse_rdns(rdnsfile.read())
 
-    # Declare statistics variables
-    first_timestamp = 0
-    last_timestamp = 0
-    peer_up = 0
-    peer_down = 0
-
-    # Process input stream
-    with open(settings.input_path, 'r') as istream:
-        for bmp_json in istream:
-            bmp_msg = bmp.parse_message(bmp_json.strip())
-
-            # Get first and last timestamps, if required
-            if settings.duration and bmp_msg._timestamp != 0:
-                # Update first timestamp
-                if first_timestamp == 0:
-                    first_timestamp = bmp_msg._timestamp
-                # Check for reordering beyond 1 millisecond
-                if (settings.verbose and
-                    round(bmp_msg._timestamp,3) < round(last_timestamp,3)):
-                    print('Warning: message with timestamp %f after message with timestamp %f' % (bmp_msg._timestamp, last_timestamp))
-                # Update last timestamp
-                if (bmp_msg._timestamp > last_timestamp):
-                    last_timestamp = bmp_msg._timestamp
-            
-            # Count peer events, if requested
-            if settings.peerevents:
-                action = None
-                if (bmp_msg.isPeerUp()):
-                    peer_up += 1
-                    action = 'Up'
-                if (bmp_msg.isPeerDown()):
-                    peer_down += 1
-                    action = 'Down'
-                if settings.verbose and action is not None:
-                    assert bmp_msg._src_id in rdns, "%s not in rdns" % bmp_msg._src_id
-                    assert bmp_msg._peer in rdns, "%s not in rdns" % bmp_msg._peer
-                    print('%s: %s--%s %f' % (action, rdns[bmp_msg._src_id], rdns[bmp_msg._peer], bmp_msg._timestamp))
+    if settings.store:
+        stats = process_store(settings, rdns, print)
+    elif settings.jobs > 1:
+        stats = process_parallel(settings, rdns, print)
+    else:
+        stats = process(settings, rdns, print)
 
     if settings.duration:
-        duration = last_timestamp - first_timestamp
+        duration = stats.last_timestamp - stats.first_timestamp
         print('Duration: %f seconds' % (duration))
     if settings.peerevents:
-        print('Peer Up events: %d' % (peer_up))
-        print('Peer Down events: %d' % (peer_down))
+        print('Peer Up events: %d' % (stats.peer_up))
+        print('Peer Down events: %d' % (stats.peer_down))
+    if stats.churn is not None:
+        stats.churn.report(rdns, print)
 
 if __name__ == '__main__':
     main()
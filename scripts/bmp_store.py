@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+
+"""
+Columnar, memory-mapped store of a BMP message stream, for time-range and
+per-peer queries without re-parsing the JSON
+"""
+
+from argparse import ArgumentParser
+from array import array
+import bmp
+import fileio
+import ipaddress
+import json
+import numpy as np
+import os
+import shutil
+
+_STORE_VERSION = 2
+
+# Per-message columns and their dtypes
+_COLUMNS = {
+    'timestamp' : 'f8',
+    'type' : 'u1',
+    'peer-id' : 'u4',
+    'peer-as' : 'u4',
+    'offset' : 'i8',
+    'length' : 'i4',
+}
+_ARRAY_CODES = {'f8' : 'd', 'u1' : 'B', 'u4' : 'L', 'i8' : 'q', 'i4' : 'l'}
+
+def default_path(input_path):
+    return input_path + '.store'
+
+class BmpStore:
+    """
+    Columns for the messages in a BMP message stream, in file order:
+      - timestamp, type (MessageType value), peer-id (PeerBGPID as an int,
+        0 if none), peer-as, and offset/length of the raw line
+      - announced and withdrawn prefixes (CSR: per-message offsets into a
+        list of prefix ids)
+    plus the permutation that sorts the messages by timestamp, the sorted
+    timestamps, and the prefixes by id (as offsets into the concatenated
+    UTF-8 prefix strings).  Columns are .npy files in a directory, and are
+    memory-mapped when opened.  The source stream is recorded relative to
+    the store, so the two can be moved together.
+    """
+    def __init__(self, store_path):
+        self._path = store_path
+        with open(os.path.join(store_path, 'meta.json'), 'r') as mf:
+            self._meta = json.load(mf)
+        if self._meta['version'] != _STORE_VERSION:
+            raise ValueError('Unsupported store version %d'
+                    % self._meta['version'])
+        self._columns = {}
+        for name in (list(_COLUMNS) + ['order', 'sorted-timestamp',
+                'announced-offsets', 'announced', 'withdrawn-offsets',
+                'withdrawn', 'prefix-offsets', 'prefix-names']):
+            self._columns[name] = np.load(os.path.join(store_path,
+                name + '.npy'), mmap_mode='r')
+        self._source = os.path.join(os.path.dirname(
+            os.path.abspath(store_path)), self._meta['source'])
+        self._prefixes = None
+
+    @classmethod
+    def build(cls, input_path, store_path=None):
+        """Convert a GoBMP JSON stream to a store (default: input_path +
+        '.store')"""
+        if store_path is None:
+            store_path = default_path(input_path)
+        columns = {name : array(_ARRAY_CODES[dtype])
+                for name, dtype in _COLUMNS.items()}
+        prefix_ids = {}
+        routes = {'announced' : array('l'), 'announced-offsets' : array('q',
+            [0]), 'withdrawn' : array('l'), 'withdrawn-offsets' : array('q',
+            [0])}
+
+        offset = 0
+        with fileio.open(input_path, 'rb') as istream:
+            for line in istream:
+                line_offset = offset
+                offset += len(line)
+                if not line or line.isspace():
+                    continue
+                raw = bmp.RawMessage(line)
+                peer_header = raw.peer_header()
+                peer_id = peer_header.get('PeerBGPID') or 0
+                if peer_id:
+                    peer_id = int(bmp.parse_address(peer_id))
+                columns['timestamp'].append(raw.timestamp())
+                columns['type'].append(raw.type().value)
+                columns['peer-id'].append(peer_id)
+                columns['peer-as'].append(peer_header.get('PeerAS') or 0)
+                columns['offset'].append(line_offset)
+                columns['length'].append(len(line))
+
+                announced, withdrawn = [], []
+                if raw.type() == bmp.MessageType.ROUTE_MONITORING:
+                    announced, withdrawn = bmp.update_prefixes(raw.body())
+                for key, prefixes in (('announced', announced),
+                        ('withdrawn', withdrawn)):
+                    for prefix in prefixes:
+                        routes[key].append(prefix_ids.setdefault(prefix,
+                            len(prefix_ids)))
+                    routes[key + '-offsets'].append(len(routes[key]))
+
+        tmp_path = '%s.%d.tmp' % (store_path, os.getpid())
+        os.makedirs(tmp_path)
+        arrays = {name : np.asarray(columns[name]).astype(dtype)
+                for name, dtype in _COLUMNS.items()}
+        arrays['order'] = np.argsort(arrays['timestamp'], kind='stable')
+        arrays['sorted-timestamp'] = arrays['timestamp'][arrays['order']]
+        for key, values in routes.items():
+            arrays[key] = np.asarray(values).astype(
+                    'i8' if key.endswith('offsets') else 'i4')
+        names = [prefix.encode('utf-8') for prefix in prefix_ids]
+        arrays['prefix-offsets'] = np.cumsum([0] + [len(name)
+            for name in names], dtype='i8')
+        arrays['prefix-names'] = np.frombuffer(b''.join(names), dtype='u1')
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), values)
+        meta = {'version' : _STORE_VERSION,
+                'source' : os.path.relpath(os.path.abspath(input_path),
+                    os.path.dirname(os.path.abspath(store_path))),
+                'compression' : fileio.detect(input_path),
+                'messages' : len(arrays['timestamp'])}
+        meta.update(bmp.source_info(input_path))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as mf:
+            json.dump(meta, mf)
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+        os.replace(tmp_path, store_path)
+        return cls(store_path)
+
+    @classmethod
+    def open_for(cls, input_path, store_path=None):
+        """Open the store for input_path, (re)building it if it is missing
+        or older than the input"""
+        if store_path is None:
+            store_path = default_path(input_path)
+        try:
+            store = cls(store_path)
+            if all(store._meta.get(key) == value for key, value
+                    in bmp.source_info(input_path).items()):
+                store._source = input_path
+                return store
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls.build(input_path, store_path)
+
+    def __len__(self):
+        return self._meta['messages']
+
+    def get_timestamps(self):
+        return self._columns['timestamp']
+
+    def get_types(self):
+        return self._columns['type']
+
+    def get_peer_ids(self):
+        return self._columns['peer-id']
+
+    def get_peer_as(self):
+        return self._columns['peer-as']
+
+    def get_offsets(self):
+        return self._columns['offset']
+
+    def get_source(self):
+        """Path of the BMP message stream the store was built from"""
+        return self._source
+
+    def get_prefixes(self):
+        """List of prefixes, indexed by prefix id, decoded on first use"""
+        if self._prefixes is None:
+            names = self._columns['prefix-names'].tobytes()
+            offsets = self._columns['prefix-offsets'].tolist()
+            self._prefixes = [names[lo:hi].decode('utf-8')
+                    for lo, hi in zip(offsets[:-1], offsets[1:])]
+        return self._prefixes
+
+    def time_range(self, start=None, end=None):
+        """Indices, in file order, of messages with start <= timestamp <
+        end, found by binary search over the sorted timestamps"""
+        timestamps = self._columns['sorted-timestamp']
+        lo = 0 if start is None else np.searchsorted(timestamps, start, 'left')
+        hi = (len(timestamps) if end is None
+                else np.searchsorted(timestamps, end, 'left'))
+        return np.sort(self._columns['order'][lo:hi])
+
+    def select(self, indices=None, types=None, peer=None):
+        """Indices (of those given, or all) of messages of one of the types
+        from the peer (a BGP ID as a string, ip_address or int)"""
+        mask = np.ones(len(self), dtype=bool)
+        if types is not None:
+            mask &= np.isin(self.get_types(), [t.value for t in types])
+        if peer is not None:
+            mask &= self.get_peer_ids() == int(ipaddress.ip_address(peer))
+        if indices is None:
+            return np.flatnonzero(mask)
+        return indices[mask[indices]]
+
+    def iter_lines(self, indices):
+        """Raw lines of messages, read from the source file.  A compressed
+        source cannot be seeked in, so it is decompressed in one pass that
+        keeps just the lines of the messages."""
+        offsets = self._columns['offset']
+        lengths = self._columns['length']
+        if self._meta['compression'] is not None:
+            indices = [int(index) for index in indices]
+            wanted = dict.fromkeys(indices)
+            index_by_offset = {int(offsets[index]) : index
+                    for index in wanted}
+            offset = 0
+            with fileio.open(self._source, 'rb') as istream:
+                for line in istream:
+                    index = index_by_offset.get(offset)
+                    if index is not None:
+                        wanted[index] = line
+                    offset += len(line)
+            for index in indices:
+                yield wanted[index]
+            return
+        with open(self._source, 'rb') as istream:
+            for index in indices:
+                istream.seek(int(offsets[index]))
+                yield istream.read(int(lengths[index]))
+
+    def line(self, index):
+        return next(self.iter_lines([index]))
+
+    def iter_messages(self, indices):
+        """RawMessages for messages, read from the source file"""
+        for line in self.iter_lines(indices):
+            yield bmp.RawMessage(line)
+
+    def _routes(self, key, index):
+        offsets = self._columns[key + '-offsets']
+        prefixes = self.get_prefixes()
+        return [prefixes[i] for i in
+                self._columns[key][offsets[index]:offsets[index + 1]]]
+
+    def announced(self, index):
+        """Prefixes announced by a route monitoring message"""
+        return self._routes('announced', index)
+
+    def withdrawn(self, index):
+        """Prefixes withdrawn by a route monitoring message"""
+        return self._routes('withdrawn', index)
+
+def main():
+    # Parse arguments
+    arg_parser = ArgumentParser(description='Build a columnar store for a '
+            + 'BMP message stream and query it')
+    arg_parser.add_argument('-input', dest='input_path', action='store',
+            required=True, help='Path for BMP message stream')
+    arg_parser.add_argument('-store', dest='store_path', action='store',
+            default=None, help='Path for the store (default: INPUT.store)')
+    arg_parser.add_argument('-rebuild', dest='rebuild', action='store_true',
+            default=False, help='Rebuild the store even if it is up to date')
+    arg_parser.add_argument('-from', dest='start', action='store',
+            type=float, default=None, help='Only messages at or after this '
+            + 'timestamp')
+    arg_parser.add_argument('-to', dest='end', action='store', type=float,
+            default=None, help='Only messages before this timestamp')
+    arg_parser.add_argument('-peer', dest='peer', action='store',
+            default=None, help='Only messages from this peer BGP ID')
+    arg_parser.add_argument('-print', dest='print_lines', action='store_true',
+            default=False, help='Print the selected messages')
+    settings = arg_parser.parse_args()
+
+    if settings.rebuild:
+        store = BmpStore.build(settings.input_path, settings.store_path)
+    else:
+        store = BmpStore.open_for(settings.input_path, settings.store_path)
+
+    indices = store.time_range(settings.start, settings.end)
+    indices = store.select(indices, peer=settings.peer)
+    if settings.print_lines:
+        for line in store.iter_lines(indices):
+            print(line.decode('utf-8'), end='')
+        return
+    types = store.get_types()[indices]
+    print('Messages: %d' % len(indices))
+    for msg_type in bmp.MessageType:
+        count = np.count_nonzero(types == msg_type.value)
+        if count > 0:
+            print('%s: %d' % (msg_type.name, count))
+
+if __name__ == '__main__':
+    main()
@@ -5,26 +5,47 @@ Check whether all intents appear in a network summary
 """
 
 from argparse import ArgumentParser
+import fileio
 import ipaddress
 import json
 import math
 import nopticon
+import numpy as np
 
-def get_edge_rank(summary, flow, edge):
-    rank = summary.get_edge_rank(flow, edge)
-    if (rank is None):
-        return (-1, -1, -1, [])
-    edges = summary.get_edges(flow)
-    ranks = sorted(set([summary.get_edge_rank(flow, edge) for edge in edges.keys()]),
-            reverse=True)
-    flow_rank = ranks.index(rank) + 1
-    flow_percentile = flow_rank/len(ranks) * 100
-    history = summary.get_edge_history(flow, edge)
-    return (rank, flow_rank, flow_percentile, history)
+NOT_FOUND = (-1, -1, -1, [])
 
+def check_reachability(policy, summary, span=0):
+    return check_reachabilities([policy], summary, span)[0]
 
-def check_reachability(policy, summary):
-    return get_edge_rank(summary, policy._flow, policy.edge())
+def check_reachabilities(policies, summary, span=0):
+    """
+    Rank results for a list of reachability policies.  A policy applies to
+    every flow it matches, so the weakest of those edges is reported.  An
+    edge without a rank for the span counts as not found.
+    """
+    # Map every policy to the ids of the edges it matches
+    eids = []
+    owners = []
+    for idx, policy in enumerate(policies):
+        for flow in summary.match_flows(policy.flow_key()):
+            eid = summary.get_edge_id(flow, policy.edge())
+            eids.append(-1 if eid is None else eid)
+            owners.append(idx)
+
+    results = [None] * len(policies)
+    if (len(eids) > 0):
+        ranks, flow_ranks, flow_percentiles = \
+                summary.get_rank_table(span).get_many(np.maximum(eids, 0))
+        for i, idx in enumerate(owners):
+            if (eids[i] < 0 or math.isnan(ranks[i])):
+                result = NOT_FOUND
+            else:
+                result = (float(ranks[i]), int(flow_ranks[i]),
+                        float(flow_percentiles[i]),
+                        summary.get_history_by_id(eids[i]))
+            if (results[idx] is None or result[0] < results[idx][0]):
+                results[idx] = result
+    return [NOT_FOUND if result is None else result for result in results]
 
 def main():
     # Parse arguments
@@ -40,6 +61,11 @@ def main():
             help='Coerce path-preference policies to reachability policies')
     arg_parser.add_argument('-t', '--threshold', default=0.5, type=float,
             required=False, help='The minimum rank to consider between 0 and 1')
+    arg_parser.add_argument('-S', '--span', default=0, type=int,
+            required=False, help='Which rank (rank-0, rank-1, ...) to check')
+    arg_parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+            default=None, help='Directory to keep a binary cache of the '
+            + 'summary in, so later runs load it faster')
     settings = arg_parser.parse_args()
     num_satisfied = 0
 
@@ -48,13 +74,15 @@ def main():
         return 1
 
     # Load summary
-    with open(settings.summary_path, 'r') as sf:
-        summary_json = sf.read()
-    summary = nopticon.ReachSummary(summary_json)
+    summary = nopticon.ReachSummary.load(settings.summary_path,
+            cache_dir=settings.cache_dir)
+    if settings.span < 0 or settings.span >= summary.get_num_spans():
+        print("Summary only has %d ranks per edge" % summary.get_num_spans())
+        return 1
 
     # Load policies
     if (settings.policies_path is not None):
-        with open(settings.policies_path, 'r') as pf:
+        with fileio.open(settings.policies_path, 'r') as pf:
             policies_json = pf.read()
         policies = nopticon.parse_policies(policies_json)
     else:
@@ -67,36 +95,40 @@ def main():
                 policies[idx] = policy.toReachabilityPolicy()
 
     # Check policies
-    for policy in policies:
-        if policy.isType(nopticon.PolicyType.REACHABILITY):
-            reach_result = check_reachability(policy, summary)
-            if (reach_result[0] >= settings.threshold):
-                satisfied = 'satisfied'
-                num_satisfied += 1
-            else:
-                satisfied = 'unsatisfied'
-            print('Policy %s %f %d %f %s %s' % (policy, reach_result[0],
-                reach_result[1], reach_result[2], satisfied, reach_result[3]))
+    reach_policies = [policy for policy in policies
+            if policy.isType(nopticon.PolicyType.REACHABILITY)]
+    reach_results = check_reachabilities(reach_policies, summary,
+            settings.span)
+    for policy, reach_result in zip(reach_policies, reach_results):
+        if (reach_result[0] >= settings.threshold):
+            satisfied = 'satisfied'
+            num_satisfied += 1
+        else:
+            satisfied = 'unsatisfied'
+        print('Policy %s %f %d %f %s %s' % (policy, reach_result[0],
+            reach_result[1], reach_result[2], satisfied, reach_result[3]))
     # Indicate how many policies were found
     print('%d out of %d policies were found.' % (num_satisfied, len(policies)))
 
     # Check for extra edges
     if (settings.extras):
-        # Get all edges in policies
+        # Get all edges in policies, keyed by the summary flows they match
         policy_edges = {}
         for policy in policies:
             if policy.isType(nopticon.PolicyType.REACHABILITY):
-                if policy._flow not in policy_edges:
-                    policy_edges[policy._flow] = []
-                policy_edges[policy._flow].append(policy.edge())
+                for flow in summary.match_flows(policy.flow_key()):
+                    if flow not in policy_edges:
+                        policy_edges[flow] = set()
+                    policy_edges[flow].add(policy.edge())
 
         # Identify extra edges
         print("Extras:")
+        rank_table = summary.get_rank_table(settings.span)
         for flow in summary.get_flows():
             first_edge_for_flow = True
             for edge in summary.get_edges(flow):
                 if flow not in policy_edges or edge not in policy_edges[flow]:
-                    rank_result = get_edge_rank(summary, flow, edge)
+                    rank_result = rank_table.lookup(flow, edge)
                     if (rank_result[0] >= settings.threshold):
                         if (first_edge_for_flow):
                             print(flow)
@@ -9,6 +9,7 @@ from sklearn.cluster import DBSCAN, KMeans, AgglomerativeClustering
 import numpy as np
 import matplotlib.pyplot as plt
 from pprint import PrettyPrinter
+import fileio
 import nopticon
 import sys
 from argparse import ArgumentParser
@@ -24,8 +25,7 @@ def infer_reachability(summaries, settings):
                 rank = round(summary.get_edge_rank(flow, edge), 
                         settings.precision)
                 if rank >= float(settings.threshold):
-                    policy = nopticon.ReachabilityPolicy({'flow' : flow,
-                        'source' : edge[0], 'target' : edge[1]})
+                    policy = nopticon.ReachabilityPolicy.from_edge(flow, edge)
                     prop[policy] = len(ranks)
                     if settings.equiv_classes:
                         # TODO: genericize class
@@ -122,12 +122,12 @@ def main():
 
     # Load summaries
     summaries = []
-    with open(settings.summary_path, 'r') as sf:
-        for summary_json in sf:
-            summaries.append(nopticon.ReachSummary(summary_json, settings.precision))
+    for summary in nopticon.iter_summaries(settings.summary_path,
+            fields=['reach-summary', 'rank-0']):
+        summaries.append(nopticon.ReachSummary(summary, settings.precision))
 
     # Load policies
-    with open(settings.policies_path, 'r') as pf:
+    with fileio.open(settings.policies_path, 'r') as pf:
         policies_json = pf.read()
     policies = nopticon.parse_policies(policies_json)
     
@@ -135,6 +135,7 @@ def main():
     for idx, policy in enumerate(policies):
         if policy.isType(nopticon.PolicyType.PATH_PREFERENCE):
             policies[idx] = policy.toReachabilityPolicy()
+    policies = nopticon.PolicySet(policies)
 
     # Infer rechability properties
     all_prop, inferences_per_summary = infer_reachability(summaries, settings)
@@ -150,10 +151,10 @@ def main():
             # print("%s %s" % (p, valid))
 
     if settings.cluster_threshold is not None:
-        print(settings.cluster_threshold, (correct_policies/len(all_prop)), (correct_policies/(len(policies))))
+        print(settings.cluster_threshold, (correct_policies/len(all_prop)), (correct_policies/(policies.total())))
     else :
         print("Precision: %f" % (correct_policies/len(all_prop)))
-        print("Recall: %f" % (correct_policies/len(policies)))
+        print("Recall: %f" % (correct_policies/policies.total()))
 
 #    pp = PrettyPrinter(width=80)
 #    comparisons = [[(0,0,0) for _ in inferences_per_summary]
@@ -102,13 +102,13 @@ def main():
                         help="The minimum rank to consider out of 100, e.g. A value of 75 corresponds to a rank of 0.75 ")
     parser.add_argument("-s", "--sigfigs", default=2, type=int, required=False,
                         help="The number of sig figs for the rank values")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=None,
+                        help="Directory to keep a binary cache of the summary in, so later runs load it faster")
     parser.add_argument("summary", help="The filepath to the reachability summary in JSON form")
     settings = parser.parse_args()
 
-    rs = None
-
-    with open(settings.summary) as reach_fp:
-        rs = nopticon.ReachSummary(reach_fp.read(), settings.sigfigs)
+    rs = nopticon.ReachSummary.load(settings.summary, settings.sigfigs,
+                                    cache_dir=settings.cache_dir)
 
     if settings.threshold is None:
         gNEC_outputs = []
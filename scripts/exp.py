@@ -8,6 +8,7 @@ from kmodes.kprototypes import KPrototypes
 from sklearn.cluster import DBSCAN, KMeans, AgglomerativeClustering
 
 from argparse import ArgumentParser
+import fileio
 import nopticon
 import implied_properties
 import equivalence as eq
@@ -33,9 +34,7 @@ def cluster(summ, agg_classes = None):
         # else:
             # print(flow, edge, rank)
 
-        policy = nopticon.ReachabilityPolicy({'flow' : flow,
-                                              'source' : edge[0],
-                                              'target' : edge[1]})
+        policy = nopticon.ReachabilityPolicy.from_edge(flow, edge)
         prop[policy] = len(ranks)
         if agg_classes is not None:
             ranks.append([rank, agg_classes[edge[0]], agg_classes[edge[1]]])
@@ -98,9 +97,7 @@ def evaluate(summ, pref_summ, policies, artefacts, pref_policies, cluster, impli
     false_negative_count = 0
     falses = set([])
     for flow, edge in summ.get_flowedges():
-        pol = nopticon.ReachabilityPolicy({'flow' : flow,
-                                          'source' : edge[0],
-                                          'target': edge[1]})
+        pol = nopticon.ReachabilityPolicy.from_edge(flow, edge)
         if baseline or summ.is_insight(flow = flow,
                                        edge = edge,
                                        cluster = cluster,
@@ -132,7 +129,7 @@ def evaluate(summ, pref_summ, policies, artefacts, pref_policies, cluster, impli
     else:
         prec = true_positive_count/(true_positive_count + false_positive_count)
         allowed_error =  allowed_error_count/(true_positive_count + false_positive_count)
-        rec  = true_positive_count/len(policies)
+        rec  = true_positive_count/policies.total()
         
     acc  = (true_positive_count + allowed_error_count + true_negative_count) / (true_positive_count + true_negative_count + false_negative_count + false_positive_count)
     if prec + rec > 0:
@@ -153,13 +150,13 @@ def evaluate(summ, pref_summ, policies, artefacts, pref_policies, cluster, impli
     # print("")
     # print("")
 
-    if len(pref_summ.preferences()) == 0 or len(pref_policies) == 0:
+    if len(pref_summ.preferences()) == 0 or pref_policies.total() == 0:
         pref_prec = None
         pref_rec = None
         pref_f1score = None
     else:
         pref_prec = pref_TP_count / len(pref_summ.preferences())
-        pref_rec = pref_TP_count / len(pref_policies)
+        pref_rec = pref_TP_count / pref_policies.total()
         pref_f1score = 2 * (pref_prec*pref_rec) / (pref_prec + pref_rec)
     
     return (prec, allowed_error, rec, acc, f1score, pref_prec, pref_rec, pref_f1score) 
@@ -353,7 +350,7 @@ def main():
     settings = parser.parse_args()
     
     simulations = []
-    with open(settings.simulations, 'r') as sim_fp:
+    with fileio.open(settings.simulations, 'r') as sim_fp:
         simulations = sim_fp.readlines()
 
 
@@ -361,7 +358,7 @@ def main():
     for sim in simulations:
         datafile, topofile, polfile = sim.split(',')
         fwd_summary, topo, policies = (None, None, None)
-        with open(datafile.strip(), 'r') as data_fp:
+        with fileio.open(datafile.strip(), 'r') as data_fp:
             fwd_str = data_fp.read()
             if len(fwd_str) < 10:
                 continue
@@ -371,9 +368,9 @@ def main():
                 loc = settings.visualize + prettify_name(datafile)
             fwd_summary = implied_properties.EnhancedReachSummary(fwd_str, 9)
             pref_summary = implied_properties.PrefSummary(fwd_str, 9)
-        with open(topofile.strip(), 'r') as topo_fp:
+        with fileio.open(topofile.strip(), 'r') as topo_fp:
             topo = implied_properties.Topo(topo_fp.read())
-        with open(polfile.strip(), 'r') as pol_fp:
+        with fileio.open(polfile.strip(), 'r') as pol_fp:
             simple_policies = nopticon.parse_policies(pol_fp.read())
 
         coerced_policies = []
@@ -386,6 +383,9 @@ def main():
                 pref_policies.append(policy)
             else:
                 coerced_policies.append(policy)
+        coerced_policies = nopticon.PolicySet(coerced_policies)
+        artefacts = nopticon.PolicySet(artefacts)
+        pref_policies = nopticon.PolicySet(pref_policies)
 
 
         # evaluate every result for the collected data
@@ -0,0 +1,141 @@
+"""
+File opening shared by the Nopticon scripts.  Compressed inputs (gzip, zstd,
+bzip2, xz) are detected by their magic bytes and decompressed while
+streaming; outputs are compressed according to their file extension.  All
+files are read and written through a large buffer.
+"""
+
+import builtins
+import bz2
+import gzip
+import io
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BUFFER_SIZE = 1 << 20
+
+# Compression formats by magic bytes and by file extension
+_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'BZh', 'bzip2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+]
+_EXTENSIONS = {
+    '.gz' : 'gzip',
+    '.zst' : 'zstd',
+    '.bz2' : 'bzip2',
+    '.xz' : 'xz',
+}
+_MAGIC_LEN = max(len(magic) for magic, _ in _MAGIC)
+
+def detect(path):
+    """Compression format of the file at path, or None if uncompressed"""
+    with builtins.open(path, 'rb', buffering=BUFFER_SIZE) as f:
+        return _sniff(f)
+
+def _sniff(f):
+    # Peek rather than read, so f can still be read from the start even if
+    # it is a pipe
+    head = f.peek(_MAGIC_LEN)[:_MAGIC_LEN]
+    for magic, compression in _MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+def compression_for(path):
+    """Compression format implied by the extension of path, if any"""
+    for extension, compression in _EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+def open(path, mode='r', compression='auto'):
+    """
+    Open a file like the builtin open, in text ('r', 'w', 'a') or binary
+    ('rb', 'wb', 'ab') mode.  With compression='auto', files being read are
+    decompressed according to their magic bytes and files being written
+    are compressed according to their extension; otherwise compression is
+    one of 'gzip', 'zstd', 'bzip2', 'xz' or None.  A file being read is
+    opened once, so pipes (such as /dev/stdin or <(...)) can be read too.
+    """
+    binary = 'b' in mode
+    raw_mode = mode.replace('b', '').replace('t', '') + 'b'
+    if raw_mode == 'rb':
+        stream = _open_reader(path, compression)
+    else:
+        if compression == 'auto':
+            compression = compression_for(path)
+        if compression is None:
+            if binary:
+                return builtins.open(path, raw_mode, buffering=BUFFER_SIZE)
+            return builtins.open(path, mode, buffering=BUFFER_SIZE,
+                    encoding='utf-8')
+        stream = io.BufferedWriter(_compressor(path, raw_mode, compression),
+                buffer_size=BUFFER_SIZE)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+def _open_reader(path, compression):
+    """Buffered binary stream of the (decompressed) contents of path"""
+    f = builtins.open(path, 'rb', buffering=BUFFER_SIZE)
+    try:
+        if compression == 'auto':
+            compression = _sniff(f)
+        if compression is None:
+            return f
+        return _ClosingReader(_decompressor(f, path, compression), f)
+    except:
+        f.close()
+        raise
+
+def _decompressor(f, path, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    elif compression == 'bzip2':
+        return bz2.BZ2File(f, 'rb')
+    elif compression == 'xz':
+        return lzma.LZMAFile(f, 'rb')
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstandard is required to open %s' % path)
+        return zstandard.ZstdDecompressor().stream_reader(f,
+                read_size=BUFFER_SIZE, read_across_frames=True,
+                closefd=False)
+    raise ValueError('Unknown compression %s' % compression)
+
+def _compressor(path, raw_mode, compression):
+    if compression == 'gzip':
+        return gzip.open(path, raw_mode)
+    elif compression == 'bzip2':
+        return bz2.open(path, raw_mode)
+    elif compression == 'xz':
+        return lzma.open(path, raw_mode)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstandard is required to open %s' % path)
+        return zstandard.ZstdCompressor().stream_writer(
+                builtins.open(path, raw_mode), closefd=True,
+                write_return_read=True)
+    raise ValueError('Unknown compression %s' % compression)
+
+class _ClosingReader(io.BufferedReader):
+    """
+    Buffered reader over a decompressor that also closes the file the
+    decompressor reads from, which decompressors given a file object leave
+    open
+    """
+    def __init__(self, stream, source):
+        super().__init__(stream, buffer_size=BUFFER_SIZE)
+        self._source = source
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._source.close()
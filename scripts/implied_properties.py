@@ -1,7 +1,9 @@
 #! /usr/bin/python3
 
 from itertools import combinations
+import fileio
 import json
+import jsonio
 import nopticon
 from argparse import ArgumentParser
 import superpecs
@@ -10,6 +12,10 @@ class EnhancedReachSummary(nopticon.ReachSummary):
     def __init__(self, summary_json, sigfigs):
         super().__init__(summary_json, sigfigs)
 
+    def _set_columns(self, columns):
+        super()._set_columns(columns)
+        self.clear()
+
     def to_policy_set(self, show_implied=False, flow_str=None, threshold=0):
         policies = {}
         for flow in self.get_flows():
@@ -22,11 +28,9 @@ class EnhancedReachSummary(nopticon.ReachSummary):
                     if (show_implied and is_implied) or not is_implied:
                         if (flow not in policies):
                             policies[flow] = []
-                        policies[flow].append(nopticon.ReachabilityPolicy({
-                            'flow' : flow,
-                            'source': edge[0],
-                            'target': edge[1]
-                        }))
+                        policies[flow].append(
+                                nopticon.ReachabilityPolicy.from_edge(flow,
+                                    edge))
         return policies
 
     def is_insight(self,flow, edge, cluster=False, threshold=None, implied=False):
@@ -43,52 +47,48 @@ class EnhancedReachSummary(nopticon.ReachSummary):
         return True
 
     def clear(self):
-        for flow,edge in self.get_flowedges():
-            edge_data = self.get_edges(flow)[edge]
-            if 'T' in edge_data:
-                del edge_data['T']
-
-            if 'C' in edge_data:
-                del edge_data['C']
-
-            if 'implied_by' in edge_data:
-                del edge_data['implied_by']
+        # Marks are keyed by edge id rather than stored in the edge details
+        self._above_threshold = {}
+        self._cluster_accepted = set()
+        self._implied_by = {}
         return
 
     def mark_above_threshold(self, t, flow, edge):
-        self.get_edges(flow)[edge]['T'] = t
+        self._above_threshold[self.get_edge_id(flow, edge)] = t
 
     def is_above_threshold(self, t, flow, edge):
-        return 'T' in self.get_edges(flow)[edge] and\
-            (t is None or self.get_edges(flow)[edge]['T'] >= t)
+        eid = self.get_edge_id(flow, edge)
+        return eid in self._above_threshold and\
+            (t is None or self._above_threshold[eid] >= t)
 
     def mark_cluster_accepted(self, flow, edge):
-        self.get_edges(flow)[edge]['C'] = True
+        self._cluster_accepted.add(self.get_edge_id(flow, edge))
 
     def is_cluster_accepted(self, flow, edge):
-        edgedata = self.get_edges(flow)[edge]
-        return 'C' in edgedata and edgedata['C']
+        return self.get_edge_id(flow, edge) in self._cluster_accepted
 
     def mark_edge_implied_by(self, flow, premise, conclusion):
-        if conclusion in self.get_edges(flow):
+        eid = self.get_edge_id(flow, conclusion)
+        if eid is not None:
             # the conclusion is implied by EACH if the contents of the implied_by list
-            if 'implied_by' in self.get_edges(flow)[conclusion]:
-                self.get_edges(flow)[conclusion]['implied_by'].append(list(premise))
+            if eid in self._implied_by:
+                self._implied_by[eid].append(list(premise))
             else:
-                self.get_edges(flow)[conclusion]['implied_by'] = [list(premise)]
+                self._implied_by[eid] = [list(premise)]
             # print("\t",premise, "==>", conclusion)
             return True
         else:
             return False
 
     def edge_is_implied(self, flow, edge):
-        return edge in self.get_edges(flow)\
-            and 'implied_by' in self.get_edges(flow)[edge]\
-            and len(self.get_edges(flow)[edge]['implied_by']) > 0
+        eid = self.get_edge_id(flow, edge)
+        return eid is not None\
+            and eid in self._implied_by\
+            and len(self._implied_by[eid]) > 0
 
 class PrefSummary:
     def __init__(self, summary_json, sigfigs=9):
-        self._summary=json.loads(summary_json)
+        self._summary=jsonio.loads(summary_json)
         self._sigfigs = sigfigs
 
         self._preferences = []
@@ -367,6 +367,9 @@ def main():
             help='Aggregate by super PEC')
     parser.add_argument('--rdns', dest='rdns_path', action='store',
             default=None, help='rDNS file containing prefix descriptions')
+    parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+            default=None, help='Directory to keep a binary cache of the '
+            + 'summary in, so later runs load it faster')
     settings = parser.parse_args()
  
     if settings.threshold < 0 or settings.threshold > 1:
@@ -375,7 +378,7 @@ def main():
 
     if settings.policies_path is not None:
         # load policies
-        with open(settings.policies_path, 'r') as pf:
+        with fileio.open(settings.policies_path, 'r') as pf:
             policies_json = pf.read()
         policies = nopticon.parse_policies(policies_json)
     
@@ -384,23 +387,17 @@ def main():
             for idx, policy in enumerate(policies):
                 if policy.isType(nopticon.PolicyType.PATH_PREFERENCE):
                     policies[idx] = policy.toReachabilityPolicy()
+        policies = nopticon.PolicySet(policies)
                 
-    reach_str = None
-    with open(settings.summary) as reach_fp:
-        reach_str = reach_fp.read()
-        
-    if reach_str is None:
-        print("ERROR: Could not read from", settings.summary)
-        return 1
-
-    reach_summ = EnhancedReachSummary(reach_str, 2)
+    reach_summ = EnhancedReachSummary.load(settings.summary, 2,
+            cache_dir=settings.cache_dir)
 
     # Compute super PECs, if necessary
     if (settings.super_pecs):
         specs = superpecs.compute_specs(reach_summ)
     
     topo_str = None
-    with open(settings.topo) as topo_fp:
+    with fileio.open(settings.topo, 'r') as topo_fp:
         topo_str = topo_fp.read()
 
     topo = Topo(topo_str)
@@ -411,7 +408,7 @@ def main():
 
     descriptions = {}
     if (settings.rdns_path is not None):
-        with open(settings.rdns_path) as rdns_fp:
+        with fileio.open(settings.rdns_path, 'r') as rdns_fp:
             rdns = json.loads(rdns_fp.read())
         if "prefixes" in rdns:
             for prefix in rdns["prefixes"]:
@@ -442,7 +439,7 @@ def main():
                 
             
         print("Precision:", float(correct_policies/len(props)))
-        print("Recall:", float(correct_policies/len(policies)))
+        print("Recall:", float(correct_policies/policies.total()))
 
     
 if __name__ == "__main__":    
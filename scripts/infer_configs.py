@@ -2,7 +2,7 @@
 
 from argparse import ArgumentParser
 import sys
-import json
+import fileio
 import nopticon
 import os
 import pygraphviz
@@ -320,13 +320,7 @@ def main():
     if args.end_sum == args.output:
         sys.exit()
 
-    with open(args.end_sum, 'r') as f:
-        end_sum = json.load(f)
-    f.close()
-
-    sf = open(args.end_sum, 'r')
-
-    topo = open(args.topo, 'r')
+    topo = fileio.open(args.topo, 'r')
     if args.output:
         output = open(args.output, 'w+')
     else:
@@ -336,13 +330,14 @@ def main():
     topo.close()
     route_origins = {}
 
-    for i, summary_json in enumerate(sf):
-        link_summary = nopticon.LinkSummary(summary_json)
+    summaries = nopticon.iter_summaries(args.end_sum,
+            fields=['flows', 'reach-summary', 'rank-0'])
+    for i, summary in enumerate(summaries):
+        link_summary = nopticon.LinkSummary(summary)
         parse_graphs(routers, link_summary, route_origins, '%010d' % (i))
 
-        reach_summary = nopticon.ReachSummary(summary_json)
+        reach_summary = nopticon.ReachSummary(summary)
         reachability(routers, reach_summary, '%010d' % (i))
-    sf.close()
 
     # filters = filter_rules(routers, route_origins)
 
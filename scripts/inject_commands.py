@@ -1,92 +1,359 @@
 #!/usr/bin/python3
 
 """
-Inject nopticon commands into a BMP message stream 
+Inject nopticon commands into a BMP message stream
 """
 
 from argparse import ArgumentParser
-import bmp 
+import asyncio
+import bmp
+import collections
+import fileio
 import nopticon
+import shlex
+import sys
+import time
+
+# Number of lines to collect before writing them out together
+BATCH_LINES = 4096
+
+_PEER_TYPES = (bmp.MessageType.PEER_UP, bmp.MessageType.PEER_DOWN)
+
+class CommandInjector:
+    """
+    Tracks the state of links from peer up/down messages and produces the
+    commands to inject when a link changes state
+    """
+    def __init__(self, rdns=None, log=print):
+        self._resolve = None if rdns is None else rdns.resolver()
+        self._log = log
+        # Special flag to avoid inserting commands when network is still
+        # starting
+        self._seen_peer_down = False
+        # Edge -> True if up, False if down
+        self._link_up = {}
+
+    def update(self, bmp_msg):
+        """Commands (as bytes) to insert before a peer up/down message"""
+        if (bmp_msg.isPeerDown()):
+            self._seen_peer_down = True
+
+        # Determine if link went up or down
+        edge = bmp_msg.edge()
+        if self._resolve is not None:
+            source, target = bmp_msg.edge_keys()
+            names = (self._resolve(source), self._resolve(target))
+            assert names[0] is not None, "%s not in rdns" % edge[0]
+            assert names[1] is not None, "%s not in rdns" % edge[1]
+            edge = names
+        if (edge[1] < edge[0]):
+            edge = (edge[1], edge[0])
+        up = bmp_msg.isPeerUp()
+        if self._link_up.get(edge) == up:
+            return []
+        self._link_up[edge] = up
+        self._log('%s %s-%s' % ((('Up' if up else 'Down'),) + edge))
+
+        # Write commands if a link changed state
+        if not self._seen_peer_down:
+            return []
+        return [nopticon.Command.print_log().bytes(),
+                nopticon.Command.refresh_summary(bmp_msg._timestamp).bytes()]
+
+def inject(lines, ostream, injector=None):
+    """
+    Copy the lines of a BMP message stream to ostream (binary), inserting
+    the injector's commands before peer up/down messages.  Other messages
+    are copied without being decoded.
+    """
+    batch = []
+    for line in lines:
+        if not line or line.isspace():
+            continue
+        if injector is not None and bmp.line_type(line) in _PEER_TYPES:
+            batch.extend(injector.update(bmp.RawMessage(line).message()))
+        batch.append(line)
+        if len(batch) >= BATCH_LINES:
+            ostream.writelines(batch)
+            batch.clear()
+    ostream.writelines(batch)
+
+# Longest message accepted in tap mode
+_LINE_LIMIT = 64 << 20
+
+class LatencyStats:
+    """Forwarding latencies, keeping the most recent samples for
+    percentiles"""
+    def __init__(self, samples=65536):
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._recent = collections.deque(maxlen=samples)
+
+    def add(self, latency):
+        self._count += 1
+        self._total += latency
+        if latency > self._max:
+            self._max = latency
+        self._recent.append(latency)
+
+    def __str__(self):
+        if self._count == 0:
+            return 'Forwarded 0 messages'
+        recent = sorted(self._recent)
+        def percentile(p):
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1e6
+        return ('Forwarded %d messages, latency (us): mean %.1f p50 %.1f '
+                'p99 %.1f max %.1f' % (self._count,
+                    self._total / self._count * 1e6, percentile(0.5),
+                    percentile(0.99), self._max * 1e6))
+
+class _ThreadWriter:
+    """
+    StreamWriter-like wrapper that writes to a blocking output (e.g.,
+    stdout) from a thread.  Unlike a pipe connected to the event loop, the
+    output is never made non-blocking, which would also affect stderr if
+    the two share a pipe.
+    """
+    def __init__(self, ostream):
+        self._ostream = ostream
+        self._pending = []
+
+    def write(self, data):
+        self._pending.append(data)
+
+    async def drain(self):
+        if self._pending:
+            data, self._pending = self._pending, []
+            await asyncio.get_running_loop().run_in_executor(None,
+                    self._write, data)
+
+    def _write(self, data):
+        self._ostream.writelines(data)
+        self._ostream.flush()
+
+    def close(self):
+        self._write(self._pending)
+        self._pending = []
+
+# Bytes of lines read at a time from stdin when it is a regular file
+_FILE_CHUNK = 1 << 20
+
+async def _read_stdin(queue):
+    """Put every line from stdin on queue, with the time it arrived"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=_LINE_LIMIT)
+    try:
+        await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    except ValueError:
+        # Regular file, which cannot be read through the event loop; read
+        # it from a thread that waits for room on the queue before reading
+        # on, so a slow consumer holds back the reader
+        async def put_lines(lines, arrived):
+            for line in lines:
+                await queue.put((line, arrived))
+
+        def feed():
+            while True:
+                lines = sys.stdin.buffer.readlines(_FILE_CHUNK)
+                if not lines:
+                    break
+                asyncio.run_coroutine_threadsafe(put_lines(lines,
+                    time.perf_counter()), loop).result()
+
+        await loop.run_in_executor(None, feed)
+        return
+    await _read_lines(reader, queue)
+
+async def _read_lines(reader, queue):
+    """Put every line from reader on queue, with the time it arrived.
+    Lines longer than _LINE_LIMIT are skipped."""
+    while True:
+        try:
+            line = await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as error:
+            # The last line may have no newline
+            line = error.partial
+            if not line:
+                break
+        except asyncio.LimitOverrunError as error:
+            print('Skipping a message longer than %d bytes' % _LINE_LIMIT,
+                    file=sys.stderr)
+            await _skip_line(reader, error.consumed)
+            continue
+        await queue.put((line, time.perf_counter()))
+
+async def _skip_line(reader, consumed):
+    """Discard the rest of a line that overran the reader's limit, of which
+    the first consumed bytes are buffered"""
+    while True:
+        try:
+            await reader.readexactly(consumed)
+            await reader.readuntil(b'\n')
+            return
+        except asyncio.LimitOverrunError as error:
+            consumed = error.consumed
+        except asyncio.IncompleteReadError:
+            return
+
+async def _serve_connection(reader, writer, queue):
+    await _read_lines(reader, queue)
+    writer.close()
+
+async def _forward(queue, writer, injector, latencies):
+    """Write lines from queue to writer, inserting the injector's commands,
+    until a None is dequeued"""
+    done = False
+    while not done:
+        batch = [await queue.get()]
+        while not queue.empty() and len(batch) < BATCH_LINES:
+            batch.append(queue.get_nowait())
+        if batch[-1] is None:
+            batch.pop()
+            done = True
+        for line, _ in batch:
+            if line.isspace():
+                continue
+            if injector is not None and bmp.line_type(line) in _PEER_TYPES:
+                for command in injector.update(
+                        bmp.RawMessage(line).message()):
+                    writer.write(command)
+            writer.write(line)
+        # Waits while the consumer is behind, which in turn stops reading
+        # once the queue is full
+        await writer.drain()
+        now = time.perf_counter()
+        for _, arrived in batch:
+            latencies.add(now - arrived)
+
+async def _report(latencies, interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(latencies, file=sys.stderr)
+
+async def tap(settings, injector):
+    """
+    Forward a live BMP message stream from stdin (or TCP connections on
+    settings.listen) to stdout (or the stdin of settings.exec_cmd),
+    inserting commands on peer up/down events
+    """
+    queue = asyncio.Queue(maxsize=settings.queue)
+    latencies = LatencyStats()
+
+    proc = None
+    if settings.exec_cmd is not None:
+        proc = await asyncio.create_subprocess_exec(
+                *shlex.split(settings.exec_cmd), stdin=asyncio.subprocess.PIPE)
+        writer = proc.stdin
+    else:
+        writer = _ThreadWriter(sys.stdout.buffer)
+
+    forwarder = asyncio.ensure_future(_forward(queue, writer, injector,
+        latencies))
+    reporter = None
+    if settings.report is not None:
+        reporter = asyncio.ensure_future(_report(latencies, settings.report))
+
+    try:
+        try:
+            if settings.listen is not None:
+                host, _, port = settings.listen.rpartition(':')
+                server = await asyncio.start_server(
+                        lambda reader, writer: _serve_connection(reader,
+                            writer, queue),
+                        host or None, int(port), limit=_LINE_LIMIT)
+                async with server:
+                    await server.serve_forever()
+            else:
+                await _read_stdin(queue)
+        except asyncio.CancelledError:
+            # Interrupted (e.g., by Ctrl-C, or always with -listen): still
+            # forward the messages already read and write the end command
+            pass
+        await queue.put(None)
+        await forwarder
+
+        if (settings.end):
+            writer.write(nopticon.Command.print_log().bytes())
+            await writer.drain()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        writer.close()
+        print(latencies, file=sys.stderr)
+        if proc is not None:
+            await proc.wait()
 
 def main():
     # Parse arguments
     arg_parser = ArgumentParser(description='Inject nopticon commands into a BMP message stream')
     arg_parser.add_argument('-input', dest='input_path', action='store',
-            required=True, help='Path for BMP message stream')
+            help='Path for BMP message stream')
     arg_parser.add_argument('-output', dest='output_path', action='store',
-            required=True, help='Path for modified message stream')
+            help='Path for modified message stream')
     arg_parser.add_argument('-rdns', dest='rdns_path', action='store',
             default=None, help='Path to rdns JSON file')
     arg_parser.add_argument('-peerchange', dest='peerchange',
-            action='store_true', 
+            action='store_true',
             help='Print and reset network summary on every peer up/down event')
     arg_parser.add_argument('-end', dest='end',
             action='store_true',
             help='Print network summary at end of message stream')
+    arg_parser.add_argument('-from', dest='start_time', action='store',
+            type=float, default=None, help='Only copy messages at or after '
+            + 'this timestamp, seeking to them with a sidecar index')
+    arg_parser.add_argument('-to', dest='end_time', action='store',
+            type=float, default=None, help='Only copy messages before this '
+            + 'timestamp')
+    arg_parser.add_argument('-tap', dest='tap', action='store_true',
+            help='Forward a live message stream from stdin to stdout')
+    arg_parser.add_argument('-listen', dest='listen', action='store',
+            default=None, help='In tap mode, read from TCP connections on '
+            + '[HOST:]PORT instead of stdin')
+    arg_parser.add_argument('-exec', dest='exec_cmd', action='store',
+            default=None, help='In tap mode, write to the stdin of this '
+            + 'command (e.g., gobgp-analysis) instead of stdout')
+    arg_parser.add_argument('-queue', dest='queue', action='store', type=int,
+            default=16384, help='In tap mode, maximum number of messages '
+            + 'waiting to be forwarded (default=16384)')
+    arg_parser.add_argument('-report', dest='report', action='store',
+            type=float, default=None, help='In tap mode, report forwarding '
+            + 'latency every REPORT seconds')
     settings = arg_parser.parse_args()
+    if not settings.tap and (settings.input_path is None
+            or settings.output_path is None):
+        arg_parser.error('-input and -output are required unless -tap is '
+                + 'given')
 
     # Load rdns
-    rdns = {}
+    rdns = None
     if settings.rdns_path is not None:
-        with open(settings.rdns_path, 'r') as rdnsfile:
+        with fileio.open(settings.rdns_path, 'r') as rdnsfile:
             rdns = nopticon.parse_rdns(rdnsfile.read())
 
-    # Open input and output streams
-    istream = open(settings.input_path, 'r')
-    ostream = open(settings.output_path, 'w')
-
-    # Modification-specific variables
-    if (settings.peerchange):
-        seen_peer_down = False
-        up_links = []
-        down_links = []
-
-    # Process input stream
-    for bmp_json in istream.readlines():
-        bmp_msg = bmp.parse_message(bmp_json.strip())
-        if (settings.peerchange and
-                (bmp_msg.isPeerUp() or bmp_msg.isPeerDown())): 
-
-            # Special flag to avoid inserting commands when network is still 
-            # starting
-            if (bmp_msg.isPeerDown()):
-                seen_peer_down = True
-
-            # Determine if link went up or down
-            edge = bmp_msg.edge()
-            if settings.rdns_path is not None:
-                assert edge[0] in rdns, "%s not in rdns" % edge[0]
-                assert edge[1] in rdns, "%s not in rdns" % edge[1]
-                edge = (rdns[edge[0]], rdns[edge[1]])
-            if (edge[1] < edge[0]):
-                edge = (edge[1], edge[0])
-            change = False
-            if (bmp_msg.isPeerUp() and edge not in up_links):
-                print('Up %s-%s' % edge)
-                up_links.append(edge)
-                if (edge in down_links):
-                    down_links.remove(edge)
-                change = True
-            elif (bmp_msg.isPeerDown() and edge not in down_links):
-                print('Down %s-%s' % edge)
-                down_links.append(edge)
-                if (edge in up_links):
-                    up_links.remove(edge)
-                change = True
-
-            # Write commands if a link changed state
-            if (seen_peer_down and change):
-                ostream.write(nopticon.Command.print_log().json()+'\n')
-                refresh = nopticon.Command.refresh_summary(bmp_msg._timestamp)
-                ostream.write(refresh.json()+'\n')
-        ostream.write(bmp_json)
-
-    if (settings.end):
-        ostream.write(nopticon.Command.print_log().json()+'\n')
-
-    # Close input and output streams
-    istream.close()
-    ostream.close()
+    injector = None
+    if (settings.tap and settings.peerchange):
+        # Keep stdout for the message stream
+        injector = CommandInjector(rdns,
+                lambda line: print(line, file=sys.stderr))
+    elif (settings.peerchange):
+        injector = CommandInjector(rdns)
+
+    if settings.tap:
+        try:
+            asyncio.run(tap(settings, injector))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Output stream is compressed if the path ends in .gz, .zst, .bz2 or .xz
+    lines = bmp.iter_lines(settings.input_path,
+            start_time=settings.start_time, end_time=settings.end_time)
+    with fileio.open(settings.output_path, 'wb') as ostream:
+        inject(lines, ostream, injector)
+        if (settings.end):
+            ostream.write(nopticon.Command.print_log().bytes())
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,150 @@
+"""
+Binary trie over IPv4 prefixes, keyed by (32-bit address, prefix length)
+like src/ip_prefix_tree.hh.  IPv6 prefixes are rejected.
+"""
+
+import ipaddress
+
+IPV4_WIDTH = 32
+
+def prefix_key(prefix):
+    """
+    Convert a prefix (ip_network, 'a.b.c.d/n' string or (address, length)
+    pair) to an (int address, length) pair with the host bits cleared
+    """
+    if isinstance(prefix, tuple):
+        addr, plen = prefix
+        if addr < 0 or addr >> IPV4_WIDTH:
+            raise ValueError('Invalid IPv4 address %d' % addr)
+    else:
+        if not isinstance(prefix, ipaddress.IPv4Network):
+            prefix = ipaddress.ip_network(prefix)
+        # Flows are 32-bit, so IPv6 prefixes can never match one
+        if prefix.version != 4:
+            raise ValueError('Only IPv4 prefixes are supported: %s' % prefix)
+        addr, plen = int(prefix.network_address), prefix.prefixlen
+    if plen < 0 or plen > IPV4_WIDTH:
+        raise ValueError('Invalid prefix length %d' % plen)
+    mask = ((1 << plen) - 1) << (IPV4_WIDTH - plen)
+    return (addr & mask, plen)
+
+def key_network(key):
+    """Convert an (int address, length) pair back to an ip_network"""
+    return ipaddress.ip_network(key)
+
+# Node fields
+_LEFT = 0
+_RIGHT = 1
+_KEY = 2
+_VALUE = 3
+
+_EMPTY = object()
+
+class IpPrefixTree:
+    """
+    Map from prefixes to values that supports exact, longest-prefix-match,
+    covered-by and covering queries in O(prefix length) steps (plus the
+    number of results)
+    """
+    def __init__(self):
+        self._root = [None, None, None, _EMPTY]
+        self._size = 0
+
+    def _bits(self, key):
+        addr, plen = key
+        for i in range(plen):
+            yield (addr >> (IPV4_WIDTH - 1 - i)) & 1
+
+    def _find_node(self, key):
+        node = self._root
+        for bit in self._bits(key):
+            node = node[bit]
+            if node is None:
+                return None
+        return node
+
+    def insert(self, prefix, value):
+        key = prefix_key(prefix)
+        node = self._root
+        for bit in self._bits(key):
+            if node[bit] is None:
+                node[bit] = [None, None, None, _EMPTY]
+            node = node[bit]
+        if node[_VALUE] is _EMPTY:
+            self._size += 1
+        node[_KEY] = key
+        node[_VALUE] = value
+
+    def setdefault(self, prefix, value):
+        """Return the value for prefix, inserting value if there is none"""
+        node = self._find_node(prefix_key(prefix))
+        if node is not None and node[_VALUE] is not _EMPTY:
+            return node[_VALUE]
+        self.insert(prefix, value)
+        return value
+
+    def find(self, prefix, default=None):
+        """Value stored for exactly prefix"""
+        node = self._find_node(prefix_key(prefix))
+        if node is None or node[_VALUE] is _EMPTY:
+            return default
+        return node[_VALUE]
+
+    def __contains__(self, prefix):
+        return self.find(prefix, _EMPTY) is not _EMPTY
+
+    def __len__(self):
+        return self._size
+
+    def longest_match(self, prefix):
+        """(key, value) of the longest stored prefix containing prefix"""
+        node = self._root
+        match = None
+        if node[_VALUE] is not _EMPTY:
+            match = node
+        for bit in self._bits(prefix_key(prefix)):
+            node = node[bit]
+            if node is None:
+                break
+            if node[_VALUE] is not _EMPTY:
+                match = node
+        if match is None:
+            return None
+        return (match[_KEY], match[_VALUE])
+
+    def covering(self, prefix):
+        """(key, value) of all stored prefixes containing prefix, shortest
+        first"""
+        node = self._root
+        result = []
+        if node[_VALUE] is not _EMPTY:
+            result.append((node[_KEY], node[_VALUE]))
+        for bit in self._bits(prefix_key(prefix)):
+            node = node[bit]
+            if node is None:
+                break
+            if node[_VALUE] is not _EMPTY:
+                result.append((node[_KEY], node[_VALUE]))
+        return result
+
+    def covered_by(self, prefix):
+        """(key, value) of all stored prefixes contained in prefix"""
+        node = self._find_node(prefix_key(prefix))
+        if node is None:
+            return []
+        return list(self._iter_subtree(node))
+
+    def _iter_subtree(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node[_VALUE] is not _EMPTY:
+                yield (node[_KEY], node[_VALUE])
+            if node[_RIGHT] is not None:
+                stack.append(node[_RIGHT])
+            if node[_LEFT] is not None:
+                stack.append(node[_LEFT])
+
+    def items(self):
+        """(key, value) of all stored prefixes in address order"""
+        return self._iter_subtree(self._root)
@@ -0,0 +1,45 @@
+"""
+JSON decoding shared by the Nopticon scripts.  Uses the fastest decoder that
+is installed (orjson, then ujson, then the standard library); all of them
+accept bytes as well as str, so lines read in binary mode are decoded
+without a separate str decode step.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Available decoders, fastest first
+BACKENDS = {}
+if orjson is not None:
+    BACKENDS['orjson'] = orjson.loads
+if ujson is not None:
+    BACKENDS['ujson'] = ujson.loads
+BACKENDS['json'] = json.loads
+
+BACKEND = next(iter(BACKENDS))
+_loads = BACKENDS[BACKEND]
+
+def use(backend):
+    """Select the decoder by name (one of BACKENDS)"""
+    global BACKEND, _loads
+    if backend not in BACKENDS:
+        raise ValueError('JSON backend %s is not available' % backend)
+    BACKEND = backend
+    _loads = BACKENDS[backend]
+
+def loads(data):
+    """
+    Decode a JSON document from bytes or str.  There is no object_hook: the
+    fast decoders do not support one, so callers convert decoded values
+    themselves, visiting only the parts they need.
+    """
+    return _loads(data)
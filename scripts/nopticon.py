@@ -2,49 +2,618 @@
 Python classes for Nopticon
 """
 
+from array import array
+from collections.abc import Mapping
 from enum import Enum
+from ip_prefix_tree import IpPrefixTree, prefix_key
+from types import MappingProxyType
+import bisect
+import fileio
+import functools
+import hashlib
 import ipaddress
 import json
+import jsonio
+import math
+import mmap
+import numpy as np
+import os
+import sys
+import weakref
+
+# Maximum number of ranks per edge written by gobgp-analysis (rank-0..rank-9)
+MAX_SPANS = 10
 
 class ReachSummary:
+    """
+    Reach summary stored column-wise: node names are interned to small ints,
+    flows are IPv4 (network, prefixlen) integer pairs, and the edges of all
+    flows are kept in CSR form with one NumPy column per attribute.  Ranks
+    are rounded to `sigfigs` once, at load time.
+    """
     def __init__(self, summary_json, sigfigs=8):
-        self._summary = json.loads(summary_json)
         self._sigfigs = sigfigs
+        summary = _load_summary(summary_json)
+        self._set_columns(_reach_columns(summary['reach-summary'], sigfigs))
 
-        # Extract edges
-        self._edges = {}
-        for flow in self._summary['reach-summary']:
-            flow_prefix = ipaddress.ip_network(flow['flow'])
-            flow_edges = {}
-            for edge_details in flow['edges']:
-                edge = (edge_details['source'], edge_details['target'])
-                flow_edges[edge] = edge_details
-            self._edges[flow_prefix] = flow_edges
+    @classmethod
+    def _from_columns(cls, columns, sigfigs):
+        obj = cls.__new__(cls)
+        obj._sigfigs = sigfigs
+        obj._set_columns(columns)
+        return obj
+
+    @classmethod
+    def load(cls, summary_path, sigfigs=8, cache_dir=None):
+        """
+        Load a summary file.  If cache_dir is given, the summary's binary
+        cache (see to_cache) in that directory is reused if it was built
+        from the same file contents with the same sigfigs, and (re)built
+        otherwise; the file is only rehashed if its size or modification
+        time differ from when the cache was built.
+        """
+        if cache_dir is None:
+            with fileio.open(summary_path, 'rb') as sf:
+                return cls(sf.read(), sigfigs)
+
+        cache_path = _cache_path(cache_dir, summary_path, sigfigs)
+        stat = os.stat(summary_path)
+        source_hash = None
+        if os.path.exists(cache_path):
+            try:
+                header = _read_cache_header(cache_path)[0]
+                if header['sigfigs'] == sigfigs:
+                    if (header['source-size'] == stat.st_size
+                            and header['source-mtime'] == stat.st_mtime_ns):
+                        return cls.from_cache(cache_path)
+                    source_hash = _file_hash(summary_path)
+                    if header['source-hash'] == source_hash:
+                        return cls.from_cache(cache_path)
+            except (OSError, ValueError, KeyError):
+                pass
+
+        if source_hash is None:
+            source_hash = _file_hash(summary_path)
+        with fileio.open(summary_path, 'rb') as sf:
+            summary = cls(sf.read(), sigfigs)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            summary.to_cache(cache_path, source_hash, stat.st_size,
+                    stat.st_mtime_ns)
+        except OSError:
+            pass
+        return summary
+
+    def to_cache(self, cache_path, source_hash='', source_size=None,
+            source_mtime=None):
+        """
+        Write the summary's columns to a binary cache file: a JSON header
+        followed by the string table, flow arrays and CSR edge, rank and
+        history arrays, each 8-byte aligned so from_cache can map them.
+        The hash, size and modification time (in ns) of the summary file
+        are recorded in the header, for load to check.
+        """
+        names = [str(name) for name in self._nodes]
+        encoded = [name.encode('utf-8') for name in names]
+        sections = {
+            'node-names' : np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'node-offsets' : np.cumsum([0] + [len(name) for name in encoded],
+                    dtype=np.int64),
+            'flow-addrs' : self._flow_addrs,
+            'flow-lens' : self._flow_lens,
+            'edge-offsets' : self._edge_offsets,
+            'sources' : self._sources,
+            'targets' : self._targets,
+            'can-be-direct' : self._can_be_direct,
+            'ranks' : self._ranks,
+        }
+        if self._history_offsets is not None:
+            sections['history-offsets'] = self._history_offsets
+            sections['history'] = self._history
+
+        header = {'version' : _CACHE_VERSION,
+                'source-hash' : source_hash,
+                'source-size' : source_size,
+                'source-mtime' : source_mtime,
+                'sigfigs' : self._sigfigs,
+                'int-nodes' : all(isinstance(name, int)
+                        for name in self._nodes) and len(self._nodes) > 0,
+                'sections' : {}}
+        offset = 0
+        for name, values in sections.items():
+            header['sections'][name] = {'dtype' : values.dtype.str,
+                    'shape' : list(values.shape), 'offset' : offset}
+            offset += _align(values.nbytes)
+        header_bytes = json.dumps(header).encode('utf-8')
+        data_start = _align(len(_CACHE_MAGIC) + 8 + len(header_bytes))
+
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        with open(tmp_path, 'wb') as cf:
+            cf.write(_CACHE_MAGIC)
+            cf.write(len(header_bytes).to_bytes(8, 'little'))
+            cf.write(header_bytes)
+            cf.write(b'\0' * (data_start - cf.tell()))
+            for values in sections.values():
+                data = np.ascontiguousarray(values).tobytes()
+                cf.write(data)
+                cf.write(b'\0' * (_align(len(data)) - len(data)))
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def from_cache(cls, cache_path):
+        """
+        Open a binary cache written by to_cache; the columns are read-only
+        views of the memory-mapped file, so only the node names are decoded
+        """
+        header, data_start = _read_cache_header(cache_path)
+        with open(cache_path, 'rb') as cf:
+            mm = mmap.mmap(cf.fileno(), 0, access=mmap.ACCESS_READ)
+        arrays = {}
+        for name, section in header['sections'].items():
+            dtype = np.dtype(section['dtype'])
+            count = int(np.prod(section['shape']))
+            arrays[name] = np.frombuffer(mm, dtype=dtype, count=count,
+                    offset=data_start + section['offset']).reshape(
+                            section['shape'])
+
+        names = arrays['node-names'].tobytes()
+        offsets = arrays['node-offsets'].tolist()
+        nodes = [names[lo:hi].decode('utf-8')
+                for lo, hi in zip(offsets[:-1], offsets[1:])]
+        if header['int-nodes']:
+            nodes = [int(name) for name in nodes]
+
+        columns = {'nodes' : nodes,
+                'flow_addrs' : arrays['flow-addrs'],
+                'flow_lens' : arrays['flow-lens'],
+                'edge_offsets' : arrays['edge-offsets'],
+                'sources' : arrays['sources'],
+                'targets' : arrays['targets'],
+                'can_be_direct' : arrays['can-be-direct'],
+                'ranks' : arrays['ranks'],
+                'history_offsets' : arrays.get('history-offsets'),
+                'history' : arrays.get('history')}
+        return cls._from_columns(columns, header['sigfigs'])
+
+    def _set_columns(self, columns):
+        self._nodes = columns['nodes']
+        self._node_ids = {name : nid for nid, name in enumerate(self._nodes)}
+        self._flow_addrs = columns['flow_addrs']
+        self._flow_lens = columns['flow_lens']
+        self._edge_offsets = columns['edge_offsets']
+        self._sources = columns['sources']
+        self._targets = columns['targets']
+        self._can_be_direct = columns['can_be_direct']
+        self._ranks = columns['ranks']
+        self._history_offsets = columns['history_offsets']
+        self._history = columns['history']
+
+        # Lookup structures are built on first use
+        self._flow_ids = None
+        self._flow_tree = None
+        self._edge_ids = None
+        self._flowedges = None
+        self._flow_of_edge = None
+        self._rank_tables = {}
+        self._details = {}
+
+    def _get_flow_ids(self):
+        if self._flow_ids is None:
+            self._flow_ids = {
+                ipaddress.ip_network((int(addr), int(plen)))
+                : fid for fid, (addr, plen)
+                in enumerate(zip(self._flow_addrs, self._flow_lens))}
+        return self._flow_ids
+
+    def _get_edge_ids(self):
+        if self._edge_ids is None:
+            num_nodes = len(self._nodes)
+            flow_of_edge = self._get_flow_of_edge()
+            keys = ((flow_of_edge * num_nodes + self._sources) * num_nodes
+                    + self._targets)
+            self._edge_ids = dict(zip(keys.tolist(), range(len(keys))))
+        return self._edge_ids
+
+    def _get_flow_of_edge(self):
+        if self._flow_of_edge is None:
+            counts = np.diff(self._edge_offsets)
+            self._flow_of_edge = np.repeat(
+                    np.arange(len(counts), dtype=np.int64), counts)
+        return self._flow_of_edge
+
+    def _flow_id(self, flow):
+        return self._get_flow_ids().get(flow)
+
+    def _get_flow_tree(self):
+        if self._flow_tree is None:
+            self._flow_tree = _flow_tree(self.get_flows())
+        return self._flow_tree
+
+    def match_flows(self, prefix):
+        """Flows that a policy on prefix applies to; see _match_flows"""
+        return _match_flows(self._get_flow_tree(), prefix)
+
+    def get_edge_id(self, flow, edge):
+        """Index of (flow, edge) in the per-edge columns, or None"""
+        fid = self._flow_id(flow)
+        if fid is None:
+            return None
+        return self._edge_id(fid, edge)
+
+    def _edge_id(self, fid, edge):
+        sid = self._node_ids.get(edge[0])
+        tid = self._node_ids.get(edge[1])
+        if sid is None or tid is None:
+            return None
+        num_nodes = len(self._nodes)
+        return self._get_edge_ids().get((fid * num_nodes + sid) * num_nodes
+                + tid)
 
     def get_flows(self):
-        return self._edges.keys()
+        return self._get_flow_ids().keys()
 
     def get_edges(self, flow):
-        if flow not in self._edges:
+        fid = self._flow_id(flow)
+        if fid is None:
             return {}
-        return self._edges[flow]
+        return FlowEdges(self, fid)
 
-    def get_edge_rank(self, flow, edge):
-        if edge not in self.get_edges(flow):
+    def get_edge_rank(self, flow, edge, span=0):
+        eid = self.get_edge_id(flow, edge)
+        if eid is None:
             return None
-        return round(self.get_edges(flow)[edge]['rank-0'], self._sigfigs)
+        return float(self._ranks[eid, span])
+
+    def get_num_spans(self):
+        """Number of ranks (rank-0, rank-1, ...) recorded per edge"""
+        return self._ranks.shape[1]
+
+    def get_rank_matrix(self):
+        """
+        Ranks of all edges as a (flowedge x span) array; row i belongs to
+        get_flowedges()[i] and missing ranks are NaN
+        """
+        ranks = self._ranks.view()
+        ranks.flags.writeable = False
+        return ranks
+
+    def get_threshold_masks(self, threshold):
+        """(flowedge x span) boolean array of ranks >= threshold"""
+        with np.errstate(invalid='ignore'):
+            return self._ranks >= threshold
+
+    def get_flow_signatures(self, threshold=None, span=0, quantize=None,
+            exact=False):
+        """
+        Canonical signature (bytes) of every flow, in get_flows() order:
+        its sorted edges as interned (source, target, can-be-direct) ids.
+        Flows with equal signatures have the same edges.
+          - threshold: only edges whose rank-<span> >= threshold count
+          - quantize: also include every rank, rounded to a multiple of
+            1/quantize (missing ranks are -1)
+          - exact: also include every rank and the edge histories as they
+            are, so flows with equal signatures have equal get_edges()
+        """
+        num_nodes = len(self._nodes)
+        keys = ((self._sources.astype(np.int64) * num_nodes + self._targets)
+                * 2 + self._can_be_direct)
+        flow_of_edge = self._get_flow_of_edge()
+        selected = np.arange(len(keys))
+        if threshold is not None:
+            selected = np.flatnonzero(
+                    self.get_threshold_masks(threshold)[:, span])
+
+        # Sort edges by flow, then key, so each flow's edges are a
+        # contiguous, canonically ordered run
+        order = selected[np.lexsort((keys[selected],
+            flow_of_edge[selected]))]
+        columns = [keys[order]]
+        if quantize is not None:
+            levels = np.rint(self._ranks[order] * quantize)
+            levels[np.isnan(levels)] = -1
+            columns.append(levels.astype(np.int64))
+        bounds = np.searchsorted(flow_of_edge[order],
+                np.arange(len(self._edge_offsets)))
+        num_flows = len(self._edge_offsets) - 1
+        histories = None
+        if exact:
+            # Adding 0.0 turns -0.0 into 0.0, and every NaN (missing rank)
+            # is stored with the same bits
+            ranks = self._ranks[order] + 0.0
+            ranks[np.isnan(ranks)] = np.nan
+            columns.append(ranks.view(np.int64))
+            if self._history_offsets is not None:
+                starts = self._history_offsets[order]
+                lengths = self._history_offsets[order + 1] - starts
+                columns.append(lengths)
+                # Histories of the edges in order, and where each flow's
+                # begin
+                ends = np.cumsum(lengths)
+                histories = self._history[np.repeat(starts - ends + lengths,
+                    lengths) + np.arange(ends[-1] if len(ends) else 0)]
+                history_bounds = np.concatenate(([0], ends))[bounds]
+        rows = np.column_stack(columns)
+        if histories is None:
+            return [rows[bounds[fid]:bounds[fid+1]].tobytes()
+                    for fid in range(num_flows)]
+        return [rows[bounds[fid]:bounds[fid+1]].tobytes()
+                + histories[history_bounds[fid]:history_bounds[fid+1]].tobytes()
+                for fid in range(num_flows)]
+
+    def get_rank_deltas(self, from_span, to_span):
+        """Per-flowedge change in rank from from_span to to_span"""
+        return self._ranks[:, to_span] - self._ranks[:, from_span]
+
+    def get_span_instability(self):
+        """
+        (flow x span) array with the mean absolute rank change of a flow's
+        edges between each span and its adjacent spans
+        """
+        num_spans = self.get_num_spans()
+        counts = np.diff(self._edge_offsets)
+        flow_of_edge = self._get_flow_of_edge()
+        deltas = np.abs(np.diff(self._ranks, axis=1))
+        deltas[np.isnan(deltas)] = 0.0
+        per_span = np.zeros(self._ranks.shape)
+        per_span[:, 1:] += deltas
+        per_span[:, :-1] += deltas
+        neighbours = np.full(num_spans, 2.0)
+        neighbours[0] = neighbours[-1] = 1.0
+        per_span /= neighbours
+        instability = np.zeros((len(counts), num_spans))
+        np.add.at(instability, flow_of_edge, per_span)
+        return instability / np.maximum(counts, 1)[:, np.newaxis]
+
+    def get_most_stable_spans(self):
+        """
+        Dict from flow to the span whose ranks change least relative to its
+        adjacent spans (ties go to the shorter span)
+        """
+        spans = np.argmin(self.get_span_instability(), axis=1)
+        return dict(zip(self.get_flows(), spans.tolist()))
 
     def get_edge_history(self, flow, edge):
-        if edge not in self.get_edges(flow):
+        eid = self.get_edge_id(flow, edge)
+        if eid is None:
             return None
-        return self.get_edges(flow)[edge]['history']
+        return self.get_history_by_id(eid)
+
+    def get_history_by_id(self, eid):
+        """History of the edge with id eid (see get_edge_id), if recorded"""
+        if self._history_offsets is None:
+            return None
+        lo, hi = self._history_offsets[eid], self._history_offsets[eid+1]
+        return self._history[lo:hi].tolist()
+
+    def get_rank_table(self, span=0):
+        """RankTable for this summary's rank-<span> column, built once"""
+        if span not in self._rank_tables:
+            self._rank_tables[span] = RankTable(self, span)
+        return self._rank_tables[span]
 
     def get_flowedges(self):
-        return [(f,e) for f in self.get_flows() for e in self.get_edges(f)]
+        if self._flowedges is None:
+            nodes = self._nodes
+            flows = list(self.get_flows())
+            self._flowedges = [(flows[fid], (nodes[s], nodes[t]))
+                    for fid in range(len(flows))
+                    for s, t in zip(*self._flow_slice(fid))]
+        return self._flowedges
+
+    def _flow_slice(self, fid):
+        lo, hi = self._edge_offsets[fid], self._edge_offsets[fid+1]
+        return (self._sources[lo:hi].tolist(), self._targets[lo:hi].tolist())
+
+    def _edge_details(self, eid):
+        """Read-only details of an edge, built on first access"""
+        details = self._details.get(eid)
+        if details is None:
+            details = MappingProxyType(self._build_edge_details(eid))
+            self._details[eid] = details
+        return details
+
+    def _build_edge_details(self, eid):
+        details = {'source' : self._nodes[self._sources[eid]],
+                'target' : self._nodes[self._targets[eid]],
+                'can-be-direct' : bool(self._can_be_direct[eid])}
+        for span, rank in enumerate(self._ranks[eid].tolist()):
+            if not math.isnan(rank):
+                details['rank-%d' % span] = rank
+        history = self.get_history_by_id(eid)
+        if history is not None:
+            details['history'] = history
+        return details
+
+_CACHE_MAGIC = b'NOPTRSC\0'
+_CACHE_VERSION = 3
+
+def _align(nbytes, alignment=8):
+    return (nbytes + alignment - 1) // alignment * alignment
+
+def _cache_path(cache_dir, summary_path, sigfigs):
+    # Summaries with the same name in different directories get different
+    # caches
+    path_hash = hashlib.blake2b(os.path.abspath(summary_path).encode('utf-8'),
+            digest_size=8).hexdigest()
+    return os.path.join(cache_dir, '%s.%s.%d.cache' % (
+        os.path.basename(summary_path), path_hash, sigfigs))
+
+def _file_hash(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_cache_header(cache_path):
+    """Return the JSON header of a cache file and where its data starts"""
+    with open(cache_path, 'rb') as cf:
+        if cf.read(len(_CACHE_MAGIC)) != _CACHE_MAGIC:
+            raise ValueError('%s is not a reach summary cache' % cache_path)
+        header_len = int.from_bytes(cf.read(8), 'little')
+        header = json.loads(cf.read(header_len).decode('utf-8'))
+    if header['version'] != _CACHE_VERSION:
+        raise ValueError('Unsupported cache version %d' % header['version'])
+    return header, _align(len(_CACHE_MAGIC) + 8 + header_len)
+
+class RankTable:
+    """
+    Position of every edge's rank among the distinct ranks of its flow
+    (1 = highest) and the corresponding percentile, computed for all flows
+    of a ReachSummary at once.  Edges without a rank for the span are left
+    out of the distinct ranks, and have position and percentile -1.
+    """
+    def __init__(self, summary, span=0):
+        self._summary = summary
+        self._ranks = summary._ranks[:, span]
+
+        counts = np.diff(summary._edge_offsets)
+        flow_of_edge = summary._get_flow_of_edge()
+
+        # Sort ranked edges by flow, then by descending rank
+        ranked = np.flatnonzero(~np.isnan(self._ranks))
+        order = ranked[np.lexsort((-self._ranks[ranked],
+            flow_of_edge[ranked]))]
+        sorted_ranks = self._ranks[order]
+        sorted_flows = flow_of_edge[order]
+
+        # Number distinct ranks consecutively within each flow
+        new_flow = np.ones(len(order), dtype=np.bool_)
+        new_flow[1:] = sorted_flows[1:] != sorted_flows[:-1]
+        new_rank = new_flow.copy()
+        new_rank[1:] |= sorted_ranks[1:] != sorted_ranks[:-1]
+        distinct = np.cumsum(new_rank)
+        first = np.flatnonzero(new_flow)
+        base = np.zeros(len(counts), dtype=np.int64)
+        base[sorted_flows[first]] = distinct[first] - 1
+        positions = distinct - base[sorted_flows]
+
+        num_distinct = np.zeros(len(counts), dtype=np.int64)
+        np.maximum.at(num_distinct, sorted_flows, positions)
+
+        self._positions = np.full(len(self._ranks), -1, dtype=np.int64)
+        self._positions[order] = positions
+        self._percentiles = np.full(len(self._ranks), -1.0)
+        self._percentiles[order] = (positions / num_distinct[sorted_flows]
+                * 100)
+
+    def get(self, eid):
+        """(rank, position, percentile) of the edge with id eid"""
+        return (float(self._ranks[eid]), int(self._positions[eid]),
+                float(self._percentiles[eid]))
+
+    def get_many(self, eids):
+        """Ranks, positions and percentiles (as arrays) of many edges"""
+        eids = np.asarray(eids, dtype=np.int64)
+        return (self._ranks[eids], self._positions[eids],
+                self._percentiles[eids])
+
+    def lookup(self, flow, edge):
+        """(rank, position, percentile) of edge in flow, or None"""
+        eid = self._summary.get_edge_id(flow, edge)
+        if eid is None:
+            return None
+        return self.get(eid)
+
+class FlowEdges(Mapping):
+    """
+    Read-only view of the edges of one flow in a ReachSummary, mapping
+    (source, target) to the edge's details (a read-only mapping)
+    """
+    def __init__(self, summary, fid):
+        self._summary = summary
+        self._fid = fid
+
+    def __getitem__(self, edge):
+        eid = self._summary._edge_id(self._fid, edge)
+        if eid is None:
+            raise KeyError(edge)
+        return self._summary._edge_details(eid)
+
+    def __contains__(self, edge):
+        return self._summary._edge_id(self._fid, edge) is not None
+
+    def __iter__(self):
+        nodes = self._summary._nodes
+        for s, t in zip(*self._summary._flow_slice(self._fid)):
+            yield (nodes[s], nodes[t])
+
+    def __len__(self):
+        offsets = self._summary._edge_offsets
+        return int(offsets[self._fid+1] - offsets[self._fid])
+
+def _reach_columns(reach_summary, sigfigs):
+    """
+    Convert the 'reach-summary' section of a summary to columns.  A flow
+    (or an edge of a flow) listed more than once keeps its first position
+    and its last details.  Flows must be IPv4 prefixes.
+    """
+    nodes = []
+    node_ids = {}
+    def intern(name):
+        nid = node_ids.get(name)
+        if nid is None:
+            nid = node_ids[name] = len(nodes)
+            nodes.append(name)
+        return nid
+
+    flow_addrs = array('L')
+    flow_lens = array('B')
+    edge_offsets = array('q', [0])
+    sources = array('l')
+    targets = array('l')
+    can_be_direct = array('b')
+    ranks = array('d')
+    num_spans = 1
+    history_offsets = array('q', [0])
+    history = array('Q')
+    has_history = False
+    rank_keys = ['rank-%d' % span for span in range(MAX_SPANS)]
+    nan = float('nan')
+    flows = {}
+    for flow in reach_summary:
+        flow_prefix = ipaddress.ip_network(flow['flow'])
+        if flow_prefix.version != 4:
+            raise ValueError('Flow %s is not an IPv4 prefix' % flow_prefix)
+        flows[flow_prefix] = flow['edges']
+    for flow_prefix, flow_edges in flows.items():
+        flow_addrs.append(int(flow_prefix.network_address))
+        flow_lens.append(flow_prefix.prefixlen)
+        flow_edges = {(edge_details['source'], edge_details['target'])
+                : edge_details for edge_details in flow_edges}
+        for edge_details in flow_edges.values():
+            sources.append(intern(edge_details['source']))
+            targets.append(intern(edge_details['target']))
+            can_be_direct.append(edge_details.get('can-be-direct', False))
+            for span, key in enumerate(rank_keys):
+                if key in edge_details:
+                    ranks.append(round(edge_details[key], sigfigs))
+                    num_spans = max(num_spans, span + 1)
+                else:
+                    ranks.append(nan)
+            if 'history' in edge_details:
+                has_history = True
+                history.extend(edge_details['history'])
+            history_offsets.append(len(history))
+        edge_offsets.append(len(sources))
+
+    ranks = np.frombuffer(ranks, dtype=np.float64).reshape(-1, MAX_SPANS)
+    return {'nodes' : nodes,
+            'flow_addrs' : np.array(flow_addrs, dtype=np.uint32),
+            'flow_lens' : np.frombuffer(flow_lens, dtype=np.uint8),
+            'edge_offsets' : np.frombuffer(edge_offsets, dtype=np.int64),
+            'sources' : np.array(sources, dtype=np.int32),
+            'targets' : np.array(targets, dtype=np.int32),
+            'can_be_direct' : np.frombuffer(can_be_direct, dtype=np.bool_),
+            'ranks' : np.ascontiguousarray(ranks[:, :num_spans]),
+            'history_offsets' : (np.frombuffer(history_offsets, dtype=np.int64)
+                    if has_history else None),
+            'history' : (np.frombuffer(history, dtype=np.uint64)
+                    if has_history else None)}
 
 class LinkSummary:
     def __init__(self, summary_json):
-        self._summary = json.loads(summary_json)
+        self._summary = _load_summary(summary_json)
 
         self._links = {}
         for flow in self._summary['flows']:
@@ -53,6 +622,7 @@ class LinkSummary:
             for link in flow['links']:
                 flow_links[link['source']] = link['target']
             self._links[flow_prefix] = flow_links
+        self._flow_tree = None
 
     def get_flows(self):
         return self._links.keys()
@@ -67,6 +637,116 @@ class LinkSummary:
             return []
         return self.get_links(flow)[source]
 
+    def match_flows(self, prefix):
+        """Flows that a policy on prefix applies to; see _match_flows"""
+        if self._flow_tree is None:
+            self._flow_tree = _flow_tree(self.get_flows())
+        return _match_flows(self._flow_tree, prefix)
+
+def _flow_tree(flows):
+    tree = IpPrefixTree()
+    for flow in flows:
+        tree.insert(flow, flow)
+    return tree
+
+def _match_flows(tree, prefix):
+    """
+    Match a (policy) prefix against the flows in a prefix tree: the flow for
+    exactly prefix if there is one, otherwise all flows contained in prefix,
+    otherwise the longest flow containing prefix
+    """
+    flow = tree.find(prefix)
+    if flow is not None:
+        return [flow]
+    covered = tree.covered_by(prefix)
+    if covered:
+        return [flow for _, flow in covered]
+    longest = tree.longest_match(prefix)
+    if longest is not None:
+        return [longest[1]]
+    return []
+
+def _load_summary(summary_json):
+    """Accept a summary as a JSON string or an already decoded dict"""
+    if isinstance(summary_json, (str, bytes, bytearray)):
+        return jsonio.loads(summary_json)
+    return summary_json
+
+# Keys that give a summary its shape; these are never projected away
+_STRUCTURAL_KEYS = frozenset(['flow', 'edges', 'links', 'source', 'target'])
+
+def summary_filter(fields=None, flows=None, min_rank=None):
+    """
+    Function that filters a decoded summary in place and returns it, or None
+    if there is nothing to filter (see iter_summaries).  Only the sections,
+    flows and edges of the summary are visited; the values of other keys
+    (such as edge histories) are kept or dropped without being walked.
+    """
+    if fields is None and flows is None and min_rank is None:
+        return None
+    keep = None
+    if fields is not None:
+        keep = _STRUCTURAL_KEYS.union(fields)
+    if flows is not None:
+        flows = set(str(ipaddress.ip_network(flow)) for flow in flows)
+
+    # Keys seen so far that are not kept; objects at the same level nearly
+    # always have the same keys, so popping these is cheaper than building
+    # a projected copy of each object
+    drop = []
+
+    def project(obj):
+        if keep is None:
+            return
+        for key in drop:
+            obj.pop(key, None)
+        if not keep.issuperset(obj):
+            for key in [key for key in obj if key not in keep]:
+                drop.append(key)
+                del obj[key]
+
+    def keep_edge(edge):
+        return min_rank is None or edge.get('rank-0', min_rank) >= min_rank
+
+    def apply(summary):
+        project(summary)
+        for section in ('reach-summary', 'flows'):
+            if not isinstance(summary.get(section), list):
+                continue
+            if flows is not None:
+                summary[section] = [flow for flow in summary[section]
+                        if flow.get('flow') in flows]
+            for flow in summary[section]:
+                project(flow)
+                for key in ('edges', 'links'):
+                    if key not in flow:
+                        continue
+                    if min_rank is not None:
+                        flow[key] = [edge for edge in flow[key]
+                                if keep_edge(edge)]
+                    for edge in flow[key]:
+                        project(edge)
+        return summary
+
+    return apply
+
+def iter_summaries(path, fields=None, flows=None, min_rank=None):
+    """
+    Iterate over the summaries in a file with one JSON summary per line,
+    yielding a dict per summary that can be passed to ReachSummary or
+    LinkSummary.  Each line is filtered as soon as it is decoded:
+      - fields: keys to keep, e.g. ['reach-summary', 'rank-0']; other keys
+        (such as 'history' or 'path-preferences') are dropped
+      - flows: prefixes to keep; other flows are dropped
+      - min_rank: reach-summary edges whose rank-0 is lower are dropped
+    """
+    apply = summary_filter(fields, flows, min_rank)
+    with fileio.open(path, 'rb') as sf:
+        for summary_json in sf:
+            if summary_json.strip():
+                summary = jsonio.loads(summary_json)
+                yield summary if apply is None else apply(summary)
+
 class CommandType(Enum):
     PRINT_LOG = 0
     RESET_NETWORK_SUMMARY = 1
@@ -82,6 +762,10 @@ class Command():
             cmd['Command']['Timestamp'] = self._timestamp
         return json.dumps(cmd)
 
+    def bytes(self):
+        """Command as a newline-terminated line for a binary stream"""
+        return (self.json() + '\n').encode('utf-8')
+
     @classmethod
     def print_log(cls):
         return cls(CommandType.PRINT_LOG)
@@ -96,25 +780,112 @@ class Command():
         obj._timestamp = timestamp
         return obj
 
-"""Convert policies JSON to a list of Policy objects"""
-def parse_policies(policies_json):
-    policies_dict = json.loads(policies_json)
+"""Convert policies JSON to a list (or PolicySet) of Policy objects"""
+def parse_policies(policies_json, as_set=False):
+    policies_dict = jsonio.loads(policies_json)
     policies = []
     for policy_dict in policies_dict['policies']:
         if policy_dict['type'] == PolicyType.REACHABILITY.value:
             policies.append(ReachabilityPolicy(policy_dict))
         elif policy_dict['type'] == PolicyType.PATH_PREFERENCE.value:
             policies.append(PathPreferencePolicy(policy_dict))
+    if as_set:
+        return PolicySet(policies)
     return policies
 
+class PolicySet:
+    """
+    Set of policies with hash indexes by flow, (flow, source) and
+    (flow, target), giving O(1) membership tests and per-flow and per-node
+    slices.  Iteration follows insertion order.  The number of times each
+    policy was added is kept, so that metrics over the list of policies a
+    set was built from (which may repeat policies, e.g. after coercing
+    path preferences) can divide by total() rather than len().
+    """
+    def __init__(self, policies=()):
+        self._policies = {} # Policy -> times added
+        self._total = 0
+        self._by_flow = {}
+        self._by_source = {}
+        self._by_target = {}
+        for policy in policies:
+            self.add(policy)
+
+    def add(self, policy):
+        self._total += 1
+        if policy in self._policies:
+            self._policies[policy] += 1
+            return
+        self._policies[policy] = 1
+        flow = policy.flow()
+        source, target = policy.endpoints()
+        self._by_flow.setdefault(flow, []).append(policy)
+        self._by_source.setdefault((flow, source), []).append(policy)
+        self._by_target.setdefault((flow, target), []).append(policy)
+
+    def __contains__(self, policy):
+        return policy in self._policies
+
+    def __iter__(self):
+        return iter(self._policies)
+
+    def __len__(self):
+        return len(self._policies)
+
+    def count(self, policy):
+        """Number of times policy was added"""
+        return self._policies.get(policy, 0)
+
+    def total(self):
+        """Number of policies added, counting repeats"""
+        return self._total
+
+    def get_flows(self):
+        return self._by_flow.keys()
+
+    def get_flow_policies(self, flow):
+        return self._by_flow.get(flow, [])
+
+    def get_source_policies(self, flow, source):
+        return self._by_source.get((flow, source), [])
+
+    def get_target_policies(self, flow, target):
+        return self._by_target.get((flow, target), [])
+
 class PolicyType(Enum):
     REACHABILITY = "reachability"
     PATH_PREFERENCE = "path-preference"
 
+# Flows and node names shared by all policies, so that millions of policies
+# over the same flows and nodes do not each carry their own copies.  Flows
+# (keyed by themselves and by their strings) are dropped from the table once
+# no policy uses them.
+_interned_flows = weakref.WeakValueDictionary()
+
+def _flow_intern_key(flow):
+    # Keys must not refer to the interned network, or it is never released
+    if isinstance(flow, str):
+        return flow
+    return (flow.network_address, flow.prefixlen)
+
+def _intern_flow(flow):
+    interned = _interned_flows.get(_flow_intern_key(flow))
+    if interned is None:
+        network = ipaddress.ip_network(flow)
+        interned = _interned_flows.setdefault(_flow_intern_key(network),
+                network)
+        _interned_flows[_flow_intern_key(flow)] = interned
+    return interned
+
+def _intern_name(name):
+    return sys.intern(name) if isinstance(name, str) else name
+
 class Policy:
+    __slots__ = ('_type', '_flow', '_hash')
+
     def __init__(self, typ, policy_dict):
         self._type = typ
-        self._flow = ipaddress.ip_network(policy_dict['flow'])
+        self._flow = _intern_flow(policy_dict['flow'])
 
     def isType(self, typ):
         return self._type == typ
@@ -122,22 +893,45 @@ class Policy:
     def flow(self):
         return self._flow
 
+    def flow_key(self):
+        """Flow as an (int address, prefix length) pair"""
+        return prefix_key(self._flow)
+
 class ReachabilityPolicy(Policy):
+    __slots__ = ('_source', '_target')
+
     def __init__(self, policy_dict):
         super().__init__(PolicyType.REACHABILITY, policy_dict)
-        self._source = policy_dict['source']
-        self._target = policy_dict['target']
+        self._source = _intern_name(policy_dict['source'])
+        self._target = _intern_name(policy_dict['target'])
+        self._hash = hash((self._flow, self._source, self._target))
+
+    @classmethod
+    def from_edge(cls, flow, edge):
+        """Policy for edge in flow, without building a policy dict"""
+        obj = cls.__new__(cls)
+        obj._type = PolicyType.REACHABILITY
+        obj._flow = _intern_flow(flow)
+        obj._source = _intern_name(edge[0])
+        obj._target = _intern_name(edge[1])
+        obj._hash = hash((obj._flow, obj._source, obj._target))
+        return obj
 
     def edge(self):
         return (self._source, self._target)
 
+    def endpoints(self):
+        return (self._source, self._target)
+
     def __str__(self):
         return '%s %s->%s' % (self._flow, self._source, self._target)
 
     def __hash__(self):
-        return hash((self._flow, self._source, self._target))
+        return self._hash
 
     def __eq__(self, other):
+        if not isinstance(other, ReachabilityPolicy):
+            return NotImplemented
         return ((self._flow, self._source, self._target)
                 == (other._flow, other._source, other._target))
 
@@ -150,12 +944,15 @@ class ReachabilityPolicy(Policy):
                     and (self._target < other._target)))
 
 class PathPreferencePolicy(Policy):
+    __slots__ = ('_paths',)
+
     def __init__(self, policy_dict):
         super().__init__(PolicyType.PATH_PREFERENCE, policy_dict)
         self._paths = policy_dict['paths']
         for path in self._paths:
             for i in range(0, len(path)):
-                path[i] = path[i]
+                path[i] = _intern_name(path[i])
+        self._hash = hash(self._canonical())
 
     def toReachabilityPolicy(self):
         return ReachabilityPolicy({'flow' : self._flow,
@@ -180,27 +977,20 @@ class PathPreferencePolicy(Policy):
                     for i,n in enumerate(p)
                     for m in p[i+1:]] 
 
+    def endpoints(self):
+        return (self._paths[0][0], self._paths[0][-1])
+
+    def _canonical(self):
+        # Equality ignores the order (and duplicates) of paths
+        return (self._flow, frozenset(tuple(path) for path in self._paths))
+
+    def __hash__(self):
+        return self._hash
+
     def __eq__(self, other):
-        if self._flow != other._flow:
-            return False
-        
-        for pp in self._paths:
-            pp_in_other = False
-            for op in other._paths:
-                if pp == op:
-                    pp_in_other = True
-            if not pp_in_other:
-                return False
-
-        for op in other._paths:
-            op_in_self = False
-            for pp in self._paths:
-                if op == pp:
-                    op_in_self = True
-            if not op_in_self:
-                return False
-
-        return True
+        if not isinstance(other, PathPreferencePolicy):
+            return NotImplemented
+        return self._canonical() == other._canonical()
     
     def __str__(self):
         return '%s %s' % (self._flow,
@@ -208,10 +998,151 @@ class PathPreferencePolicy(Policy):
 
 """Convert rdns JSON to a dictionary of IPs to router names"""
 def parse_rdns(rdns_json):
-    routers_dict = json.loads(rdns_json)
-    rdns = {}
+    routers_dict = jsonio.loads(rdns_json)
+    rdns = Rdns()
     for router_dict in routers_dict['routers']:
         name = router_dict['name']
         for iface_ip in router_dict['ifaces']:
-            rdns[ipaddress.ip_address(iface_ip)] = name
+            rdns.add(iface_ip, name)
     return rdns
+
+# IPv6 keys are offset past every IPv4 key
+_IPV6_KEY = 1 << 128
+
+def _address_int(address):
+    if address.version == 4:
+        return int(address)
+    return _IPV6_KEY | int(address)
+
+@functools.lru_cache(maxsize=65536)
+def parse_address_key(text):
+    """
+    (ip_address, address_key) of an address string.  Strings are parsed
+    once, through an LRU cache shared by parse_address and address_key.
+    """
+    address = ipaddress.ip_address(text)
+    return address, _address_int(address)
+
+def parse_address(text):
+    """ip_address of an address string (see parse_address_key)"""
+    return parse_address_key(text)[0]
+
+def address_key(address):
+    """
+    Integer key for an address given as a string, ip_address or key: the
+    32-bit address for IPv4, and the 128-bit address offset by 2**128 for
+    IPv6.  Strings are parsed once (see parse_address_key).
+    """
+    if isinstance(address, int):
+        return address
+    if isinstance(address, str):
+        return parse_address_key(address)[1]
+    return _address_int(address)
+
+def _key_address(key):
+    if key >= _IPV6_KEY:
+        return ipaddress.IPv6Address(key ^ _IPV6_KEY)
+    return ipaddress.IPv4Address(key)
+
+class Rdns(Mapping):
+    """
+    Map from interface addresses, or subnets, to router names.  Addresses
+    may be given as strings, ip_addresses or address_key ints; lookups by
+    key are a dict lookup, falling back to a binary search over the
+    subnets.  The most specific subnet containing an address wins.
+    """
+    def __init__(self):
+        self._names = {}
+        self._subnets = {}
+        # Disjoint [start, end] key ranges, sorted by start, rebuilt on the
+        # first lookup after subnets are added
+        self._starts = []
+        self._ends = []
+        self._range_names = []
+        self._ranges_stale = False
+
+    def add(self, address, name):
+        """Map an address, or every address in a subnet ('a.b.c.d/n'), to
+        name"""
+        if isinstance(address, (ipaddress.IPv4Network,
+                ipaddress.IPv6Network)) or (
+                isinstance(address, str) and '/' in address):
+            network = ipaddress.ip_network(address, strict=False)
+            self._subnets[network] = name
+            self._ranges_stale = True
+        else:
+            self._names[address_key(address)] = name
+
+    def _build_ranges(self):
+        # Subnets are nested or disjoint, so a sweep in order of start
+        # (largest first) with a stack of open subnets splits them into
+        # disjoint ranges owned by the innermost subnet
+        self._ranges_stale = False
+        self._starts, self._ends, self._range_names = [], [], []
+        def emit(start, end, name):
+            if start <= end:
+                self._starts.append(start)
+                self._ends.append(end)
+                self._range_names.append(name)
+        subnets = sorted(((address_key(network.network_address),
+            address_key(network.broadcast_address), name)
+            for network, name in self._subnets.items()),
+            key=lambda subnet: (subnet[0], -subnet[1]))
+        stack = []
+        cursor = None
+        for start, end, name in subnets:
+            while stack and stack[-1][1] < start:
+                _, top_end, top_name = stack.pop()
+                emit(cursor, top_end, top_name)
+                cursor = top_end + 1
+            if stack:
+                emit(cursor, start - 1, stack[-1][2])
+            cursor = start
+            stack.append((start, end, name))
+        while stack:
+            _, top_end, top_name = stack.pop()
+            emit(cursor, top_end, top_name)
+            cursor = top_end + 1
+
+    def resolve(self, key, default=None):
+        """Name for an address_key, or default"""
+        name = self._names.get(key)
+        if self._ranges_stale:
+            self._build_ranges()
+        if name is not None or not self._starts or key is None:
+            return name if name is not None else default
+        i = bisect.bisect_right(self._starts, key) - 1
+        if i >= 0 and key <= self._ends[i]:
+            return self._range_names[i]
+        return default
+
+    def resolver(self):
+        """Fastest available function from an address_key to a name (or
+        None)"""
+        if self._subnets:
+            return self.resolve
+        return self._names.get
+
+    def __getitem__(self, address):
+        # Keys hit the dict directly
+        name = self._names.get(address) if type(address) is int else None
+        if name is None and address is not None:
+            name = self.resolve(address_key(address))
+        if name is None:
+            raise KeyError(address)
+        return name
+
+    def __contains__(self, address):
+        if type(address) is int and address in self._names:
+            return True
+        return (address is not None
+                and self.resolve(address_key(address)) is not None)
+
+    def __iter__(self):
+        """Individual addresses (as ip_addresses), then subnets"""
+        for key in self._names:
+            yield _key_address(key)
+        yield from self._subnets
+
+    def __len__(self):
+        return len(self._names) + len(self._subnets)
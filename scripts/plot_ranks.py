@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 from argparse import ArgumentParser
+import fileio
 import matplotlib.pyplot as plt
 import nopticon
 
@@ -14,7 +15,7 @@ def main():
     settings = arg_parser.parse_args()
 
     # Load summary
-    with open(settings.summary_path, 'r') as sf:
+    with fileio.open(settings.summary_path, 'r') as sf:
         summary_json = sf.read()
     summary = nopticon.ReachSummary(summary_json)
 
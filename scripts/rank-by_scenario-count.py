@@ -44,12 +44,12 @@ def main():
     # Process per-failure-scenario summaries
     scenarios = 0
     counts = {} 
-    with open(settings.summaries_path, 'r') as sf:
-        for summary_json in sf.readlines():
-#            print("="*80)
-            summary = nopticon.ReachSummary(summary_json)
-            process_summary(summary, counts, settings.rank_threshold)
-            scenarios += 1
+    for summary in nopticon.iter_summaries(settings.summaries_path,
+            fields=['reach-summary', 'rank-0']):
+#        print("="*80)
+        summary = nopticon.ReachSummary(summary)
+        process_summary(summary, counts, settings.rank_threshold)
+        scenarios += 1
 
     # Compute edge rank
     flows = []
@@ -5,50 +5,323 @@ Reconstruct per-flow forwarding graphs from network summary(s)
 """
 
 from argparse import ArgumentParser
+import contextlib
+import fileio
+import gc
+import hashlib
+import json
+import multiprocessing
 import nopticon
 import os
-import pygraphviz
+import shutil
+import sys
+
+try:
+    import pygraphviz
+except ImportError:
+    pygraphviz = None
+
+# Bump when the way graphs are drawn changes, so cached images are redrawn
+_RENDER_VERSION = 1
+
+# Number of graphs to collect per process before rendering them together
+BATCH_GRAPHS = 64
 
 """
-Make per-flow graphs from a network summary
+Canonical (sorted) form of a flow's links
 """
-def make_graphs(settings, link_summary, timestamp='end'):
-    for flow in link_summary.get_flows():
-        make_graph(settings, flow, link_summary.get_links(flow), timestamp)
+def canonical_links(links):
+    return [(str(source), sorted(str(target) for target in targets))
+            for source, targets in sorted(links.items(),
+                key=lambda item: str(item[0]))]
 
 """
-Make flow-specific graph
+Content hash of a flow's links; flows with the same links have the same
+graph
+"""
+def graph_key(links):
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps([_RENDER_VERSION, canonical_links(links)])
+            .encode('utf-8'))
+    return digest.hexdigest()
+
 """
-def make_graph(settings, flow, links, timestamp):
+Draw a graph from canonical links to path
+"""
+def render(links, path):
+    if pygraphviz is None:
+        raise ImportError('pygraphviz is required to render graphs')
+
     # Create graph
     graph = pygraphviz.AGraph(strict=False, directed=True)
-    for source, targets in links.items():
+    for source, targets in links:
         for target in targets:
             graph.add_edge(source, target)
 
+    # Render graph, writing to a temporary file so an interrupted render
+    # never leaves a partial image in the cache
+    tmp_path = '%s.%d.tmp.png' % (path, os.getpid())
+    graph.draw(tmp_path, prog='dot')
+    os.replace(tmp_path, path)
+
+def _render_job(args):
+    render(*args)
+
+class GraphRenderer:
+    """
+    Renders per-flow graphs through a content-addressed cache: each
+    distinct link set is drawn once, into the cache directory, and every
+    graph with those links is a hard link to (or, where links are not
+    supported, a copy of) the cached image.  Graphs not yet in the cache
+    are drawn in batches by a pool of processes.
+    """
+    def __init__(self, cache_path, jobs=1):
+        self._cache_path = cache_path
+        os.makedirs(cache_path, exist_ok=True)
+        self._pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+        self._batch_size = BATCH_GRAPHS * jobs
+        # Key -> canonical links, of graphs waiting to be drawn
+        self._batch = {}
+        # Key -> graph paths waiting for the key's image
+        self._waiting = {}
+        self._rendered = 0
+        self._reused = 0
+
+    def get_rendered(self):
+        return self._rendered
+
+    def get_reused(self):
+        return self._reused
+
+    def _cached(self, key):
+        return os.path.join(self._cache_path, '%s.png' % key)
+
+    def add(self, links, graph_path):
+        """Draw a flow's links to graph_path, possibly later (see flush)"""
+        key = graph_key(links)
+        if key in self._waiting:
+            self._waiting[key].append(graph_path)
+            self._reused += 1
+        elif os.path.exists(self._cached(key)):
+            _link(self._cached(key), graph_path)
+            self._reused += 1
+        else:
+            self._batch[key] = canonical_links(links)
+            self._waiting[key] = [graph_path]
+            if len(self._batch) >= self._batch_size:
+                self.flush()
+
+    def flush(self):
+        """Draw all waiting graphs"""
+        jobs = [(links, self._cached(key))
+                for key, links in self._batch.items()]
+        if self._pool is not None:
+            self._pool.map(_render_job, jobs,
+                    chunksize=max(1, BATCH_GRAPHS // 4))
+        else:
+            for job in jobs:
+                _render_job(job)
+        self._rendered += len(jobs)
+        for key in self._batch:
+            for graph_path in self._waiting[key]:
+                _link(self._cached(key), graph_path)
+        self._batch = {}
+        self._waiting = {}
+
+    def close(self):
+        self.flush()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+def _link(cached_path, graph_path):
+    if os.path.lexists(graph_path):
+        os.unlink(graph_path)
+    try:
+        os.link(cached_path, graph_path)
+    except OSError:
+        shutil.copyfile(cached_path, graph_path)
+
+"""
+Make per-flow graphs from a network summary
+"""
+def make_graphs(settings, link_summary, timestamp='end', renderer=None):
+    for flow in link_summary.get_flows():
+        make_graph(settings, flow, link_summary.get_links(flow), timestamp,
+                renderer)
+
+"""
+Make flow-specific graph
+"""
+def make_graph(settings, flow, links, timestamp, renderer=None):
     # Determine graph path
     graph_dir = os.path.join(settings.graphs_path, str(flow).replace('/','_'))
     os.makedirs(graph_dir, exist_ok=True)
     graph_path = os.path.join(graph_dir, '%s.png' % (timestamp))
 
     # Render graph
-    graph.layout()
-    graph.draw(graph_path, prog='dot')
+    if renderer is not None:
+        renderer.add(links, graph_path)
+    else:
+        render(canonical_links(links), graph_path)
+
+class ForwardingDelta:
+    """
+    Per-flow links of the previous snapshot, as sets of interned (source,
+    target) ids, to diff each snapshot of a series against.  Only the
+    previous snapshot is kept, so a series can be diffed while streaming.
+    """
+    def __init__(self):
+        self._ids = {} # Router name -> id
+        self._names = [] # Id -> router name
+        self._flows = {} # Flow -> frozenset of link ids
+        self._decoded = {} # Flow -> decoded links
+
+    def _intern(self, name):
+        rid = self._ids.get(name)
+        if rid is None:
+            rid = len(self._names)
+            self._ids[name] = rid
+            self._names.append(name)
+        return rid
+
+    def _link_ids(self, links):
+        # A link's id packs its source and target ids into one int
+        return frozenset((self._intern(link['source']) << 32)
+                | self._intern(target)
+                for link in links for target in link['target'])
+
+    def _names_of(self, link_ids):
+        return [[self._names[lid >> 32], self._names[lid & 0xffffffff]]
+                for lid in sorted(link_ids)]
+
+    def update(self, summary):
+        """
+        Changes from the previous snapshot to summary (a dict with a
+        'flows' section), as a list of (flow, added links, removed links,
+        links) for each changed flow, where added and removed links are
+        [source, target] pairs and links maps sources to targets.  Flows
+        missing from summary have no links.
+        """
+        flows = {}
+        decoded = {}
+        changes = []
+        for flow in summary['flows']:
+            previous = self._flows.get(flow['flow'], frozenset())
+            decoded[flow['flow']] = flow['links']
+            # Most flows are decoded exactly as in the previous snapshot,
+            # which is quicker to check than building their link sets
+            if flow['links'] == self._decoded.get(flow['flow']):
+                flows[flow['flow']] = previous
+                continue
+            links = self._link_ids(flow['links'])
+            flows[flow['flow']] = links
+            if links != previous:
+                changes.append((flow['flow'], links - previous,
+                    previous - links, {link['source'] : link['target']
+                        for link in flow['links']}))
+        for flow, previous in self._flows.items():
+            if flow not in flows and previous:
+                changes.append((flow, frozenset(), previous, {}))
+        self._flows = flows
+        self._decoded = decoded
+        return [(flow, self._names_of(added), self._names_of(removed), links)
+                for flow, added, removed, links in changes]
+
+"""
+Write the changes between consecutive summaries as JSON lines, and render
+graphs for the changed flows if settings.graphs_path is given
+"""
+def make_deltas(settings, summaries, ostream, renderer=None):
+    delta = ForwardingDelta()
+    summaries = iter(summaries)
+    i = 0
+    while True:
+        # Decoding a summary and diffing it allocate many objects but no
+        # reference cycles, and the cyclic garbage collector would
+        # repeatedly scan the snapshot kept for diffing, so it is paused
+        # for those two steps (but not while writing or rendering)
+        with _gc_paused():
+            summary = next(summaries, None)
+            if summary is None:
+                break
+            changes = delta.update(summary)
+        if changes:
+            ostream.write(json.dumps({'snapshot' : i,
+                'flows' : [{'flow' : flow, 'added' : added,
+                    'removed' : removed}
+                    for flow, added, removed, _ in changes]},
+                separators=(',', ':')) + '\n')
+            if renderer is not None:
+                for flow, _, _, links in changes:
+                    make_graph(settings, flow, links, '%010d' % (i),
+                            renderer)
+        i += 1
+
+@contextlib.contextmanager
+def _gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 def main():
     # Parse arguments
     arg_parser = ArgumentParser(description='Reconstruct per-flow forwarding graphs from network summary(s)')
-    arg_parser.add_argument('-s', '--summary', dest='summary_path', 
+    arg_parser.add_argument('-s', '--summary', dest='summary_path',
             action='store', required=True, help='Path to summary JSON file')
-    arg_parser.add_argument('-g', '--graphs', dest='graphs_path', 
-            action='store', required=True, help='Path to store graphs')
+    arg_parser.add_argument('-g', '--graphs', dest='graphs_path',
+            action='store', default=None, help='Path to store graphs '
+            + '(required unless --diff is given)')
+    arg_parser.add_argument('-j', '--jobs', dest='jobs', action='store',
+            type=int, default=os.cpu_count() or 1, help='Number of '
+            + 'processes to render graphs with (default: number of CPUs)')
+    arg_parser.add_argument('-c', '--cache', dest='cache_path',
+            action='store', default=None, help='Directory of rendered '
+            + 'graphs, shared by graphs with the same links and kept '
+            + 'between runs (default: GRAPHS/.cache)')
+    arg_parser.add_argument('-d', '--diff', dest='diff_path',
+            action='store', default=None, help='Write the links added '
+            + 'to and removed from each flow between consecutive summaries '
+            + 'to this JSON lines file (- for stdout), and only store '
+            + 'graphs for changed flows')
     settings = arg_parser.parse_args()
+    if settings.graphs_path is None and settings.diff_path is None:
+        arg_parser.error('-g/--graphs is required unless -d/--diff is given')
+
+    renderer = None
+    if settings.graphs_path is not None:
+        if settings.cache_path is None:
+            settings.cache_path = os.path.join(settings.graphs_path, '.cache')
+        renderer = GraphRenderer(settings.cache_path, settings.jobs)
 
-    # Iterate over all summaries
-    with open(settings.summary_path, 'r') as sf:
-        for i, summary_json in enumerate(sf):
-            link_summary = nopticon.LinkSummary(summary_json)
-            make_graphs(settings, link_summary, '%010d' % (i))
+    # Iterate over all summaries; deltas only read the flows, so they skip
+    # the cost of projecting every decoded object onto the flows fields
+    if settings.diff_path is not None:
+        summaries = nopticon.iter_summaries(settings.summary_path)
+    else:
+        summaries = nopticon.iter_summaries(settings.summary_path,
+                fields=['flows'])
+    try:
+        if settings.diff_path == '-':
+            make_deltas(settings, summaries, sys.stdout, renderer)
+        elif settings.diff_path is not None:
+            # Compressed if the path ends in .gz, .zst, .bz2 or .xz
+            with fileio.open(settings.diff_path, 'w') as ostream:
+                make_deltas(settings, summaries, ostream, renderer)
+        else:
+            for i, summary in enumerate(summaries):
+                link_summary = nopticon.LinkSummary(summary)
+                make_graphs(settings, link_summary, '%010d' % (i), renderer)
+    finally:
+        if renderer is not None:
+            renderer.close()
+    if renderer is not None:
+        print('Rendered %d graphs, reused %d' % (renderer.get_rendered(),
+            renderer.get_reused()), file=sys.stderr)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,318 @@
+#!/usr/bin/python3
+
+"""
+Replay a BMP message stream into gobgp-analysis at a controlled rate and
+report its throughput, summary latency and memory use
+"""
+
+from argparse import ArgumentParser
+import bmp
+import json
+import nopticon
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+# Shortest wait worth sleeping for when pacing
+MIN_SLEEP = 0.001
+
+# Messages sent between checks for the answer to an outstanding probe
+POLL_MESSAGES = 64
+
+def iter_capture(settings):
+    """(line, timestamp) for the capture, repeated settings.loop times with
+    each repetition shifted to follow the previous one"""
+    delta = 0
+    for _ in range(settings.loop):
+        first = last = None
+        for line in bmp.iter_lines(settings.input_path,
+                start_time=settings.start_time, end_time=settings.end_time):
+            line = bmp.shift_timestamp(line, delta)
+            timestamp = bmp.RawMessage(line).timestamp()
+            if timestamp != 0:
+                if first is None:
+                    first = timestamp
+                last = timestamp if last is None else max(last, timestamp)
+            yield line, timestamp
+        if first is None:
+            break
+        delta += last - first + 1
+
+def rss_kb(pid):
+    """Resident set size of a process in KiB, or None if unavailable"""
+    try:
+        with open('/proc/%d/status' % pid, 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _read_output(stream, arrivals, counts):
+    """Record the arrival time of every line the child writes"""
+    for line in stream:
+        counts['lines'] += 1
+        counts['bytes'] += len(line)
+        arrivals.put(time.perf_counter())
+    arrivals.put(None)
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    def pick(p):
+        return values[min(len(values) - 1, int(p * len(values)))]
+    return {'count' : len(values), 'mean' : sum(values) / len(values),
+            'p50' : pick(0.5), 'p95' : pick(0.95), 'p99' : pick(0.99),
+            'max' : values[-1]}
+
+class Replay:
+    """Drives one replay of a capture into a child process"""
+    def __init__(self, settings):
+        self._settings = settings
+        self._probe_latencies = []
+        self._probe_sent = None # When the outstanding probe was sent
+        self._probe_seconds = 0
+        self._lost_probes = 0
+        self._skipped_probes = 0
+        self._late_answers = 0
+        self._rss = []
+        self._messages = 0
+        self._bytes = 0
+        self._commands = 0
+
+    def _sample_rss(self, start):
+        kb = rss_kb(self._proc.pid)
+        if kb is not None:
+            self._rss.append((time.perf_counter() - start, kb))
+
+    def _send(self, data):
+        self._proc.stdin.write(data)
+
+    def _probe(self):
+        """
+        Ask the child for its summary, without waiting for it (see
+        _check_probe).  Only one probe is outstanding at a time; answers
+        that arrive after their probe timed out are discarded first, so
+        every answer is matched to the probe sent just before it.
+        """
+        if self._probe_sent is not None:
+            self._skipped_probes += 1
+            return
+        while True:
+            try:
+                arrived = self._arrivals.get_nowait()
+            except queue.Empty:
+                break
+            if arrived is not None:
+                self._late_answers += 1
+        self._send(nopticon.Command.print_log().bytes())
+        self._commands += 1
+        self._proc.stdin.flush()
+        self._probe_sent = time.perf_counter()
+
+    def _check_probe(self, block=False):
+        """
+        Record the latency of the outstanding probe if it has been answered,
+        or count it as lost once it times out.  The child writes nothing
+        for an empty summary, so probes sent before it has any state are
+        never answered.
+        """
+        if self._probe_sent is None:
+            return
+        deadline = self._probe_sent + self._settings.probe_timeout
+        try:
+            if block:
+                arrived = self._arrivals.get(
+                        timeout=max(0, deadline - time.perf_counter()))
+            else:
+                arrived = self._arrivals.get_nowait()
+        except queue.Empty:
+            if time.perf_counter() >= deadline:
+                self._lost_probes += 1
+                self._probe_sent = None
+            return
+        if arrived is None:
+            # The child has exited
+            self._lost_probes += 1
+        else:
+            self._probe_latencies.append(arrived - self._probe_sent)
+        self._probe_sent = None
+
+    def run(self):
+        settings = self._settings
+        self._arrivals = queue.Queue()
+        counts = {'lines' : 0, 'bytes' : 0}
+        self._proc = subprocess.Popen(settings.command, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                bufsize=1 << 20)
+        reader = threading.Thread(target=_read_output,
+                args=(self._proc.stdout, self._arrivals, counts), daemon=True)
+        reader.start()
+
+        start = time.perf_counter()
+        first_timestamp = None
+        last_refresh = None
+        last_rss = start
+        try:
+            for line, timestamp in iter_capture(settings):
+                if timestamp != 0:
+                    if first_timestamp is None:
+                        first_timestamp = timestamp
+                    # Pace by capture time, or by a fixed message rate
+                    if settings.speed is not None:
+                        target = start + ((timestamp - first_timestamp)
+                                / settings.speed)
+                    elif settings.rate is not None:
+                        target = start + self._messages / settings.rate
+                    else:
+                        target = None
+                    if target is not None:
+                        delay = target - time.perf_counter()
+                        if delay > MIN_SLEEP:
+                            self._proc.stdin.flush()
+                            time.sleep(delay)
+                    # Refresh summaries every settings.refresh capture seconds
+                    if settings.refresh is not None:
+                        if last_refresh is None:
+                            last_refresh = timestamp
+                        elif timestamp - last_refresh >= settings.refresh:
+                            last_refresh = timestamp
+                            self._send(nopticon.Command.refresh_summary(
+                                timestamp).bytes())
+                            self._commands += 1
+
+                self._send(line)
+                self._messages += 1
+                self._bytes += len(line)
+                if settings.probe and (self._messages % settings.probe == 0
+                        or (self._probe_sent is not None
+                            and self._messages % POLL_MESSAGES == 0)):
+                    probe_start = time.perf_counter()
+                    self._check_probe()
+                    if self._messages % settings.probe == 0:
+                        self._probe()
+                    self._probe_seconds += time.perf_counter() - probe_start
+                now = time.perf_counter()
+                if now - last_rss >= settings.rss_interval:
+                    last_rss = now
+                    self._sample_rss(start)
+
+            # Time until the last message has been processed
+            self._check_probe(block=True)
+            self._probe()
+            self._check_probe(block=True)
+            elapsed = time.perf_counter() - start
+            self._sample_rss(start)
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            elapsed = time.perf_counter() - start
+        returncode = self._proc.wait()
+        reader.join()
+
+        # Rates leave out the time spent sending and checking probes
+        send_seconds = elapsed - self._probe_seconds
+        message_rate = byte_rate = None
+        if send_seconds > 0:
+            message_rate = self._messages / send_seconds
+            byte_rate = self._bytes / send_seconds / 1e6
+        rss = [kb for _, kb in self._rss]
+        return {
+            'command' : settings.command,
+            'input' : settings.input_path,
+            'loop' : settings.loop,
+            'speed' : settings.speed,
+            'rate' : settings.rate,
+            'messages' : self._messages,
+            'bytes' : self._bytes,
+            'commands' : self._commands,
+            'seconds' : elapsed,
+            'probe-seconds' : self._probe_seconds,
+            'messages-per-second' : message_rate,
+            'megabytes-per-second' : byte_rate,
+            'summary-latency' : _percentiles(self._probe_latencies),
+            'lost-probes' : self._lost_probes,
+            'skipped-probes' : self._skipped_probes,
+            'late-answers' : self._late_answers,
+            'output-lines' : counts['lines'],
+            'output-bytes' : counts['bytes'],
+            'rss-kb' : {'max' : max(rss) if rss else None,
+                'final' : rss[-1] if rss else None,
+                'samples' : self._rss},
+            'returncode' : returncode,
+        }
+
+def main():
+    # Parse arguments
+    arg_parser = ArgumentParser(description='Replay a BMP message stream '
+            + 'into gobgp-analysis and measure its performance')
+    arg_parser.add_argument('-input', dest='input_path', action='store',
+            required=True, help='Path for BMP message stream')
+    arg_parser.add_argument('-binary', dest='binary', action='store',
+            default='build/gobgp-analysis', help='Path to gobgp-analysis '
+            + '(default: build/gobgp-analysis)')
+    arg_parser.add_argument('-rdns', dest='rdns_path', action='store',
+            required=True, help='Path to rdns JSON file')
+    arg_parser.add_argument('-spans', dest='spans', action='store',
+            default='3600', help='Comma-separated reach summary spans in '
+            + 'seconds (default: 3600)')
+    arg_parser.add_argument('-args', dest='extra_args', action='store',
+            default='', help='Additional gobgp-analysis arguments')
+    pace = arg_parser.add_mutually_exclusive_group()
+    pace.add_argument('-speed', dest='speed', action='store', type=float,
+            default=None, help='Replay at SPEED times capture time (e.g., '
+            + '1 for real time)')
+    pace.add_argument('-rate', dest='rate', action='store', type=float,
+            default=None, help='Replay at RATE messages per second')
+    arg_parser.add_argument('-loop', dest='loop', action='store', type=int,
+            default=1, help='Replay the capture LOOP times, shifting the '
+            + 'timestamps of each repetition')
+    arg_parser.add_argument('-from', dest='start_time', action='store',
+            type=float, default=None, help='Only replay messages at or '
+            + 'after this timestamp')
+    arg_parser.add_argument('-to', dest='end_time', action='store',
+            type=float, default=None, help='Only replay messages before '
+            + 'this timestamp')
+    arg_parser.add_argument('-refresh', dest='refresh', action='store',
+            type=float, default=None, help='Inject a refresh summary '
+            + 'command every REFRESH seconds of capture time')
+    arg_parser.add_argument('-probe', dest='probe', action='store', type=int,
+            default=1000, help='Request a summary every PROBE messages, '
+            + 'unless the last request is still unanswered, and time how '
+            + 'long it takes to arrive (0 to disable)')
+    arg_parser.add_argument('-probe-timeout', dest='probe_timeout',
+            action='store', type=float, default=60, help='Seconds to wait '
+            + 'for a requested summary')
+    arg_parser.add_argument('-rss-interval', dest='rss_interval',
+            action='store', type=float, default=0.5, help='Seconds between '
+            + 'RSS samples')
+    arg_parser.add_argument('-report', dest='report_path', action='store',
+            default=None, help='Path to write the JSON report to (default: '
+            + 'stdout)')
+    settings = arg_parser.parse_args()
+
+    # Only requested summaries are written at verbosity 0, so every output
+    # line answers a probe
+    settings.command = ([settings.binary, '--verbosity', '0',
+        '--reach-summary', settings.spans] + shlex.split(settings.extra_args)
+        + [settings.rdns_path])
+
+    report = Replay(settings).run()
+    if settings.report_path is not None:
+        with open(settings.report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    rate = report['messages-per-second']
+    print('%d messages in %.2f s (%s messages/s)' % (report['messages'],
+        report['seconds'], 'n/a' if rate is None else '%.0f' % rate),
+        file=sys.stderr)
+    return 0 if report['returncode'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Fixed-memory streaming sketches: HyperLogLog distinct counts, count-min
+frequency estimates and top-K heavy hitters.  All of them can be merged, so
+partial sketches computed in parallel combine into the sketch of the whole
+stream.
+"""
+
+import hashlib
+import heapq
+import math
+import numpy as np
+
+def hash64(key):
+    """Stable 64-bit hash of a str or bytes key (the same in every
+    process, unlike hash())"""
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(),
+            'little')
+
+class HyperLogLog:
+    """Approximate number of distinct keys, with a relative standard error
+    of about 1.04 / sqrt(2 ** precision)"""
+    def __init__(self, precision=14):
+        self._precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, key):
+        self.add_hash(hash64(key))
+
+    def add_hash(self, h):
+        index = h >> (64 - self._precision)
+        rest_bits = 64 - self._precision
+        rest = h & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def merge(self, other):
+        assert self._precision == other._precision
+        self._registers = bytearray(map(max, self._registers,
+            other._registers))
+
+    def count(self):
+        m = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # Linear counting is more accurate for small counts
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+class CountMinSketch:
+    """Frequency estimates that never undercount, and overcount by at most
+    e / width of the total count with probability 1 - exp(-depth)"""
+    def __init__(self, width=1 << 16, depth=4):
+        self._width = width
+        self._set_table(np.zeros((depth, width), dtype=np.int64))
+
+    def _set_table(self, table):
+        self._table = table
+        # Single counters are updated through memoryviews of the rows, which
+        # are as quick to index as arrays; whole tables through NumPy
+        self._rows = [memoryview(row) for row in table]
+
+    def __getstate__(self):
+        return {'width' : self._width, 'table' : self._table}
+
+    def __setstate__(self, state):
+        self._width = state['width']
+        self._set_table(state['table'])
+
+    def _columns(self, h):
+        # Double hashing: row i uses h1 + i * h2
+        h1 = h & 0xffffffff
+        h2 = (h >> 32) | 1
+        return [(h1 + i * h2) % self._width for i in range(len(self._rows))]
+
+    def add_hash(self, h, count=1):
+        """Add count for a key's hash64, returning the new estimate"""
+        h1 = h & 0xffffffff
+        h2 = (h >> 32) | 1
+        width = self._width
+        estimate = None
+        for row in self._rows:
+            column = h1 % width
+            value = row[column] + count
+            row[column] = value
+            if estimate is None or value < estimate:
+                estimate = value
+            h1 += h2
+        return estimate
+
+    def estimate_hash(self, h):
+        return min(row[column]
+                for row, column in zip(self._rows, self._columns(h)))
+
+    def add(self, key, count=1):
+        return self.add_hash(hash64(key), count)
+
+    def estimate(self, key):
+        return self.estimate_hash(hash64(key))
+
+    def merge(self, other):
+        assert self._table.shape == other._table.shape
+        self._table += other._table
+
+class TopK:
+    """The k keys with the highest (count-min estimated) counts"""
+    def __init__(self, k, width=1 << 16, depth=4):
+        self._k = k
+        self._sketch = CountMinSketch(width, depth)
+        # Key -> (hash, estimate) of the current top keys
+        self._top = {}
+        # Min-heap of (estimate, key) with one entry per top key; an entry
+        # may hold an older, lower estimate until it reaches the top
+        self._heap = []
+
+    def add(self, key, count=1):
+        self.add_hash(key, hash64(key), count)
+
+    def add_hash(self, key, h, count=1):
+        """Add count for a key whose hash64 is h"""
+        self._offer(key, h, self._sketch.add_hash(h, count))
+
+    def _offer(self, key, h, estimate):
+        if key in self._top:
+            # The heap entry is refreshed lazily, when it reaches the top
+            self._top[key] = (h, estimate)
+        elif len(self._top) < self._k:
+            self._top[key] = (h, estimate)
+            heapq.heappush(self._heap, (estimate, key))
+        elif estimate > self._min_estimate():
+            _, evicted = heapq.heappop(self._heap)
+            del self._top[evicted]
+            self._top[key] = (h, estimate)
+            heapq.heappush(self._heap, (estimate, key))
+
+    def _min_estimate(self):
+        # Refresh or drop stale entries until the heap top is current
+        while True:
+            estimate, key = self._heap[0]
+            if self._top[key][1] != estimate:
+                heapq.heapreplace(self._heap, (self._top[key][1], key))
+            else:
+                return estimate
+
+    def merge(self, other):
+        self._sketch.merge(other._sketch)
+        candidates = dict(self._top)
+        candidates.update(other._top)
+        self._top = {}
+        self._heap = []
+        for key, (h, _) in candidates.items():
+            self._offer(key, h, self._sketch.estimate_hash(h))
+
+    def items(self):
+        """(key, estimated count) of the top keys, highest count first"""
+        return sorted(((key, estimate) for key, (_, estimate)
+            in self._top.items()), key=lambda item: (-item[1], item[0]))
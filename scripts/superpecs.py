@@ -9,49 +9,52 @@ from argparse import ArgumentParser
 import json
 import nopticon
 
-def compute_specs(summary):
+def compute_specs(summary, threshold=None, quantize=None):
     """
-    Compute super PECs based on a reach summary
+    Compute super PECs based on a reach summary: flows with the same
+    signature (see ReachSummary.get_flow_signatures), grouped in one pass.
+    Without a threshold or quantize, flows are grouped only if all their
+    edges, ranks and histories are equal.
     """
-    specs = []
+    exact = threshold is None and quantize is None
+    signatures = dict(zip(summary.get_flows(),
+        summary.get_flow_signatures(threshold, quantize=quantize,
+            exact=exact)))
+    specs = {}
     for flow in sorted(summary.get_flows()):
-        assign_to_spec(flow, specs, summary)
-    return specs
-
-
-def assign_to_spec(flow, specs, summary):
-    """
-    Determine which SPEC a flow belongs to
-    """
-    flow_edges = summary.get_edges(flow)
-    for spec in specs:
-        spec_edges = summary.get_edges(spec[0])
-        if (flow_edges == spec_edges):
-            spec.append(flow)
-            return
-    specs.append([flow])
+        specs.setdefault(signatures[flow], []).append(flow)
+    return list(specs.values())
 
 def main():
     # Parse arguments
     arg_parser = ArgumentParser(description='Compute super PECs')
     arg_parser.add_argument('-s','--summary', dest='summary_path',
             action='store', required=True, help='Path to summary JSON file')
-    arg_parser.add_argument('-t', '--threshold', default=0.5, type=float,
-            required=False, help='The minimum rank to consider between 0 and 1')
+    arg_parser.add_argument('-t', '--threshold', default=None, type=float,
+            required=False, help='The minimum rank to consider between 0 '
+            + 'and 1 (default: group flows only if all their edges, ranks '
+            + 'and histories are equal)')
+    arg_parser.add_argument('-q', '--quantize', default=None, type=int,
+            required=False, help='Group flows by their edges and their '
+            + 'ranks rounded to a multiple of 1/QUANTIZE, rather than their '
+            + 'exact ranks and histories')
+    arg_parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+            default=None, help='Directory to keep a binary cache of the '
+            + 'summary in, so later runs load it faster')
     settings = arg_parser.parse_args()
     num_satisfied = 0
 
-    if settings.threshold < 0 or settings.threshold > 1:
+    if settings.threshold is not None and (settings.threshold < 0
+            or settings.threshold > 1):
         print("Threshold must be between 0 and 1")
         return 1
 
     # Load summary
-    with open(settings.summary_path, 'r') as sf:
-        summary_json = sf.read()
-    summary = nopticon.ReachSummary(summary_json)
+    summary = nopticon.ReachSummary.load(settings.summary_path,
+            cache_dir=settings.cache_dir)
 
     # Compute SPECs
-    specs = compute_specs(summary)
+    specs = compute_specs(summary, settings.threshold, settings.quantize)
 
     # Output SPECs
     for spec in specs:
@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+
+"""
+Generate deterministic synthetic topologies (fat-trees and Topology-Zoo-like
+graphs) together with matching reach/link summaries, policies, topo and rdns
+files
+"""
+
+from argparse import ArgumentParser
+import ipaddress
+import json
+import os
+import random
+
+class Topology:
+    """
+    Undirected topology with named nodes.  Every link gets a /31 out of
+    10.0.0.0/8, so the address plan scales to millions of links.
+    """
+    def __init__(self, name, nodes, links, origins, policy_sources):
+        self.name = name
+        self.nodes = nodes
+        self.links = links
+        self.origins = origins
+        self.policy_sources = policy_sources
+
+        self.neighbors = {node : [] for node in nodes}
+        for source, target in links:
+            self.neighbors[source].append(target)
+            self.neighbors[target].append(source)
+
+    def prefix(self, origin_idx):
+        """Prefix originated by the origin_idx-th origin"""
+        return '3.%d.%d.0/24' % (origin_idx // 256, origin_idx % 256)
+
+    def link_addresses(self, link_idx):
+        base = (10 << 24) + 2 * link_idx
+        return (str(ipaddress.ip_address(base)),
+                str(ipaddress.ip_address(base + 1)))
+
+    def interfaces(self):
+        """Dict from node to a list of (iface name, address, neighbor)"""
+        ifaces = {node : [] for node in self.nodes}
+        for idx, (source, target) in enumerate(self.links):
+            source_ip, target_ip = self.link_addresses(idx)
+            ifaces[source].append(('eth%d' % len(ifaces[source]), source_ip,
+                target))
+            ifaces[target].append(('eth%d' % len(ifaces[target]), target_ip,
+                source))
+        return ifaces
+
+    def topo_str(self):
+        """Topology in the format read by implied_properties.Topo and
+        bespoke_input.Logical"""
+        ifaces = self.interfaces()
+        lines = []
+        for node in self.nodes:
+            lines.append(' '.join(['router', node] + ['%s:%s/31' % (iface, ip)
+                for iface, ip, _ in ifaces[node]]))
+        for node in self.nodes:
+            for iface, _, neighbor in ifaces[node]:
+                if node < neighbor:
+                    neighbor_iface = [i for i, _, n in ifaces[neighbor]
+                            if n == node][0]
+                    lines.append('link %s:%s %s:%s' % (node, iface, neighbor,
+                        neighbor_iface))
+        return '\n'.join(lines) + '\n'
+
+    def rdns(self):
+        """rdns document mapping every interface address to its router"""
+        ifaces = self.interfaces()
+        return {'routers' : [{'name' : node,
+            'ifaces' : [ip for _, ip, _ in ifaces[node]]}
+            for node in self.nodes]}
+
+def fattree(k):
+    """k-ary fat-tree with core, agg and leaf layers"""
+    assert k % 2 == 0, 'k must be even'
+    half = k // 2
+    cores = ['core%d' % i for i in range(half * half)]
+    aggs = ['agg%d_%d' % (pod, i) for pod in range(k) for i in range(half)]
+    leaves = ['leaf%d_%d' % (pod, i) for pod in range(k) for i in range(half)]
+    links = []
+    for pod in range(k):
+        for a in range(half):
+            agg = 'agg%d_%d' % (pod, a)
+            for l in range(half):
+                links.append(('leaf%d_%d' % (pod, l), agg))
+            for c in range(half):
+                links.append((agg, 'core%d' % (a * half + c)))
+    return Topology('fattree-%d' % k, cores + aggs + leaves, links, leaves,
+            leaves)
+
+def zoo(num_nodes, seed=0, degree=3):
+    """
+    Sparse WAN-like graph resembling Topology Zoo networks: a ring plus
+    random chords, for an average degree of about `degree`
+    """
+    rand = random.Random(seed)
+    nodes = ['n%d' % i for i in range(num_nodes)]
+    links = set()
+    for i in range(num_nodes):
+        links.add(tuple(sorted((nodes[i], nodes[(i + 1) % num_nodes]))))
+    target = num_nodes * degree // 2
+    while len(links) < target and num_nodes > 3:
+        a, b = rand.sample(nodes, 2)
+        links.add(tuple(sorted((a, b))))
+    return Topology('zoo-%d' % num_nodes, nodes, sorted(links), nodes, nodes)
+
+def _shortest_path_dag(topo, origin):
+    """Nodes sorted by distance from origin and their shortest-path next
+    hops towards origin"""
+    dist = {origin : 0}
+    order = [origin]
+    for node in order:
+        for neighbor in topo.neighbors[node]:
+            if neighbor not in dist:
+                dist[neighbor] = dist[node] + 1
+                order.append(neighbor)
+    next_hops = {node : [n for n in topo.neighbors[node]
+        if dist.get(n, -1) == dist[node] - 1] for node in order}
+    return order, next_hops
+
+def generate(topo, num_flows=None, spans=1, history=False, noise=0.05,
+        seed=0):
+    """
+    Generate a summary document (reach-summary and flows sections) and a
+    policies document for traffic towards the first num_flows origins
+    """
+    rand = random.Random(seed)
+    origins = topo.origins[:num_flows]
+    reach_summary = []
+    link_flows = []
+    policies = []
+    for origin_idx, origin in enumerate(origins):
+        prefix = topo.prefix(origin_idx)
+        order, next_hops = _shortest_path_dag(topo, origin)
+
+        # Nodes on some (reach) or every (must) shortest path to origin
+        reach = {origin : set()}
+        must = {origin : set()}
+        for node in order[1:]:
+            hop_sets = [set([hop]) | must[hop] for hop in next_hops[node]]
+            must[node] = set.intersection(*hop_sets)
+            reach[node] = set().union(*[set([hop]) | reach[hop]
+                for hop in next_hops[node]])
+
+        edges = []
+        for node in order[1:]:
+            for target in sorted(reach[node]):
+                if target in must[node]:
+                    rank = rand.uniform(0.85, 1.0)
+                else:
+                    rank = rand.uniform(0.3, 0.8)
+                edges.append(_edge(rand, node, target,
+                    target in next_hops[node], rank, spans, history))
+            if rand.random() < noise:
+                target = rand.choice(topo.nodes)
+                if target != node and target not in reach[node]:
+                    edges.append(_edge(rand, node, target, False,
+                        rand.uniform(0.0, 0.3), spans, history))
+        reach_summary.append({'flow' : prefix, 'edges' : edges})
+
+        network = ipaddress.ip_network(prefix)
+        link_flows.append({'flow' : prefix,
+            'ranges' : [{'low' : str(network.network_address),
+                'high' : str(network.broadcast_address)}],
+            'links' : [{'source' : node, 'target' : next_hops[node]}
+                for node in order[1:]]})
+
+        for source in topo.policy_sources:
+            if source != origin and source in reach:
+                policies.append({'type' : 'reachability', 'source' : source,
+                    'target' : origin, 'flow' : prefix})
+
+    summary = {'reach-summary' : reach_summary, 'flows' : link_flows}
+    return summary, {'policies' : policies}
+
+def _edge(rand, source, target, direct, rank, spans, history):
+    edge = {'source' : source, 'target' : target, 'can-be-direct' : direct}
+    for span in range(spans):
+        # Longer spans smooth out the rank
+        jitter = rand.uniform(-0.1, 0.1) / (span + 1)
+        edge['rank-%d' % span] = min(1.0, max(0.0, rank + jitter))
+    if history:
+        start = 1533679020 * 10**6
+        edge['history'] = sorted(start + rand.randrange(10**9)
+                for _ in range(2 * rand.randrange(1, 4)))
+    return edge
+
+def write(topo, out_dir, summary, policies):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        f.write(json.dumps(summary) + '\n')
+    with open(os.path.join(out_dir, 'policies.json'), 'w') as f:
+        json.dump(policies, f)
+    with open(os.path.join(out_dir, 'topo'), 'w') as f:
+        f.write(topo.topo_str())
+    with open(os.path.join(out_dir, 'rdns.json'), 'w') as f:
+        json.dump(topo.rdns(), f)
+
+def main():
+    # Parse arguments
+    arg_parser = ArgumentParser(description='Generate synthetic summaries, '
+            + 'policies, topo and rdns files')
+    topo_args = arg_parser.add_mutually_exclusive_group(required=True)
+    topo_args.add_argument('-fattree', dest='fattree', action='store',
+            type=int, help='Generate a k-ary fat-tree')
+    topo_args.add_argument('-zoo', dest='zoo', action='store', type=int,
+            help='Generate a Topology-Zoo-like graph with this many nodes')
+    arg_parser.add_argument('-out', dest='out_dir', action='store',
+            required=True, help='Directory to write files to')
+    arg_parser.add_argument('-flows', dest='flows', action='store', type=int,
+            default=None, help='Maximum number of flows (default: one per '
+            + 'origin)')
+    arg_parser.add_argument('-spans', dest='spans', action='store', type=int,
+            default=1, help='Number of ranks per edge')
+    arg_parser.add_argument('-history', dest='history', action='store_true',
+            default=False, help='Include edge histories')
+    arg_parser.add_argument('-seed', dest='seed', action='store', type=int,
+            default=0, help='Random seed')
+    settings = arg_parser.parse_args()
+
+    if settings.fattree is not None:
+        topo = fattree(settings.fattree)
+    else:
+        topo = zoo(settings.zoo, settings.seed)
+    summary, policies = generate(topo, settings.flows, settings.spans,
+            settings.history, seed=settings.seed)
+    write(topo, settings.out_dir, summary, policies)
+
+if __name__ == '__main__':
+    main()
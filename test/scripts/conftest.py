@@ -0,0 +1,10 @@
+"""
+Shared setup for the tests of the Python scripts, which are flat modules in
+scripts/ imported by name
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..',
+    'scripts'))
@@ -0,0 +1,89 @@
+"""
+Tests for the csv converter and synthetic workload generator
+"""
+
+import io
+import json
+
+import pytest
+
+import bespoke_input
+import bmp
+import synthetic
+
+def test_address_plan_limit():
+    plan = bespoke_input.AddressPlan()
+    for i in range(1, bespoke_input.AddressPlan.MAX_ROUTERS):
+        plan.add_link('r0', 'r%d' % i)
+    assert plan.get_rDNS_logical()['r0']['r255'] == {
+            'source' : '10.0.0.255', 'target' : '10.0.255.0'}
+    with pytest.raises(ValueError):
+        plan.add_link('r0', 'r256')
+
+def old_bgp_string(update, rdns):
+    """The message the original converter built for a csv update"""
+    addresses = rdns[update[2]][update[3]]
+    if update[0].startswith('-'):
+        attributes, nlri, withdrawn = [], [], [{'prefix' : update[1]}]
+    else:
+        attributes = [{'type' : 3, 'nexthop' : addresses['target']}]
+        nlri, withdrawn = [{'prefix' : update[1]}], []
+    return json.dumps({'Header' : {'Type' : 0},
+        'PeerHeader' : {'PeerBGPID' : addresses['source'],
+            'Timestamp' : int(update[0][1:])},
+        'Body' : {'BGPUpdate' : {'Body' : {'PathAttributes' : attributes,
+            'NLRI' : nlri, 'WithdrawnRoutes' : withdrawn}}}})
+
+def test_network_script_messages(tmp_path, monkeypatch):
+    updates = [('+10', '10.0.0.0/24', 'a', 'b'),
+            ('+11', '10.0.1.0/24', 'b', 'c'),
+            ('-12', '10.0.0.0/24', 'a', 'b'),
+            # Needs escaping, and is not a format specifier
+            ('+13', '10.0.2.0/24"%d\u00e9', 'a', 'b'),
+            ('-14', '10.0.2.0/24"%d\u00e9', 'b', 'c')]
+    csv_lines = [','.join(update) + '\n' for update in updates]
+    csv_lines.insert(2, '\n')
+    script = bespoke_input.NetworkScript(str(tmp_path / 'rdns.json'), None)
+    ostream = io.StringIO()
+    # Batches smaller than the updates
+    monkeypatch.setattr(bespoke_input, 'BATCH_LINES', 2)
+    assert script.write_BGP(csv_lines, ostream) == len(updates)
+    lines = ostream.getvalue().split('\n')
+    assert lines.pop() == ''
+    assert lines == [old_bgp_string(update, script.rDNS_logical)
+            for update in updates]
+    assert json.loads(script.to_rDNS_string()) == {'routers' : [
+        {'name' : 'a', 'ifaces' : ['10.0.0.1']},
+        {'name' : 'b', 'ifaces' : ['10.0.1.0', '10.0.1.2']},
+        {'name' : 'c', 'ifaces' : ['10.0.2.1']}]}
+
+def test_bgp_template_is_compact_on_request():
+    template = bespoke_input._bgp_template(False, '10.0.0.1', '10.0.0.2',
+            bespoke_input.COMPACT)
+    line = template % (10, json.dumps('10.0.0.0/24'))
+    assert ' ' not in line
+    assert json.loads(line)['Body']['BGPUpdate']['Body']['NLRI'] == [
+            {'prefix' : '10.0.0.0/24'}]
+
+def test_workload_messages_parse():
+    workload = bespoke_input.Workload.from_topology(synthetic.fattree(4))
+    schedule = workload.random_schedule(100, failures=2, downtime=10)
+    lines = list(workload.messages(1000, schedule))
+    types = [bmp.RawMessage(line.encode()).type() for line in lines]
+    assert types.count(bmp.MessageType.PEER_UP) == 2 * (len(workload.links)
+            + 2)
+    assert types.count(bmp.MessageType.PEER_DOWN) == 2 * 2
+
+def test_schedule_errors(tmp_path):
+    workload = bespoke_input.Workload.from_topology(synthetic.fattree(4))
+    source, target = workload.links[0][:2]
+    path = tmp_path / 'schedule'
+    path.write_text('# time event link\n10 down %s %s\n' % (source, target))
+    schedule = bespoke_input.read_schedule(str(path))
+    assert schedule == [(10.0, False, source, target)]
+    workload.check_schedule(schedule)
+    with pytest.raises(ValueError):
+        workload.check_schedule([(10, False, source, 'nowhere')])
+    path.write_text('10 sideways %s %s\n' % (source, target))
+    with pytest.raises(ValueError):
+        bespoke_input.read_schedule(str(path))
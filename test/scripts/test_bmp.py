@@ -0,0 +1,132 @@
+"""
+Tests for reading GoBMP JSON streams
+"""
+
+import ipaddress
+import json
+import os
+
+import bmp
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+PEER_UP = (b'{"Header":{"Version":3,"Length":80,"Type":3},'
+    + b'"PeerHeader":{"PeerType":0,"PeerAS":65001,"PeerBGPID":"10.0.0.1",'
+    + b'"Timestamp":1533679063.25},'
+    + b'"Body":{"LocalAddress":"10.0.0.2","LocalPort":179}}\n')
+
+def test_raw_message_decodes_lazily():
+    raw = bmp.RawMessage(PEER_UP)
+    assert raw.type() == bmp.MessageType.PEER_UP
+    assert raw.isPeerUp() and not raw.isPeerDown()
+    assert raw.line() is PEER_UP
+    # The timestamp is read without decoding the peer header or body
+    assert raw.timestamp() == 1533679063.25
+    assert raw._peer_header is None and raw._body is None
+    assert raw.body() == {'LocalAddress' : '10.0.0.2', 'LocalPort' : 179}
+    assert raw._peer_header is None
+    assert raw.peer_header()['PeerAS'] == 65001
+
+def test_raw_message_matches_parse_message():
+    message = bmp.RawMessage(PEER_UP).message()
+    expected = bmp.parse_message(PEER_UP)
+    assert str(message) == str(expected) == 'PEER_UP from 10.0.0.1:65001'
+    assert message.edge() == expected.edge() == (
+            ipaddress.ip_address('10.0.0.1'), ipaddress.ip_address('10.0.0.2'))
+    assert message.edge_keys() == expected.edge_keys()
+
+def test_raw_message_other_layouts():
+    # Keys in another order are decoded in full
+    msg_dict = json.loads(PEER_UP)
+    line = json.dumps({'PeerHeader' : msg_dict['PeerHeader'],
+        'Body' : msg_dict['Body'], 'Header' : msg_dict['Header']}).encode()
+    raw = bmp.RawMessage(line)
+    assert raw.type() == bmp.MessageType.PEER_UP
+    assert raw.timestamp() == 1533679063.25
+    assert raw.body()['LocalAddress'] == '10.0.0.2'
+    assert bmp.line_type(line) == bmp.MessageType.PEER_UP
+    assert bmp.line_type(PEER_UP) == bmp.MessageType.PEER_UP
+
+def test_shift_timestamp():
+    shifted = bmp.shift_timestamp(PEER_UP, 10)
+    assert bmp.RawMessage(shifted).timestamp() == 1533679073.25
+    assert bmp.shift_timestamp(PEER_UP, 0) is PEER_UP
+
+def test_split_ranges(tmp_path):
+    path = tmp_path / 'stream.bmp'
+    lines = [b'{"n":%d}\n' % (i) for i in range(100)]
+    path.write_bytes(b''.join(lines))
+    size = len(b''.join(lines))
+    for num_ranges in (1, 3, 7, 200):
+        ranges = bmp.split_ranges(str(path), num_ranges)
+        assert 1 <= len(ranges) <= num_ranges
+        assert ranges[0][0] == 0 and ranges[-1][1] == size
+        assert all(hi == lo for (_, hi), (lo, _) in zip(ranges, ranges[1:]))
+        # Every range starts at a line and the lines are each read once
+        read = [line for lo, hi in ranges
+                for line in bmp.iter_lines(str(path), lo, hi)]
+        assert read == lines
+
+def test_split_ranges_of_a_byte_range(tmp_path):
+    path = tmp_path / 'stream.bmp'
+    path.write_bytes(b''.join(b'{"n":%d}\n' % (i) for i in range(100)))
+    ranges = bmp.split_ranges(str(path), 4, 90, 450)
+    assert ranges[0][0] == 90 and ranges[-1][1] == 450
+
+def message(timestamp):
+    return PEER_UP.replace(b'1533679063.25', repr(timestamp).encode())
+
+def test_seek_index(tmp_path):
+    path = tmp_path / 'stream.bmp'
+    # Timestamps out of order across buckets, and messages without one
+    timestamps = [0, 30, 70, 0, 65, 200, 130, 250, 0, 400]
+    path.write_bytes(b''.join(message(t) for t in timestamps))
+    index = bmp.SeekIndex.build(str(path))
+    assert len(index._untimed) == 3
+    for start_time, end_time in [(None, None), (60, 130), (100, 260),
+            (0, 1), (300, 500), (500, None), (None, 60)]:
+        expected = [t for t in timestamps if t == 0
+                or ((start_time is None or t >= start_time)
+                    and (end_time is None or t < end_time))]
+        start, end = index.offsets(start_time, end_time)
+        read = [bmp.RawMessage(line).timestamp() for line
+                in bmp.iter_lines(str(path), start, end, start_time,
+                    end_time)]
+        assert [t for t in read if t != 0] == [t for t in expected if t != 0]
+        # Seeking with the sidecar index also yields every message without
+        # a timestamp, in stream order
+        read = [bmp.RawMessage(line).timestamp() for line
+                in bmp.iter_lines(str(path), start_time=start_time,
+                    end_time=end_time)]
+        assert read == expected
+
+def test_seek_keeps_untimed_messages(tmp_path):
+    path = tmp_path / 'ft4_gobgp.bmp'
+    with open(os.path.join(DATA, 'ft4_gobgp.bmp'), 'rb') as istream:
+        lines = [line for line in istream if not line.isspace()]
+    path.write_bytes(b''.join(lines))
+    initiations = [line for line in lines
+            if bmp.line_type(line) == bmp.MessageType.INITIATION]
+    assert len(initiations) == 20
+    # The capture spans 18 seconds, so index it by the second
+    index = bmp.SeekIndex.open_for(str(path), bucket=1)
+    read = list(bmp.iter_lines(str(path), start_time=1533679030))
+    assert index.offsets(1533679030)[0] > len(b''.join(lines[:27]))
+    assert read[:20] == initiations
+    assert read[20:] == [line for line in lines
+            if bmp.RawMessage(line).timestamp() >= 1533679030]
+    assert len(read) > 20
+    # -to reads only as far as the last message before it, not up to the
+    # last message without a timestamp
+    assert index.offsets(end_time=1533679021.5)[1] == len(b''.join(lines[:19]))
+
+def test_seek_index_sidecar(tmp_path):
+    path = tmp_path / 'stream.bmp'
+    path.write_bytes(message(10) + message(100))
+    index = bmp.SeekIndex.open_for(str(path))
+    index_path = bmp.SeekIndex.default_path(str(path))
+    assert bmp.SeekIndex.load(index_path).offsets(60) == index.offsets(60)
+    # A stale index is rebuilt
+    with open(str(path), 'ab') as ostream:
+        ostream.write(message(200))
+    assert list(bmp.iter_lines(str(path), start_time=150)) == [message(200)]
@@ -0,0 +1,81 @@
+"""
+Tests for the columnar BMP store
+"""
+
+import gzip
+import os
+import shutil
+
+import numpy as np
+
+import bmp
+import bmp_store
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+def copy_stream(tmp_path, name='slides.bmp'):
+    path = str(tmp_path / name)
+    shutil.copyfile(os.path.join(DATA, name), path)
+    return path
+
+def test_columns_match_stream(tmp_path):
+    path = copy_stream(tmp_path)
+    store = bmp_store.BmpStore.open_for(path)
+    lines = list(bmp.iter_lines(path))
+    assert len(store) == len(lines)
+    assert list(store.iter_lines(range(len(store)))) == lines
+    for index, line in enumerate(lines):
+        raw = bmp.RawMessage(line)
+        assert store.get_timestamps()[index] == raw.timestamp()
+        assert store.get_types()[index] == raw.type().value
+        announced, withdrawn = [], []
+        if raw.type() == bmp.MessageType.ROUTE_MONITORING:
+            announced, withdrawn = bmp.update_prefixes(raw.body())
+        assert store.announced(index) == announced
+        assert store.withdrawn(index) == withdrawn
+
+def test_time_range(tmp_path):
+    store = bmp_store.BmpStore.open_for(copy_stream(tmp_path))
+    timestamps = np.asarray(store.get_timestamps())
+    middle = float(np.median(timestamps))
+    assert list(store.time_range(middle)) == list(
+            np.flatnonzero(timestamps >= middle))
+    assert list(store.time_range(None, middle)) == list(
+            np.flatnonzero(timestamps < middle))
+
+def test_store_is_relocatable(tmp_path):
+    path = copy_stream(tmp_path)
+    store = bmp_store.BmpStore.build(path)
+    lines = list(store.iter_lines(range(len(store))))
+    moved = tmp_path / 'moved'
+    moved.mkdir()
+    shutil.move(path, str(moved))
+    shutil.move(bmp_store.default_path(path), str(moved))
+    store = bmp_store.BmpStore(bmp_store.default_path(str(moved
+        / 'slides.bmp')))
+    assert store.get_source() == str(moved / 'slides.bmp')
+    assert list(store.iter_lines(range(len(store)))) == lines
+
+def test_no_prefixes(tmp_path):
+    path = str(tmp_path / 'peer.bmp')
+    with open(os.path.join(DATA, 'slides.bmp'), 'rb') as istream:
+        lines = [line for line in istream
+                if bmp.line_type(line) != bmp.MessageType.ROUTE_MONITORING]
+    with open(path, 'wb') as ostream:
+        ostream.writelines(lines)
+    store = bmp_store.BmpStore.open_for(path)
+    assert store.get_prefixes() == []
+    assert len(store) == len(lines)
+
+def test_compressed_source(tmp_path):
+    path = copy_stream(tmp_path)
+    with open(path, 'rb') as istream:
+        lines = list(bmp.iter_lines(path))
+        with gzip.open(path + '.gz', 'wb') as ostream:
+            shutil.copyfileobj(istream, ostream)
+    store = bmp_store.BmpStore.open_for(path + '.gz')
+    assert list(store.iter_lines(range(len(store)))) == lines
+    # Lines come back in the order asked for
+    indices = [3, 0, 3, len(lines) - 1]
+    assert list(store.iter_lines(np.asarray(indices))) == [lines[i]
+            for i in indices]
@@ -0,0 +1,105 @@
+"""
+Tests for rank positions and reachability checks
+"""
+
+import ipaddress
+import json
+import math
+
+import check_policies
+import nopticon
+
+def edge(source, target, *ranks):
+    details = {'source' : source, 'target' : target, 'history' : []}
+    for span, rank in enumerate(ranks):
+        if rank is not None:
+            details['rank-%d' % span] = rank
+    return details
+
+# Ties in rank-0, edges without a rank-1, and a flow with no rank-1 at all
+SUMMARY = {'reach-summary' : [
+    {'flow' : '10.0.0.0/24', 'edges' : [
+        edge('a', 'b', 0.9, 0.5),
+        edge('b', 'c', 0.4, None),
+        edge('c', 'd', 0.9, 0.7),
+        edge('d', 'e', 0.1, 0.5),
+        edge('e', 'f', 0.4, None)]},
+    {'flow' : '10.0.1.0/24', 'edges' : [
+        edge('a', 'b', 0.3),
+        edge('b', 'a', 0.6)]},
+    {'flow' : '10.0.2.0/24', 'edges' : [
+        edge('x', 'y', 1.0, 1.0)]},
+]}
+
+def old_rank(summary, flow, edge, span):
+    """Position and percentile as the per-flow sorted(set(...)) computed
+    them, leaving out missing ranks"""
+    ranks = [summary.get_edge_rank(flow, other, span)
+            for other in summary.get_edges(flow)]
+    ranks = sorted(set(rank for rank in ranks if not math.isnan(rank)),
+            reverse=True)
+    rank = summary.get_edge_rank(flow, edge, span)
+    if math.isnan(rank):
+        return -1, -1.0
+    position = ranks.index(rank) + 1
+    return position, position / len(ranks) * 100
+
+def test_rank_table_matches_sorted_set():
+    summary = nopticon.ReachSummary(json.dumps(SUMMARY))
+    for span in range(summary.get_num_spans()):
+        table = summary.get_rank_table(span)
+        for flow, edge in summary.get_flowedges():
+            rank, position, percentile = table.lookup(flow, edge)
+            assert (position, percentile) == old_rank(summary, flow, edge,
+                    span)
+
+def test_rank_table_ties_and_missing_ranks():
+    summary = nopticon.ReachSummary(json.dumps(SUMMARY))
+    flow = ipaddress.ip_network('10.0.0.0/24')
+    table = summary.get_rank_table(0)
+    # 0.9 twice, 0.4 twice and 0.1: three distinct ranks
+    assert table.lookup(flow, ('a', 'b')) == (0.9, 1, 1 / 3 * 100)
+    assert table.lookup(flow, ('c', 'd')) == (0.9, 1, 1 / 3 * 100)
+    assert table.lookup(flow, ('e', 'f'))[1:] == (2, 2 / 3 * 100)
+    assert table.lookup(flow, ('d', 'e'))[1:] == (3, 100.0)
+    # Missing rank-1s are not distinct ranks of their own
+    table = summary.get_rank_table(1)
+    assert table.lookup(flow, ('c', 'd')) == (0.7, 1, 50.0)
+    assert table.lookup(flow, ('a', 'b')) == (0.5, 2, 100.0)
+    rank, position, percentile = table.lookup(flow, ('b', 'c'))
+    assert math.isnan(rank) and (position, percentile) == (-1, -1.0)
+    rank, position, _ = table.lookup(ipaddress.ip_network('10.0.1.0/24'),
+            ('a', 'b'))
+    assert math.isnan(rank) and position == -1
+    assert table.lookup(flow, ('x', 'y')) is None
+
+def test_check_reachabilities():
+    summary = nopticon.ReachSummary(json.dumps(SUMMARY))
+    policies = nopticon.parse_policies(json.dumps({'policies' : [
+        {'type' : 'reachability', 'flow' : '10.0.0.0/24',
+            'source' : 'a', 'target' : 'b'},
+        {'type' : 'reachability', 'flow' : '10.0.0.0/24',
+            'source' : 'b', 'target' : 'c'},
+        {'type' : 'reachability', 'flow' : '10.0.0.0/24',
+            'source' : 'x', 'target' : 'y'},
+        # Matches 10.0.0.0/24 and 10.0.1.0/24; the weaker a->b counts
+        {'type' : 'reachability', 'flow' : '10.0.0.0/23',
+            'source' : 'a', 'target' : 'b'},
+    ]}))
+
+    def reachable(results, threshold=0.5):
+        return [result[0] >= threshold for result in results]
+
+    results = check_policies.check_reachabilities(policies, summary)
+    assert reachable(results) == [True, False, False, False]
+    assert results[0] == (0.9, 1, 1 / 3 * 100, [])
+    assert results[2] == check_policies.NOT_FOUND
+    assert results[3][:3] == (0.3, 2, 100.0)
+
+    # Edges without a rank-1 are not found
+    results = check_policies.check_reachabilities(policies, summary, span=1)
+    assert reachable(results) == [True, False, False, False]
+    assert results[1] == check_policies.NOT_FOUND
+    assert results[3] == check_policies.NOT_FOUND
+    assert check_policies.check_reachability(policies[0], summary, 1) \
+            == results[0]
@@ -0,0 +1,80 @@
+"""
+Tests for transparently compressed file reading and writing
+"""
+
+import os
+import threading
+import pytest
+
+import fileio
+
+LINES = [b'{"n":%d}\n' % (i) for i in range(1000)]
+
+FORMATS = [('gzip', '.gz'), ('bzip2', '.bz2'), ('xz', '.xz')]
+if fileio.zstandard is not None:
+    FORMATS.append(('zstd', '.zst'))
+
+@pytest.mark.parametrize('compression,extension', FORMATS)
+def test_round_trip(tmp_path, compression, extension):
+    path = str(tmp_path / ('stream.bmp' + extension))
+    with fileio.open(path, 'wb') as ostream:
+        ostream.writelines(LINES)
+    assert fileio.detect(path) == compression
+    with fileio.open(path, 'rb') as istream:
+        assert list(istream) == LINES
+    with fileio.open(path, 'r') as istream:
+        assert istream.readline() == '{"n":0}\n'
+
+def test_uncompressed(tmp_path):
+    path = str(tmp_path / 'stream.bmp')
+    with fileio.open(path, 'w') as ostream:
+        ostream.write('{"n":0}\n')
+    assert fileio.detect(path) is None
+    with fileio.open(path, 'rb') as istream:
+        assert istream.read() == b'{"n":0}\n'
+    # Too short to hold any magic bytes
+    with open(path, 'wb') as ostream:
+        ostream.write(b'{')
+    assert fileio.detect(path) is None
+    with fileio.open(path, 'r') as istream:
+        assert istream.read() == '{'
+
+def test_forced_compression(tmp_path):
+    path = str(tmp_path / 'stream.bmp')
+    with fileio.open(path, 'wb', compression='gzip') as ostream:
+        ostream.writelines(LINES)
+    with fileio.open(path, 'rb', compression=None) as istream:
+        assert istream.read(2) == b'\x1f\x8b'
+    with pytest.raises(ValueError):
+        fileio.open(path, 'rb', compression='rar')
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_pipe_is_opened_once(tmp_path, compression):
+    # A FIFO can only be read once, so sniffing must not consume it
+    source = str(tmp_path / 'source')
+    with fileio.open(source, 'wb', compression=compression) as ostream:
+        ostream.writelines(LINES)
+    with open(source, 'rb') as f:
+        data = f.read()
+    fifo = str(tmp_path / 'fifo')
+    os.mkfifo(fifo)
+
+    def write():
+        with open(fifo, 'wb') as ostream:
+            ostream.write(data)
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        with fileio.open(fifo, 'rb') as istream:
+            assert list(istream) == LINES
+    finally:
+        writer.join()
+
+def test_closes_source(tmp_path):
+    path = str(tmp_path / 'stream.gz')
+    with fileio.open(path, 'wb') as ostream:
+        ostream.writelines(LINES)
+    istream = fileio.open(path, 'rb')
+    source = istream._source
+    istream.close()
+    assert source.closed
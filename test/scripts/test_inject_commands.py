@@ -0,0 +1,151 @@
+"""
+Tests for inject_commands
+"""
+
+import asyncio
+import io
+import json
+import os
+import socket
+import sys
+import types
+
+import inject_commands
+import nopticon
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+LINES = [b'{"n":%d}\n' % (i) for i in range(5000)]
+
+def read_stdin(stdin, count, maxsize):
+    """
+    The first count lines put on a queue of maxsize by _read_stdin, and the
+    largest number of lines seen waiting on the queue
+    """
+    async def run():
+        queue = asyncio.Queue(maxsize=maxsize)
+        producer = asyncio.ensure_future(inject_commands._read_stdin(queue))
+        lines = []
+        waiting = 0
+        while len(lines) < count:
+            waiting = max(waiting, queue.qsize())
+            lines.append((await queue.get())[0])
+            # A slow consumer
+            await asyncio.sleep(0)
+        await producer
+        return lines, waiting
+
+    previous = sys.stdin
+    sys.stdin = stdin
+    try:
+        return asyncio.run(run())
+    finally:
+        sys.stdin = previous
+
+def test_regular_file(tmp_path):
+    path = tmp_path / 'stream.bmp'
+    path.write_bytes(b''.join(LINES))
+    with open(str(path), 'r') as stdin:
+        lines, waiting = read_stdin(stdin, len(LINES), 16)
+    assert lines == LINES
+    assert waiting <= 16
+
+def test_pipe():
+    read_fd, write_fd = os.pipe()
+    # Few enough lines to fit in the pipe's buffer
+    with os.fdopen(write_fd, 'wb') as ostream:
+        ostream.writelines(LINES[:1000])
+    with os.fdopen(read_fd, 'r') as stdin:
+        lines, waiting = read_stdin(stdin, 1000, 16)
+    assert lines == LINES[:1000]
+    assert waiting <= 16
+
+def fill_local_addresses(lines):
+    """
+    The peer down messages of ft4_gobgp.bmp have no LocalAddress, so their
+    link cannot be resolved; give them that of the matching peer up
+    """
+    local = {}
+    for line in lines:
+        msg = json.loads(line)
+        peer = (msg['PeerHeader']['PeerBGPID'],
+                msg['PeerHeader']['PeerAddress'])
+        if msg['Header']['Type'] == 3:
+            local[peer] = msg['Body']['LocalAddress']
+        elif msg['Header']['Type'] == 2:
+            line = line.replace(b'"Body":{', b'"Body":{"LocalAddress":"%s",'
+                    % local[peer].encode(), 1)
+        yield line
+
+def test_peerchange_commands(tmp_path, monkeypatch, capsys):
+    input_path = str(tmp_path / 'ft4.bmp')
+    output_path = str(tmp_path / 'ft4_injected.bmp')
+    with open(os.path.join(DATA, 'ft4_gobgp.bmp'), 'rb') as istream:
+        lines = list(fill_local_addresses(list(istream)))
+    with open(input_path, 'wb') as ostream:
+        ostream.writelines(lines)
+    monkeypatch.setattr(sys, 'argv', ['inject_commands.py', '-input',
+        input_path, '-output', output_path, '-rdns',
+        os.path.join(DATA, 'ft4_rdns.json'), '-peerchange', '-end'])
+    inject_commands.main()
+
+    # Messages are copied as they are, with the commands the original
+    # line-by-line injector inserted before the same messages
+    with open(output_path, 'rb') as istream:
+        output = list(istream)
+    commands = []
+    copied = []
+    for line in output:
+        if line.startswith(b'{"Command"'):
+            commands.append(b'%d %s' % (len(copied), line))
+        else:
+            copied.append(line)
+    assert copied == lines
+    with open(os.path.join(DATA, 'ft4_peerchange.commands'), 'rb') as f:
+        assert commands == list(f)
+    with open(os.path.join(DATA, 'ft4_peerchange.log'), 'r') as f:
+        assert capsys.readouterr().out == f.read()
+
+def test_long_lines_skipped(capsys):
+    async def run(data):
+        reader = asyncio.StreamReader(limit=16)
+        reader.feed_data(data)
+        reader.feed_eof()
+        queue = asyncio.Queue()
+        await inject_commands._read_lines(reader, queue)
+        return [queue.get_nowait()[0] for _ in range(queue.qsize())]
+
+    long_line = b'{"n":"%s"}\n' % (b'x' * 100)
+    assert asyncio.run(run(b'{"n":1}\n' + long_line + b'{"n":2}\n{"n":3}')) \
+            == [b'{"n":1}\n', b'{"n":2}\n', b'{"n":3}']
+    assert asyncio.run(run(b'{"n":1}\n' + long_line[:-1])) == [b'{"n":1}\n']
+    assert capsys.readouterr().err.count('Skipping') == 2
+
+def test_listen_writes_end_when_cancelled(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    stdout = types.SimpleNamespace(buffer=io.BytesIO())
+    monkeypatch.setattr(sys, 'stdout', stdout)
+    settings = types.SimpleNamespace(queue=16, exec_cmd=None, report=None,
+            listen='127.0.0.1:%d' % port, end=True)
+
+    async def run():
+        tap = asyncio.ensure_future(inject_commands.tap(settings, None))
+        while True:
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', port)
+                break
+            except ConnectionRefusedError:
+                await asyncio.sleep(0.01)
+        writer.writelines(LINES[:3])
+        await writer.drain()
+        writer.close()
+        while stdout.buffer.getvalue().count(b'\n') < 3:
+            await asyncio.sleep(0.01)
+        tap.cancel()
+        await tap
+
+    asyncio.run(run())
+    assert stdout.buffer.getvalue() == b''.join(LINES[:3]) \
+            + nopticon.Command.print_log().bytes()
@@ -0,0 +1,58 @@
+"""
+Tests for the IPv4 prefix trie
+"""
+
+import ipaddress
+import pytest
+
+from ip_prefix_tree import IpPrefixTree, key_network, prefix_key
+
+def test_prefix_key():
+    assert prefix_key('10.1.0.0/16') == (0x0a010000, 16)
+    assert prefix_key(ipaddress.ip_network('10.1.0.0/16')) == (0x0a010000, 16)
+    assert prefix_key((0x0a0102ff, 24)) == (0x0a010200, 24)
+    assert key_network((0x0a010000, 16)) == ipaddress.ip_network('10.1.0.0/16')
+
+@pytest.mark.parametrize('prefix', ['2001:db8::/32',
+    ipaddress.ip_network('::/0'), (1 << 32, 8), (0, 33), (0, -1)])
+def test_prefix_key_rejects(prefix):
+    with pytest.raises(ValueError):
+        prefix_key(prefix)
+
+@pytest.fixture
+def tree():
+    tree = IpPrefixTree()
+    for prefix in ['10.0.0.0/8', '10.1.0.0/16', '10.1.2.0/24', '11.0.0.0/8']:
+        tree.insert(prefix, prefix)
+    return tree
+
+def test_find(tree):
+    assert len(tree) == 4
+    assert tree.find('10.1.0.0/16') == '10.1.0.0/16'
+    assert tree.find('10.2.0.0/16') is None
+    assert '10.1.2.0/24' in tree
+    assert '10.1.2.0/23' not in tree
+    tree.insert('10.1.0.0/16', 'new')
+    assert len(tree) == 4
+    assert tree.setdefault('10.1.0.0/16', 'other') == 'new'
+    assert tree.setdefault('12.0.0.0/8', 'added') == 'added'
+    assert len(tree) == 5
+
+def test_longest_match(tree):
+    assert tree.longest_match('10.1.2.128/25') == (prefix_key('10.1.2.0/24'),
+            '10.1.2.0/24')
+    assert tree.longest_match('10.1.2.0/24')[1] == '10.1.2.0/24'
+    assert tree.longest_match('10.1.3.0/24')[1] == '10.1.0.0/16'
+    assert tree.longest_match('10.200.0.0/16')[1] == '10.0.0.0/8'
+    assert tree.longest_match('12.0.0.0/24') is None
+    tree.insert('0.0.0.0/0', 'default')
+    assert tree.longest_match('12.0.0.0/24')[1] == 'default'
+
+def test_covering_and_covered_by(tree):
+    assert [value for _, value in tree.covering('10.1.2.0/24')] == [
+            '10.0.0.0/8', '10.1.0.0/16', '10.1.2.0/24']
+    assert sorted(value for _, value in tree.covered_by('10.0.0.0/8')) == [
+            '10.0.0.0/8', '10.1.0.0/16', '10.1.2.0/24']
+    assert tree.covered_by('12.0.0.0/8') == []
+    assert [value for _, value in tree.items()] == ['10.0.0.0/8',
+            '10.1.0.0/16', '10.1.2.0/24', '11.0.0.0/8']
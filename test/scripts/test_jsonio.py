@@ -0,0 +1,27 @@
+"""
+Tests for the pluggable JSON decoder
+"""
+
+import pytest
+
+import jsonio
+
+@pytest.fixture(params=list(jsonio.BACKENDS))
+def backend(request):
+    previous = jsonio.BACKEND
+    jsonio.use(request.param)
+    yield request.param
+    jsonio.use(previous)
+
+def test_backends_agree(backend):
+    document = '{"flow": "10.0.0.0/24", "history": [1533679063469773], ' \
+            + '"rank-0": 0.5, "name": "r\\u00e9", "ok": true, "none": null}'
+    expected = {'flow' : '10.0.0.0/24', 'history' : [1533679063469773],
+            'rank-0' : 0.5, 'name' : 'ré', 'ok' : True, 'none' : None}
+    assert jsonio.loads(document) == expected
+    assert jsonio.loads(document.encode('utf-8')) == expected
+    assert jsonio.BACKEND == backend
+
+def test_use_unknown_backend():
+    with pytest.raises(ValueError):
+        jsonio.use('nope')
@@ -0,0 +1,71 @@
+"""
+Tests for policies and PolicySet
+"""
+
+import ipaddress
+import json
+
+import nopticon
+
+POLICIES = {'policies' : [
+    {'type' : 'reachability', 'flow' : '10.0.0.0/24',
+        'source' : 'a', 'target' : 'c'},
+    {'type' : 'path-preference', 'flow' : '10.0.0.0/24',
+        'paths' : [['a', 'b', 'c'], ['a', 'd', 'c']]},
+    {'type' : 'path-preference', 'flow' : '10.0.0.0/24',
+        'paths' : [['a', 'd', 'c'], ['a', 'b', 'c']]},
+    {'type' : 'reachability', 'flow' : '10.0.1.0/24',
+        'source' : 'b', 'target' : 'c'},
+]}
+
+FLOW0 = ipaddress.ip_network('10.0.0.0/24')
+FLOW1 = ipaddress.ip_network('10.0.1.0/24')
+
+def coerced():
+    policies = nopticon.parse_policies(json.dumps(POLICIES))
+    for idx, policy in enumerate(policies):
+        if policy.isType(nopticon.PolicyType.PATH_PREFERENCE):
+            policies[idx] = policy.toReachabilityPolicy()
+    return policies
+
+def test_policy_equality():
+    policies = coerced()
+    assert policies[0] == policies[1] == policies[2]
+    assert hash(policies[0]) == hash(policies[1])
+    assert policies[0] != policies[3]
+    assert nopticon.ReachabilityPolicy.from_edge(FLOW1, ('b', 'c')) \
+            == policies[3]
+
+def test_policy_set_counts_repeats():
+    policies = coerced()
+    policy_set = nopticon.PolicySet(policies)
+    assert len(policy_set) == 2
+    assert policy_set.total() == len(policies) == 4
+    assert policy_set.count(policies[0]) == 3
+    assert policy_set.count(policies[3]) == 1
+    assert list(policy_set) == [policies[0], policies[3]]
+
+def test_policy_set_indexes():
+    policy_set = nopticon.parse_policies(json.dumps(POLICIES), as_set=True)
+    # Path preferences are equal whatever order their paths are in
+    assert len(policy_set) == 3
+    assert policy_set.total() == 4
+    assert list(policy_set.get_flows()) == [FLOW0, FLOW1]
+    assert len(policy_set.get_flow_policies(FLOW0)) == 2
+    assert policy_set.get_source_policies(FLOW1, 'b') == [
+            nopticon.ReachabilityPolicy.from_edge(FLOW1, ('b', 'c'))]
+    assert policy_set.get_target_policies(FLOW1, 'a') == []
+    assert nopticon.ReachabilityPolicy.from_edge(FLOW0, ('a', 'c')) \
+            in policy_set
+
+def test_interned_flows_are_released():
+    policies = coerced()
+    assert policies[0].flow() is policies[1].flow()
+    assert nopticon.ReachabilityPolicy.from_edge(FLOW0, ('x', 'y')).flow() \
+            is policies[0].flow()
+    flow = '10.9.9.0/24'
+    policy = nopticon.ReachabilityPolicy({'flow' : flow, 'source' : 'a',
+        'target' : 'b'})
+    assert flow in nopticon._interned_flows
+    del policy
+    assert flow not in nopticon._interned_flows
@@ -0,0 +1,69 @@
+"""
+Tests for reverse DNS lookups
+"""
+
+import ipaddress
+import json
+import pytest
+
+import nopticon
+
+def test_addresses_and_subnets():
+    rdns = nopticon.Rdns()
+    rdns.add('10.0.0.1', 'r1')
+    rdns.add(ipaddress.ip_address('10.0.0.2'), 'r2')
+    rdns.add('10.1.0.0/16', 'outer')
+    rdns.add('10.1.2.0/24', 'inner')
+    rdns.add('10.1.2.128/25', 'innermost')
+    rdns.add('2001:db8::/32', 'v6')
+    assert rdns['10.0.0.1'] == 'r1'
+    assert rdns[nopticon.address_key('10.0.0.2')] == 'r2'
+    assert rdns['10.1.0.1'] == 'outer'
+    assert rdns['10.1.2.1'] == 'inner'
+    assert rdns['10.1.2.200'] == 'innermost'
+    assert rdns['10.1.3.0'] == 'outer'
+    assert rdns['10.1.255.255'] == 'outer'
+    assert rdns['2001:db8::1'] == 'v6'
+    assert '10.2.0.0' not in rdns
+    assert '10.1.2.255' in rdns
+    with pytest.raises(KeyError):
+        rdns['10.0.0.3']
+    assert len(rdns) == 6
+
+def test_ranges_rebuilt_after_add():
+    rdns = nopticon.Rdns()
+    rdns.add('10.1.0.0/16', 'outer')
+    resolve = rdns.resolver()
+    assert resolve(nopticon.address_key('10.1.2.1')) == 'outer'
+    rdns.add('10.1.2.0/24', 'inner')
+    assert resolve(nopticon.address_key('10.1.2.1')) == 'inner'
+    assert resolve(nopticon.address_key('10.1.3.1')) == 'outer'
+    assert resolve(nopticon.address_key('10.2.0.1')) is None
+
+def test_ranges_built_once(monkeypatch):
+    rdns = nopticon.Rdns()
+    builds = []
+    build = rdns._build_ranges
+    monkeypatch.setattr(rdns, '_build_ranges', lambda: builds.append(1)
+            or build())
+    for i in range(100):
+        rdns.add('10.%d.0.0/16' % (i), 'r%d' % (i))
+    assert builds == []
+    assert rdns['10.42.1.1'] == 'r42'
+    assert rdns['10.7.1.1'] == 'r7'
+    assert builds == [1]
+
+def test_parse_rdns():
+    rdns = nopticon.parse_rdns(json.dumps({'routers' : [
+        {'name' : 'a', 'ifaces' : ['10.0.0.1', '10.0.1.0/24']},
+        {'name' : 'b', 'ifaces' : ['10.0.0.2']}]}))
+    assert rdns['10.0.1.7'] == 'a'
+    assert rdns['10.0.0.2'] == 'b'
+
+def test_parse_address_key():
+    address, key = nopticon.parse_address_key('10.0.0.1')
+    assert address == ipaddress.ip_address('10.0.0.1')
+    assert key == nopticon.address_key('10.0.0.1') == int(address)
+    assert nopticon.parse_address('10.0.0.1') is address
+    assert nopticon.address_key('::1') > nopticon.address_key(
+            '255.255.255.255')
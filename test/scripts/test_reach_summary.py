@@ -0,0 +1,158 @@
+"""
+Tests for the columnar ReachSummary
+"""
+
+import ipaddress
+import json
+import numpy as np
+import pytest
+
+import nopticon
+
+SUMMARY = {'reach-summary' : [
+    {'flow' : '10.0.0.0/24', 'edges' : [
+        {'source' : 'a', 'target' : 'b', 'can-be-direct' : True,
+            'rank-0' : 0.123456789012, 'rank-1' : 0.5,
+            'history' : [1, 2, 3]},
+        {'source' : 'b', 'target' : 'c', 'can-be-direct' : False,
+            'rank-0' : 0.75, 'history' : [4]},
+    ]},
+    {'flow' : '10.0.1.0/24', 'edges' : [
+        {'source' : 'c', 'target' : 'a', 'can-be-direct' : True,
+            'rank-0' : 1.0, 'history' : []},
+    ]},
+]}
+
+FLOW0 = ipaddress.ip_network('10.0.0.0/24')
+FLOW1 = ipaddress.ip_network('10.0.1.0/24')
+
+@pytest.fixture
+def summary():
+    return nopticon.ReachSummary(json.dumps(SUMMARY), sigfigs=4)
+
+def test_flows_and_edges(summary):
+    assert list(summary.get_flows()) == [FLOW0, FLOW1]
+    assert list(summary.get_edges(FLOW0)) == [('a', 'b'), ('b', 'c')]
+    assert ('c', 'a') in summary.get_edges(FLOW1)
+    assert ('a', 'b') not in summary.get_edges(FLOW1)
+    assert len(summary.get_edges(FLOW0)) == 2
+    assert summary.get_edges(ipaddress.ip_network('10.9.0.0/24')) == {}
+
+def test_ranks_rounded_at_load(summary):
+    assert summary.get_edge_rank(FLOW0, ('a', 'b')) == 0.1235
+    assert summary.get_edge_rank(FLOW0, ('a', 'b'), span=1) == 0.5
+    assert summary.get_edge_rank(FLOW0, ('x', 'y')) is None
+    assert summary.get_num_spans() == 2
+
+def test_edge_details(summary):
+    details = summary.get_edges(FLOW0)[('a', 'b')]
+    assert dict(details) == {'source' : 'a', 'target' : 'b',
+            'can-be-direct' : True, 'rank-0' : 0.1235, 'rank-1' : 0.5,
+            'history' : [1, 2, 3]}
+    # Missing ranks are left out
+    assert 'rank-1' not in summary.get_edges(FLOW0)[('b', 'c')]
+    with pytest.raises(KeyError):
+        summary.get_edges(FLOW0)[('c', 'a')]
+
+def test_edge_details_are_read_only_and_reused(summary):
+    details = summary.get_edges(FLOW0)[('a', 'b')]
+    with pytest.raises(TypeError):
+        details['rank-0'] = 0.0
+    assert summary.get_edges(FLOW0)[('a', 'b')] is details
+
+def test_flowedges(summary):
+    assert summary.get_flowedges() == [(FLOW0, ('a', 'b')),
+            (FLOW0, ('b', 'c')), (FLOW1, ('c', 'a'))]
+    assert summary.get_edge_history(FLOW0, ('b', 'c')) == [4]
+    eid = summary.get_edge_id(FLOW0, ('a', 'b'))
+    assert summary.get_history_by_id(eid) == [1, 2, 3]
+
+def test_iter_summaries_filters(tmp_path):
+    path = tmp_path / 'summaries.json'
+    path.write_text(json.dumps(SUMMARY) + '\n\n' + json.dumps(SUMMARY) + '\n')
+    assert list(nopticon.iter_summaries(str(path))) == [SUMMARY, SUMMARY]
+
+    summaries = list(nopticon.iter_summaries(str(path),
+        fields=['reach-summary', 'rank-0'], flows=['10.0.0.0/24'],
+        min_rank=0.5))
+    assert summaries == [{'reach-summary' : [{'flow' : '10.0.0.0/24',
+        'edges' : [{'source' : 'b', 'target' : 'c', 'rank-0' : 0.75}]}]}] * 2
+
+def test_summary_filter_mixed_keys():
+    summary = json.loads(json.dumps(SUMMARY))
+    summary['reach-summary'][1]['edges'][0]['extra'] = [1]
+    apply = nopticon.summary_filter(fields=['reach-summary', 'history'])
+    edges = [edge for flow in apply(summary)['reach-summary']
+            for edge in flow['edges']]
+    assert [sorted(edge) for edge in edges] == [
+            ['history', 'source', 'target']] * 3
+    assert nopticon.summary_filter() is None
+
+def test_repeated_flows_and_edges():
+    summary = json.loads(json.dumps(SUMMARY))
+    flows = summary['reach-summary']
+    later = {'flow' : '10.0.0.0/24', 'edges' : [
+        {'source' : 'a', 'target' : 'b', 'rank-0' : 0.25},
+        {'source' : 'a', 'target' : 'b', 'rank-0' : 0.5}]}
+    flows.append(later)
+    summary = nopticon.ReachSummary(json.dumps(summary))
+    # The first position and the last details are kept
+    assert list(summary.get_flows()) == [FLOW0, FLOW1]
+    assert summary.get_flowedges() == [(FLOW0, ('a', 'b')),
+            (FLOW1, ('c', 'a'))]
+    assert summary.get_edge_rank(FLOW0, ('a', 'b')) == 0.5
+    assert [summary.get_edge_id(flow, edge)
+            for flow, edge in summary.get_flowedges()] == [0, 1]
+
+def test_ipv6_flows_rejected():
+    summary = {'reach-summary' : [{'flow' : '2001:db8::/32', 'edges' : []}]}
+    with pytest.raises(ValueError):
+        nopticon.ReachSummary(json.dumps(summary))
+
+def spans_summary(*flows):
+    return nopticon.ReachSummary(json.dumps({'reach-summary' : [
+        {'flow' : flow, 'edges' : [dict({'source' : source,
+            'target' : target}, **{'rank-%d' % span : rank
+                for span, rank in enumerate(ranks) if rank is not None})
+            for source, target, ranks in edges]}
+        for flow, edges in flows]}))
+
+# Flow 0 changes as much into span 1 as out of it (a tie); flow 1 settles
+# by span 2, and its b->a edge has no rank-2
+SPANS = spans_summary(
+    ('10.0.0.0/24', [('a', 'b', [0.25, 0.75, 0.75]),
+        ('b', 'c', [0.75, 0.75, 0.25])]),
+    ('10.0.1.0/24', [('a', 'b', [0.25, 0.75, 0.75]),
+        ('b', 'a', [0.5, 0.5, None])]))
+
+def test_rank_matrix_and_masks():
+    ranks = SPANS.get_rank_matrix()
+    assert ranks.shape == (4, 3)
+    assert ranks[1].tolist() == [0.75, 0.75, 0.25]
+    assert np.isnan(ranks[3, 2])
+    with pytest.raises(ValueError):
+        ranks[0, 0] = 1.0
+    assert SPANS.get_threshold_masks(0.5).tolist() == [
+            [False, True, True], [True, True, False],
+            [False, True, True], [True, True, False]]
+
+def test_rank_deltas():
+    deltas = SPANS.get_rank_deltas(0, 2)
+    assert deltas[:3].tolist() == [0.5, -0.5, 0.5]
+    assert np.isnan(deltas[3])
+    assert SPANS.get_rank_deltas(1, 1).tolist()[:3] == [0.0] * 3
+
+def test_most_stable_spans():
+    # Missing ranks count as no change
+    assert SPANS.get_span_instability().tolist() == [
+            [0.25, 0.25, 0.25], [0.25, 0.125, 0.0]]
+    # Ties go to the shortest span
+    assert SPANS.get_most_stable_spans() == {FLOW0 : 0, FLOW1 : 2}
+
+def test_most_stable_spans_single_span():
+    summary = spans_summary(
+        ('10.0.0.0/24', [('a', 'b', [0.25]), ('b', 'c', [1.0])]),
+        ('10.0.1.0/24', []))
+    assert summary.get_num_spans() == 1
+    assert summary.get_span_instability().tolist() == [[0.0], [0.0]]
+    assert summary.get_most_stable_spans() == {FLOW0 : 0, FLOW1 : 0}
@@ -0,0 +1,118 @@
+"""
+Tests for diffing consecutive link summaries and rendering their graphs
+"""
+
+import gc
+import io
+import json
+import os
+
+import reconstruct_forwarding
+
+def snapshot(**flows):
+    return {'flows' : [{'flow' : flow, 'links' : [{'source' : source,
+        'target' : targets} for source, targets in links.items()]}
+        for flow, links in flows.items()]}
+
+def test_forwarding_delta():
+    delta = reconstruct_forwarding.ForwardingDelta()
+    changes = delta.update(snapshot(f1={'a' : ['b'], 'b' : ['c']}))
+    assert changes == [('f1', [['a', 'b'], ['b', 'c']], [],
+        {'a' : ['b'], 'b' : ['c']})]
+    # Unchanged flows, and links listed in another order, are not changes
+    assert delta.update(snapshot(f1={'b' : ['c'], 'a' : ['b']})) == []
+    changes = delta.update(snapshot(f1={'a' : ['c'], 'b' : ['c']},
+        f2={'x' : ['y']}))
+    assert [change[:3] for change in changes] == [
+            ('f1', [['a', 'c']], [['a', 'b']]), ('f2', [['x', 'y']], [])]
+    # Missing flows lose all their links
+    changes = delta.update(snapshot(f2={'x' : ['y']}))
+    assert changes == [('f1', [], [['a', 'c'], ['b', 'c']], {})]
+
+def test_make_deltas_restores_gc():
+    summaries = [snapshot(f1={'a' : ['b']}), snapshot(f1={'a' : ['b']}),
+            snapshot(f1={'a' : ['c']})]
+    ostream = io.StringIO()
+    assert gc.isenabled()
+    reconstruct_forwarding.make_deltas(None, iter(summaries), ostream)
+    assert gc.isenabled()
+    lines = [json.loads(line) for line in ostream.getvalue().splitlines()]
+    assert [line['snapshot'] for line in lines] == [0, 2]
+    assert lines[1]['flows'] == [{'flow' : 'f1', 'added' : [['a', 'c']],
+        'removed' : [['a', 'b']]}]
+
+class FakeAGraph:
+    """Stands in for pygraphviz.AGraph, drawing a graph's edges as JSON"""
+    drawn = []
+
+    def __init__(self, strict, directed):
+        self._edges = []
+
+    def add_edge(self, source, target):
+        self._edges.append([source, target])
+
+    def draw(self, path, prog):
+        with open(path, 'w') as f:
+            json.dump(self._edges, f)
+        FakeAGraph.drawn.append(self._edges)
+
+def fake_pygraphviz(monkeypatch):
+    FakeAGraph.drawn = []
+    monkeypatch.setattr(reconstruct_forwarding, 'pygraphviz',
+            type('pygraphviz', (), {'AGraph' : FakeAGraph}))
+
+def test_graph_key():
+    links = {'a' : ['c', 'b'], 'b' : ['c']}
+    # The key does not depend on the order of links or targets, and does
+    # not change between runs (it names cached images)
+    assert reconstruct_forwarding.graph_key(links) \
+            == reconstruct_forwarding.graph_key({'b' : ['c'],
+                'a' : ['b', 'c']}) \
+            == '255e0d63b204d87d7c09fa7a01a694e502309994'
+    assert reconstruct_forwarding.graph_key(links) \
+            != reconstruct_forwarding.graph_key({'a' : ['b'], 'b' : ['c']})
+
+def test_renderer_reuses_cached_graphs(tmp_path, monkeypatch):
+    fake_pygraphviz(monkeypatch)
+    cache_path = str(tmp_path / 'cache')
+    renderer = reconstruct_forwarding.GraphRenderer(cache_path)
+    links = {'a' : ['b', 'c']}
+    renderer.add(links, str(tmp_path / 'f1.png'))
+    renderer.add({'a' : ['c', 'b']}, str(tmp_path / 'f2.png'))
+    renderer.add({'x' : ['y']}, str(tmp_path / 'f3.png'))
+    assert FakeAGraph.drawn == []
+    renderer.close()
+    assert FakeAGraph.drawn == [[['a', 'b'], ['a', 'c']], [['x', 'y']]]
+    assert (renderer.get_rendered(), renderer.get_reused()) == (2, 1)
+    assert os.path.samefile(str(tmp_path / 'f1.png'),
+            str(tmp_path / 'f2.png'))
+    with open(str(tmp_path / 'f3.png'), 'r') as f:
+        assert json.load(f) == [['x', 'y']]
+    # No partial images are left in the cache
+    assert sorted(os.listdir(cache_path)) == sorted('%s.png'
+            % reconstruct_forwarding.graph_key(links) for links in
+            [links, {'x' : ['y']}])
+
+    # A later run draws only graphs that are not cached yet, replacing
+    # existing graphs
+    renderer = reconstruct_forwarding.GraphRenderer(cache_path)
+    renderer.add(links, str(tmp_path / 'f1.png'))
+    renderer.add({'x' : ['z']}, str(tmp_path / 'f4.png'))
+    renderer.close()
+    assert FakeAGraph.drawn[2:] == [[['x', 'z']]]
+    assert (renderer.get_rendered(), renderer.get_reused()) == (1, 1)
+    assert os.path.samefile(str(tmp_path / 'f1.png'),
+            str(tmp_path / 'f2.png'))
+
+def test_renderer_batches(tmp_path, monkeypatch):
+    fake_pygraphviz(monkeypatch)
+    monkeypatch.setattr(reconstruct_forwarding, 'BATCH_GRAPHS', 2)
+    renderer = reconstruct_forwarding.GraphRenderer(str(tmp_path / 'cache'))
+    for i in range(5):
+        renderer.add({'a' : ['r%d' % i]}, str(tmp_path / ('%d.png' % i)))
+    # Full batches are drawn as graphs are added
+    assert len(FakeAGraph.drawn) == 4
+    renderer.close()
+    assert len(FakeAGraph.drawn) == 5
+    assert all(os.path.exists(str(tmp_path / ('%d.png' % i)))
+            for i in range(5))
@@ -0,0 +1,70 @@
+"""
+Tests for the replay driver, against a fake gobgp-analysis
+"""
+
+import argparse
+import os
+import sys
+import time
+import types
+
+import nopticon
+import replay
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+# Answers every print log command but the first two, as gobgp-analysis does
+# while its summary is still empty
+FAKE_ANALYSIS = '''
+import sys
+probes = 0
+for line in sys.stdin.buffer:
+    if line == %r:
+        probes += 1
+        if probes > 2:
+            sys.stdout.write('{"probe": %%d}\\n' %% probes)
+            sys.stdout.flush()
+''' % (nopticon.Command.print_log().bytes())
+
+def settings(**kwargs):
+    values = {'input_path' : os.path.join(DATA, 'ft4_gobgp.bmp'),
+            'command' : [sys.executable, '-c', FAKE_ANALYSIS],
+            'loop' : 1, 'speed' : None, 'rate' : None, 'start_time' : None,
+            'end_time' : None, 'refresh' : None, 'probe' : 100,
+            'probe_timeout' : 0.05, 'rss_interval' : 0.5}
+    values.update(kwargs)
+    return argparse.Namespace(**values)
+
+def test_probes_are_matched():
+    report = replay.Replay(settings(rate=4000)).run()
+    assert report['returncode'] == 0
+    assert report['messages'] == 1093
+    sent = report['commands']
+    latency = report['summary-latency']
+    answered = latency['count'] if latency is not None else 0
+    # Probes are not sent while one is outstanding, plus the final probe
+    assert sent == 10 - report['skipped-probes'] + 1
+    # Every probe is answered or lost, and answers that arrive after their
+    # probe was lost are not matched to a later probe
+    assert answered + report['lost-probes'] == sent
+    assert report['lost-probes'] >= 2
+    assert answered + report['late-answers'] == sent - 2
+    assert report['output-lines'] == sent - 2
+    assert 0 < report['probe-seconds'] < report['seconds']
+
+def test_probes_disabled():
+    report = replay.Replay(settings(probe=0)).run()
+    # Only the final probe, which times out
+    assert report['commands'] == 1
+    assert report['lost-probes'] == 1
+    assert report['probe-seconds'] == 0
+
+def test_no_send_time(monkeypatch):
+    # A clock that does not advance, as for a capture sent faster than the
+    # clock's resolution
+    monkeypatch.setattr(replay, 'time', types.SimpleNamespace(
+        perf_counter=lambda: 0.0, sleep=time.sleep))
+    report = replay.Replay(settings(probe=0)).run()
+    assert report['seconds'] == 0
+    assert report['messages-per-second'] is None
+    assert report['megabytes-per-second'] is None
@@ -0,0 +1,54 @@
+"""
+Tests for the streaming sketches
+"""
+
+import pickle
+
+import sketches
+
+def test_hyperloglog_count_and_merge():
+    left, right = sketches.HyperLogLog(), sketches.HyperLogLog()
+    for i in range(5000):
+        left.add('key-%d' % i)
+        right.add('key-%d' % (i + 2500))
+    assert abs(left.count() - 5000) < 250
+    left.merge(right)
+    assert abs(left.count() - 7500) < 375
+
+def test_count_min_never_undercounts():
+    sketch = sketches.CountMinSketch(width=64, depth=4)
+    counts = {'key-%d' % i : i % 7 + 1 for i in range(200)}
+    for key, count in counts.items():
+        assert sketch.add(key, count) >= count
+    for key, count in counts.items():
+        assert sketch.estimate(key) >= count
+    assert sketch.estimate('key-3') <= sum(counts.values())
+
+def test_count_min_merge_adds_tables():
+    left = sketches.CountMinSketch(width=1024, depth=3)
+    right = sketches.CountMinSketch(width=1024, depth=3)
+    left.add('a', 3)
+    right.add('a', 4)
+    right.add('b', 2)
+    left.merge(right)
+    assert left.estimate('a') == 7
+    assert left.estimate('b') == 2
+    # Counters are still updated through the rows after a merge
+    assert left.add('b') == 3
+
+def test_count_min_pickles():
+    sketch = sketches.CountMinSketch(width=1024, depth=3)
+    sketch.add('a', 5)
+    copy = pickle.loads(pickle.dumps(sketch))
+    assert copy.estimate('a') == 5
+    assert copy.add('a') == 6
+    assert sketch.estimate('a') == 5
+
+def test_top_k_merge():
+    left, right = sketches.TopK(2), sketches.TopK(2)
+    for key, count in (('a', 5), ('b', 1), ('c', 3)):
+        left.add(key, count)
+    for key, count in (('b', 9), ('d', 2)):
+        right.add(key, count)
+    left.merge(right)
+    assert left.items() == [('b', 10), ('a', 5)]
@@ -0,0 +1,74 @@
+"""
+Tests for the binary reach summary cache
+"""
+
+import json
+import os
+
+import nopticon
+
+from test_reach_summary import FLOW0, FLOW1, SUMMARY
+
+def write_summary(tmp_path):
+    path = tmp_path / 'summary.json'
+    path.write_text(json.dumps(SUMMARY))
+    return str(path)
+
+def same_summary(left, right):
+    assert list(left.get_flows()) == list(right.get_flows())
+    for flow in left.get_flows():
+        assert ({edge : dict(details)
+                for edge, details in left.get_edges(flow).items()}
+                == {edge : dict(details)
+                for edge, details in right.get_edges(flow).items()})
+    assert left.get_num_spans() == right.get_num_spans()
+
+def test_round_trip(tmp_path):
+    summary = nopticon.ReachSummary.load(write_summary(tmp_path), 4)
+    cache_path = str(tmp_path / 'summary.cache')
+    summary.to_cache(cache_path, 'hash')
+    cached = nopticon.ReachSummary.from_cache(cache_path)
+    same_summary(summary, cached)
+    assert cached.get_edge_rank(FLOW0, ('a', 'b')) == 0.1235
+    assert cached.get_edge_history(FLOW1, ('c', 'a')) == []
+
+def test_load_without_cache_dir_writes_nothing(tmp_path):
+    nopticon.ReachSummary.load(write_summary(tmp_path))
+    assert os.listdir(str(tmp_path)) == ['summary.json']
+
+def test_load_reuses_cache(tmp_path, monkeypatch):
+    summary_path = write_summary(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    first = nopticon.ReachSummary.load(summary_path, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # An unchanged file is neither reparsed nor rehashed
+    def fail(*args):
+        raise AssertionError('summary was reread')
+    with monkeypatch.context() as patch:
+        patch.setattr(nopticon, '_file_hash', fail)
+        patch.setattr(nopticon, '_load_summary', fail)
+        same_summary(first, nopticon.ReachSummary.load(summary_path,
+            cache_dir=cache_dir))
+
+    # A touched file with the same contents is rehashed, but not reparsed
+    stat = os.stat(summary_path)
+    os.utime(summary_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    with monkeypatch.context() as patch:
+        patch.setattr(nopticon, '_load_summary', fail)
+        nopticon.ReachSummary.load(summary_path, cache_dir=cache_dir)
+
+    # Another sigfigs gets its own cache
+    nopticon.ReachSummary.load(summary_path, 2, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_load_rebuilds_stale_cache(tmp_path):
+    summary_path = write_summary(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    nopticon.ReachSummary.load(summary_path, cache_dir=cache_dir)
+    changed = json.loads(json.dumps(SUMMARY))
+    changed['reach-summary'][0]['edges'][0]['rank-0'] = 0.25
+    with open(summary_path, 'w') as sf:
+        sf.write(json.dumps(changed))
+    summary = nopticon.ReachSummary.load(summary_path, cache_dir=cache_dir)
+    assert summary.get_edge_rank(FLOW0, ('a', 'b')) == 0.25
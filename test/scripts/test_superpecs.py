@@ -0,0 +1,62 @@
+"""
+Tests for grouping flows into super PECs
+"""
+
+import copy
+import ipaddress
+import json
+
+import nopticon
+import superpecs
+
+def edge(source, target, rank, history):
+    return {'source' : source, 'target' : target, 'can-be-direct' : True,
+            'rank-0' : rank, 'history' : history}
+
+def flow(prefix, edges):
+    return {'flow' : prefix, 'edges' : edges}
+
+BASE = [edge('a', 'b', 0.9, [1, 2]), edge('b', 'c', 0.2, [3])]
+
+def summary(*flows):
+    return nopticon.ReachSummary(json.dumps({'reach-summary' : list(flows)}))
+
+def prefixes(specs):
+    return [[str(prefix) for prefix in spec] for spec in specs]
+
+def test_exact_grouping_by_default():
+    other_rank = copy.deepcopy(BASE)
+    other_rank[1]['rank-0'] = 0.3
+    moved_history = copy.deepcopy(BASE)
+    moved_history[0]['history'] = [1]
+    moved_history[1]['history'] = [2, 3]
+    specs = superpecs.compute_specs(summary(
+        flow('10.0.0.0/24', BASE),
+        flow('10.0.1.0/24', BASE[::-1]),
+        flow('10.0.2.0/24', other_rank),
+        flow('10.0.3.0/24', moved_history)))
+    assert prefixes(specs) == [['10.0.0.0/24', '10.0.1.0/24'],
+            ['10.0.2.0/24'], ['10.0.3.0/24']]
+
+def test_threshold_and_quantize():
+    other_rank = copy.deepcopy(BASE)
+    other_rank[1]['rank-0'] = 0.1
+    reach = summary(flow('10.0.0.0/24', BASE),
+            flow('10.0.1.0/24', other_rank),
+            flow('10.0.2.0/24', BASE[:1]))
+    # Above 0.5, all three flows have just a->b
+    assert prefixes(superpecs.compute_specs(reach, 0.5)) == [[
+        '10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/24']]
+    assert prefixes(superpecs.compute_specs(reach, quantize=2)) == [[
+        '10.0.0.0/24', '10.0.1.0/24'], ['10.0.2.0/24']]
+    assert prefixes(superpecs.compute_specs(reach, quantize=10)) == [
+            ['10.0.0.0/24'], ['10.0.1.0/24'], ['10.0.2.0/24']]
+
+def test_signatures_without_histories():
+    edges = [{key : value for key, value in details.items()
+        if key != 'history'} for details in BASE]
+    reach = summary(flow('10.0.0.0/24', edges), flow('10.0.1.0/24', []))
+    signatures = reach.get_flow_signatures(exact=True)
+    assert len(signatures) == 2 and signatures[1] == b''
+    assert list(reach.get_flows()) == [ipaddress.ip_network('10.0.0.0/24'),
+            ipaddress.ip_network('10.0.1.0/24')]